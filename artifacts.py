@@ -0,0 +1,127 @@
+import gzip
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from metrics import stage_timer
+from structured_log import get_logger
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+ARTIFACTS_ENABLED = os.getenv("ARTIFACTS_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+ARTIFACTS_CAPTURE_RAW = os.getenv("ARTIFACTS_CAPTURE_RAW", "1").strip().lower() in {"1", "true", "yes", "on"}
+ARTIFACTS_DIR = os.getenv("ARTIFACTS_DIR", os.path.join(BASE_DIR, "datas", "runs"))
+ARTIFACTS_RETENTION_RUNS = int(os.getenv("ARTIFACTS_RETENTION_RUNS", "50"))
+ARTIFACTS_RETENTION_SEC = int(os.getenv("ARTIFACTS_RETENTION_SEC", str(7 * 24 * 3600)))
+
+_queue: "queue.Queue[tuple]" = queue.Queue()
+_writer: threading.Thread | None = None
+_writer_lock = threading.Lock()
+_stats = {"queued": 0, "written": 0, "bytes": 0, "errors": 0, "pruned_runs": 0}
+
+
+_log = get_logger("artifacts.py")
+
+
+def new_run_id(playlist_id: str) -> str:
+    return f"{datetime.now().strftime('%Y%m%d-%H%M%S')}_{playlist_id}_{uuid.uuid4().hex[:8]}"
+
+
+def run_dir(run_id: str) -> str:
+    return os.path.join(ARTIFACTS_DIR, run_id)
+
+
+def _write_ndjson(run_id: str, name: str, records: list[dict]) -> None:
+    directory = run_dir(run_id)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{name}.ndjson.gz")
+    tmp_path = path + ".tmp"
+    with stage_timer("artifact_write", len(records)), gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=5) as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+            f.write("\n")
+    os.replace(tmp_path, path)
+    _stats["written"] += 1
+    _stats["bytes"] += os.path.getsize(path)
+
+
+def _prune() -> None:
+    if not os.path.isdir(ARTIFACTS_DIR):
+        return
+
+    runs = sorted(
+        (entry for entry in os.scandir(ARTIFACTS_DIR) if entry.is_dir()),
+        key=lambda entry: entry.stat().st_mtime,
+        reverse=True,
+    )
+    now = time.time()
+    for position, entry in enumerate(runs):
+        too_many = ARTIFACTS_RETENTION_RUNS > 0 and position >= ARTIFACTS_RETENTION_RUNS
+        too_old = ARTIFACTS_RETENTION_SEC > 0 and now - entry.stat().st_mtime > ARTIFACTS_RETENTION_SEC
+        if too_many or too_old:
+            shutil.rmtree(entry.path, ignore_errors=True)
+            _stats["pruned_runs"] += 1
+
+
+def _writer_loop() -> None:
+    while True:
+        task = _queue.get()
+        try:
+            if task[0] == "write":
+                _, run_id, name, records = task
+                _write_ndjson(run_id, name, records)
+            elif task[0] == "prune":
+                _prune()
+        except Exception as exc:
+            _stats["errors"] += 1
+            _log(f"Artifact yazılamadı: {exc}", level="error")
+        finally:
+            _queue.task_done()
+
+
+def _ensure_writer() -> None:
+    global _writer
+    with _writer_lock:
+        if _writer is None or not _writer.is_alive():
+            _writer = threading.Thread(target=_writer_loop, name="artifact-writer", daemon=True)
+            _writer.start()
+
+
+# Yazım arka plandaki tek thread'de yapılır; çağıran thread dosya I/O'su beklemez.
+# Kayıtlar kuyruğa verildikten sonra değiştirilmemelidir.
+def write_artifact(run_id: str, name: str, records: list[dict]) -> None:
+    if not ARTIFACTS_ENABLED:
+        return
+    _ensure_writer()
+    _stats["queued"] += 1
+    _queue.put(("write", run_id, name, records))
+
+
+def prune_artifacts() -> None:
+    if not ARTIFACTS_ENABLED:
+        return
+    _ensure_writer()
+    _queue.put(("prune",))
+
+
+def flush_artifacts() -> None:
+    if _writer is not None:
+        _queue.join()
+
+
+def artifact_stats() -> dict:
+    return {
+        **_stats,
+        "pending": _queue.unfinished_tasks,
+        "enabled": ARTIFACTS_ENABLED,
+        "capture_raw": ARTIFACTS_CAPTURE_RAW,
+    }
@@ -0,0 +1,120 @@
+import json
+import os
+import unicodedata
+
+import numpy as np
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+AUDIO_FAST_PATH_ENABLED = os.getenv("AUDIO_FAST_PATH_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+AUDIO_FAST_PATH_THRESHOLD = float(os.getenv("AUDIO_FAST_PATH_THRESHOLD", "0.85"))
+AUDIO_FAST_PATH_SIGMA = float(os.getenv("AUDIO_FAST_PATH_SIGMA", "0.08"))
+AUDIO_CENTROIDS_PATH = os.getenv("AUDIO_CENTROIDS_PATH", "")
+
+FEATURE_NAMES = ("valence", "energy", "danceability", "acousticness", "tempo")
+# tempo BPM olarak gelir; diğer özelliklerle aynı ölçeğe (0-1) çekmek için bölünür.
+TEMPO_SCALE = 200.0
+
+# Duygu bölgelerinin merkezleri (FEATURE_NAMES sırasıyla, tempo normalize). Anahtarlar aksansız,
+# küçük harfli isimlerdir; AUDIO_CENTROIDS_PATH ile ezilebilir ya da yeni duygu eklenebilir.
+DEFAULT_CENTROIDS = {
+    "mutlu": {"valence": 0.80, "energy": 0.65, "danceability": 0.70, "acousticness": 0.25, "tempo": 0.60},
+    "uzgun": {"valence": 0.18, "energy": 0.30, "danceability": 0.40, "acousticness": 0.65, "tempo": 0.45},
+    "enerjik": {"valence": 0.60, "energy": 0.88, "danceability": 0.70, "acousticness": 0.08, "tempo": 0.66},
+    "sakin": {"valence": 0.40, "energy": 0.22, "danceability": 0.42, "acousticness": 0.78, "tempo": 0.45},
+    "romantik": {"valence": 0.55, "energy": 0.40, "danceability": 0.52, "acousticness": 0.50, "tempo": 0.50},
+    "neseli": {"valence": 0.78, "energy": 0.75, "danceability": 0.78, "acousticness": 0.18, "tempo": 0.62},
+}
+CENTROID_ALIASES = {
+    "happy": "mutlu",
+    "sad": "uzgun",
+    "energetic": "enerjik",
+    "calm": "sakin",
+    "romantic": "romantik",
+    "cheerful": "neseli",
+}
+
+
+_log = get_logger("audio_scorer.py")
+
+
+def _centroid_key(value: str) -> str:
+    normalized = unicodedata.normalize("NFKD", (value or "").strip().lower())
+    key = "".join(ch for ch in normalized if not unicodedata.combining(ch))
+    return CENTROID_ALIASES.get(key, key)
+
+
+def _load_centroids() -> dict[str, dict[str, float]]:
+    centroids = {key: dict(values) for key, values in DEFAULT_CENTROIDS.items()}
+    if not AUDIO_CENTROIDS_PATH:
+        return centroids
+
+    try:
+        with open(AUDIO_CENTROIDS_PATH, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    except Exception as exc:
+        _log(f"AUDIO_CENTROIDS_PATH okunamadı, varsayılan merkezler kullanılacak: {exc}", level="warning")
+        return centroids
+
+    for emotion, values in overrides.items():
+        key = _centroid_key(emotion)
+        merged = centroids.get(key, {name: 0.5 for name in FEATURE_NAMES})
+        merged.update({name: float(value) for name, value in (values or {}).items() if name in FEATURE_NAMES})
+        centroids[key] = merged
+    return centroids
+
+
+CENTROIDS = _load_centroids()
+
+
+def feature_matrix(songs: list[dict]) -> np.ndarray:
+    rows = []
+    for song in songs:
+        features = song.get("audio_features") or {}
+        rows.append([features.get(name) for name in FEATURE_NAMES])
+    matrix = np.array(rows, dtype=float).reshape(len(songs), len(FEATURE_NAMES))
+    matrix[:, FEATURE_NAMES.index("tempo")] /= TEMPO_SCALE
+    return np.clip(matrix, 0.0, 1.0)
+
+
+# Tüm playlist'in özellik matrisi tek seferde skorlanır: her şarkı için duygu merkezlerine uzaklık,
+# softmax ile olasılığa çevrilir. Eşiği geçenler (index -> (etiket, güven)) döner, gerisi LLM'e gider.
+# Seçilen duygulardan birinin merkezi yoksa şarkı o duyguya ait olabileceği için hiçbiri etiketlenmez.
+def score_confident(songs: list[dict], emotions: list[str]) -> dict[int, tuple[str, float]]:
+    if not AUDIO_FAST_PATH_ENABLED or not songs or len(emotions) < 2:
+        return {}
+
+    keys = [_centroid_key(emotion) for emotion in emotions]
+    if any(key not in CENTROIDS for key in keys):
+        return {}
+
+    matrix = feature_matrix(songs)
+    centroids = np.array([[CENTROIDS[key][name] for name in FEATURE_NAMES] for key in keys], dtype=float)
+
+    # valence/energy eksikse skor anlamsız; diğer eksik özellikler uzaklığa katılmaz.
+    core = matrix[:, [FEATURE_NAMES.index("valence"), FEATURE_NAMES.index("energy")]]
+    usable = ~np.isnan(core).any(axis=1)
+    if not usable.any():
+        return {}
+
+    diff = matrix[usable, None, :] - centroids[None, :, :]
+    present = ~np.isnan(diff)
+    sq_dist = np.where(present, diff**2, 0.0).sum(axis=2) / np.maximum(present.sum(axis=2), 1)
+
+    logits = -sq_dist / (2 * AUDIO_FAST_PATH_SIGMA**2)
+    logits -= logits.max(axis=1, keepdims=True)
+    probs = np.exp(logits)
+    probs /= probs.sum(axis=1, keepdims=True)
+
+    best = probs.argmax(axis=1)
+    confidence = probs[np.arange(len(best)), best]
+    confident = confidence >= AUDIO_FAST_PATH_THRESHOLD
+
+    positions = np.flatnonzero(usable)[confident]
+    return {
+        int(position): (emotions[int(label)], round(float(score), 4))
+        for position, label, score in zip(positions, best[confident], confidence[confident])
+    }
@@ -0,0 +1,174 @@
+import math
+import os
+import threading
+
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "20"))
+CLASSIFY_ADAPTIVE_BATCHING = os.getenv("CLASSIFY_ADAPTIVE_BATCHING", "1").strip().lower() in {"1", "true", "yes", "on"}
+CLASSIFY_BATCH_MIN_SIZE = max(1, int(os.getenv("CLASSIFY_BATCH_MIN_SIZE", "5")))
+CLASSIFY_BATCH_MAX_SIZE = max(CLASSIFY_BATCH_MIN_SIZE, int(os.getenv("CLASSIFY_BATCH_MAX_SIZE", "80")))
+CLASSIFY_PROMPT_TOKEN_BUDGET = int(os.getenv("CLASSIFY_PROMPT_TOKEN_BUDGET", "6000"))
+CLASSIFY_COMPLETION_TOKEN_BUDGET = int(os.getenv("CLASSIFY_COMPLETION_TOKEN_BUDGET", "3000"))
+CLASSIFY_TARGET_LATENCY_SEC = float(os.getenv("CLASSIFY_TARGET_LATENCY_SEC", "30"))
+
+# Tokenizer'a bağımlı olmamak için kaba tahmin: ~3.5 karakter/token (Türkçe başlıklarda İngilizce'den kısa).
+CHARS_PER_TOKEN = 3.5
+# {"index": 12, "label": "enerjik", "confidence": 0.87, "reason": "..."} satırı için tahmini cevap token'ı.
+COMPLETION_TOKENS_PER_SONG = 40
+EWMA_ALPHA = 0.3
+MAX_FAILURE_RATE = 0.15
+
+
+_log = get_logger("batch_planner.py")
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+# Batch boyutunu token bütçesine göre keser; model başına gecikme ve parse hatası oranından
+# hedef boyutu büyütür/küçültür. Durum süreç genelinde paylaşılır, sonraki çalışmalar da faydalanır.
+class BatchPlanner:
+    def __init__(
+        self,
+        initial_size: int,
+        min_size: int,
+        max_size: int,
+        prompt_budget: int,
+        completion_budget: int,
+        target_latency_sec: float,
+        adaptive: bool = True,
+    ) -> None:
+        self.fixed_size = max(1, initial_size)
+        self.initial_size = min(max(initial_size, min_size), max_size)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.prompt_budget = prompt_budget
+        self.completion_budget = completion_budget
+        self.target_latency_sec = target_latency_sec
+        self.adaptive = adaptive
+        self._models: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _state_locked(self, model: str) -> dict:
+        state = self._models.get(model)
+        if state is None:
+            state = {
+                "target_size": self.initial_size,
+                "sec_per_song": None,
+                "failure_rate": 0.0,
+                "batches": 0,
+                "failures": 0,
+                "grown": 0,
+                "shrunk": 0,
+            }
+            self._models[model] = state
+        return state
+
+    def target_size(self, model: str) -> int:
+        if not self.adaptive:
+            return self.fixed_size
+        with self._lock:
+            return self._state_locked(model)["target_size"]
+
+    def plan(self, model: str, indices: list[int], header_tokens: int, song_tokens: dict[int, int]) -> list[list[int]]:
+        size_limit = self.target_size(model)
+        if not self.adaptive:
+            return [indices[i : i + size_limit] for i in range(0, len(indices), size_limit)]
+
+        batches: list[list[int]] = []
+        current: list[int] = []
+        prompt_tokens = header_tokens
+        for index in indices:
+            tokens = song_tokens.get(index, 0)
+            over_prompt = prompt_tokens + tokens > self.prompt_budget
+            over_completion = (len(current) + 1) * COMPLETION_TOKENS_PER_SONG > self.completion_budget
+            # Tek şarkı bütçeyi aşsa bile batch boş gönderilmez.
+            if current and (len(current) >= size_limit or over_prompt or over_completion):
+                batches.append(current)
+                current = []
+                prompt_tokens = header_tokens
+            current.append(index)
+            prompt_tokens += tokens
+
+        if current:
+            batches.append(current)
+        return batches
+
+    # Gecikme hedefi aşılırsa şarkı başına süreye göre küçültür, parse hatasında yarıya indirir;
+    # tam boy batch hızlı ve temiz dönerse %25 büyütür.
+    def observe(self, model: str, song_count: int, latency_sec: float, failed: bool) -> None:
+        if not self.adaptive or song_count <= 0:
+            return
+
+        with self._lock:
+            state = self._state_locked(model)
+            previous = state["target_size"]
+            state["batches"] += 1
+            state["failures"] += int(failed)
+            state["failure_rate"] = (1 - EWMA_ALPHA) * state["failure_rate"] + EWMA_ALPHA * float(failed)
+
+            if failed:
+                state["target_size"] = max(self.min_size, previous // 2)
+            else:
+                per_song = latency_sec / song_count
+                if state["sec_per_song"] is None:
+                    state["sec_per_song"] = per_song
+                else:
+                    state["sec_per_song"] = (1 - EWMA_ALPHA) * state["sec_per_song"] + EWMA_ALPHA * per_song
+
+                projected = state["sec_per_song"] * previous
+                if projected > self.target_latency_sec:
+                    fitted = int(self.target_latency_sec / state["sec_per_song"]) if state["sec_per_song"] else previous
+                    state["target_size"] = max(self.min_size, min(previous - 1, fitted))
+                elif song_count >= previous and state["failure_rate"] < MAX_FAILURE_RATE:
+                    state["target_size"] = min(self.max_size, previous + max(1, previous // 4))
+
+            current = state["target_size"]
+            if current > previous:
+                state["grown"] += 1
+            elif current < previous:
+                state["shrunk"] += 1
+
+        if current != previous:
+            _log(
+                f"Batch boyutu güncellendi model={model}: {previous} -> {current} "
+                f"(latency={latency_sec:.1f}s, songs={song_count}, failed={failed})"
+            )
+
+    def stats(self) -> dict:
+        with self._lock:
+            models = {
+                model: {
+                    **state,
+                    "sec_per_song": round(state["sec_per_song"], 3) if state["sec_per_song"] is not None else None,
+                    "failure_rate": round(state["failure_rate"], 3),
+                }
+                for model, state in self._models.items()
+            }
+        return {
+            "adaptive": self.adaptive,
+            "initial_size": self.initial_size,
+            "min_size": self.min_size,
+            "max_size": self.max_size,
+            "prompt_token_budget": self.prompt_budget,
+            "completion_token_budget": self.completion_budget,
+            "target_latency_sec": self.target_latency_sec,
+            "models": models,
+        }
+
+
+batch_planner = BatchPlanner(
+    CLASSIFY_BATCH_SIZE,
+    CLASSIFY_BATCH_MIN_SIZE,
+    CLASSIFY_BATCH_MAX_SIZE,
+    CLASSIFY_PROMPT_TOKEN_BUDGET,
+    CLASSIFY_COMPLETION_TOKEN_BUDGET,
+    CLASSIFY_TARGET_LATENCY_SEC,
+    adaptive=CLASSIFY_ADAPTIVE_BATCHING,
+)
@@ -0,0 +1,319 @@
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Canlı Spotify / OpenRouter yerine yerelde çalışan sahte sunucular. Sadece benchmark içindir;
+# cevaplar uygulamanın okuduğu alanlarla sınırlıdır ve aynı girdide hep aynıdır.
+
+DEFAULT_LABELS = ("mutlu", "üzgün", "enerjik", "sakin")
+_PLAYLIST_RE = re.compile(r"bench(\d+)")
+_SONG_LINE_RE = re.compile(r"^(\d+)\. (.*)$", re.M)
+_ALLOWED_RE = re.compile(r"^Allowed labels: (.*)$", re.M)
+
+
+@dataclass
+class FaultConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    # Sadece OpenRouter: cevap süresi şarkı başına bu kadar uzar (modelin çıktı üretme süresi).
+    per_song_ms: float = 0.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    retry_after_sec: float = 1.0
+
+
+@dataclass
+class MockState:
+    spotify: FaultConfig = field(default_factory=FaultConfig)
+    openrouter: FaultConfig = field(default_factory=FaultConfig)
+    stream: bool = True
+    seed: int = 7
+    counts: Counter = field(default_factory=Counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock)
+    _rng: random.Random = field(init=False)
+
+    def __post_init__(self) -> None:
+        self._rng = random.Random(self.seed)
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self.counts[key] += 1
+
+    def roll(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(sorted(self.counts.items()))
+
+    def reset_counts(self) -> None:
+        with self._lock:
+            self.counts.clear()
+
+
+def _stable_unit(value: str, salt: str) -> float:
+    return (zlib.crc32(f"{salt}:{value}".encode("utf-8")) % 10_000) / 10_000
+
+
+def playlist_id(size: int, client: int = 0, run: int = 0) -> str:
+    return f"bench{size}c{client}r{run}"
+
+
+def _playlist_size(playlist: str) -> int:
+    match = _PLAYLIST_RE.match(playlist)
+    return int(match.group(1)) if match else 0
+
+
+def _track(playlist: str, position: int) -> dict:
+    track_id = f"{playlist}t{position:06d}"
+    return {
+        "track": {
+            "id": track_id,
+            "name": f"Track {position}",
+            "artists": [{"name": f"Artist {position % 97}"}],
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{track_id}"},
+        }
+    }
+
+
+def _audio_features(track_id: str) -> dict:
+    return {
+        "id": track_id,
+        "danceability": round(_stable_unit(track_id, "danceability"), 3),
+        "energy": round(_stable_unit(track_id, "energy"), 3),
+        "valence": round(_stable_unit(track_id, "valence"), 3),
+        "acousticness": round(_stable_unit(track_id, "acousticness"), 3),
+        "instrumentalness": round(_stable_unit(track_id, "instrumentalness"), 3),
+        "speechiness": round(_stable_unit(track_id, "speechiness"), 3),
+        "liveness": round(_stable_unit(track_id, "liveness"), 3),
+        "tempo": round(60 + 120 * _stable_unit(track_id, "tempo"), 1),
+    }
+
+
+def _completion_text(prompt: str) -> str:
+    allowed = _ALLOWED_RE.search(prompt)
+    labels = [label.strip() for label in allowed.group(1).split(",")] if allowed else list(DEFAULT_LABELS)
+    items = [
+        {
+            "index": int(index),
+            "label": labels[zlib.crc32(line.encode("utf-8")) % len(labels)],
+            "confidence": 0.9,
+            "reason": "mock",
+        }
+        for index, line in _SONG_LINE_RE.findall(prompt)
+    ]
+    return "```json\n" + json.dumps({"labels": items}, ensure_ascii=False) + "\n```"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    state: MockState
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, payload, headers: dict | None = None) -> None:
+        body = payload if isinstance(payload, bytes) else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    # Gecikme uygulanır ve hata/429 enjekte edilecekse cevap gönderilip True döner.
+    def _inject(self, config: FaultConfig, key: str, extra_ms: float = 0.0) -> bool:
+        delay_ms = config.latency_ms + extra_ms
+        if config.jitter_ms:
+            delay_ms += config.jitter_ms * self.state.roll()
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+
+        roll = self.state.roll()
+        if roll < config.rate_limit_rate:
+            self.state.count(f"{key}:429")
+            self._send(
+                429,
+                {"error": {"status": 429, "message": "mock rate limit"}},
+                {"Retry-After": f"{config.retry_after_sec:g}"},
+            )
+            return True
+        if roll < config.rate_limit_rate + config.error_rate:
+            self.state.count(f"{key}:500")
+            self._send(500, {"error": {"status": 500, "message": "mock error"}})
+            return True
+        return False
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        parts = [part for part in parsed.path.split("/") if part]
+        config = self.state.spotify
+
+        if parts == ["v1", "me"]:
+            self.state.count("spotify:me")
+            if not self._inject(config, "spotify:me"):
+                self._send(200, {"id": "bench-user", "display_name": "Bench"})
+            return
+
+        if parts == ["v1", "audio-features"]:
+            self.state.count("spotify:audio_features")
+            if not self._inject(config, "spotify:audio_features"):
+                ids = [track_id for track_id in query.get("ids", "").split(",") if track_id]
+                self._send(200, {"audio_features": [_audio_features(track_id) for track_id in ids]})
+            return
+
+        if len(parts) == 3 and parts[:2] == ["v1", "playlists"]:
+            self.state.count("spotify:playlist")
+            if not self._inject(config, "spotify:playlist"):
+                self._send(200, {"id": parts[2], "snapshot_id": f"{parts[2]}-snapshot"})
+            return
+
+        # spotipy'nin yeni sürümleri (sync yol, /jobs) /items, httpx yolu /tracks çağırır.
+        if len(parts) == 4 and parts[:2] == ["v1", "playlists"] and parts[3] in {"tracks", "items"}:
+            self.state.count("spotify:playlist_tracks")
+            if self._inject(config, "spotify:playlist_tracks"):
+                return
+            playlist = parts[2]
+            total = _playlist_size(playlist)
+            offset = int(query.get("offset", 0))
+            limit = int(query.get("limit", 100))
+            end = min(total, offset + limit)
+            self._send(
+                200,
+                {
+                    "items": [_track(playlist, position) for position in range(offset, end)],
+                    "total": total,
+                    "next": None if end >= total else f"/v1/playlists/{playlist}/tracks?offset={end}&limit={limit}",
+                },
+            )
+            return
+
+        self._send(404, {"error": {"status": 404, "message": f"mock: {parsed.path}"}})
+
+    def do_POST(self) -> None:
+        parsed = urlparse(self.path)
+        parts = [part for part in parsed.path.split("/") if part]
+        body = self._body()
+
+        if parts == ["api", "token"]:
+            self.state.count("spotify:token")
+            self._send(200, {"access_token": "bench-token", "token_type": "Bearer", "expires_in": 3600})
+            return
+
+        if len(parts) == 4 and parts[:2] == ["v1", "users"] and parts[3] == "playlists":
+            self.state.count("spotify:create_playlist")
+            if not self._inject(self.state.spotify, "spotify:create_playlist"):
+                name = json.loads(body or b"{}").get("name", "")
+                new_id = f"created{zlib.crc32(name.encode('utf-8')) % 100_000}x{self.state.counts['spotify:create_playlist']}"
+                self._send(
+                    201,
+                    {
+                        "id": new_id,
+                        "name": name,
+                        "external_urls": {"spotify": f"https://open.spotify.com/playlist/{new_id}"},
+                    },
+                )
+            return
+
+        # spotipy'nin yeni sürümleri (sync yol, /jobs) /items, httpx yolu /tracks çağırır.
+        if len(parts) == 4 and parts[:2] == ["v1", "playlists"] and parts[3] in {"tracks", "items"}:
+            self.state.count("spotify:add_tracks")
+            if not self._inject(self.state.spotify, "spotify:add_tracks"):
+                self._send(201, {"snapshot_id": f"{parts[2]}-{self.state.counts['spotify:add_tracks']}"})
+            return
+
+        if parts[-2:] == ["chat", "completions"]:
+            self._chat_completion(body)
+            return
+
+        self._send(404, {"error": {"status": 404, "message": f"mock: {parsed.path}"}})
+
+    def _chat_completion(self, body: bytes) -> None:
+        self.state.count("openrouter:chat")
+        payload = json.loads(body or b"{}")
+        prompt = ((payload.get("messages") or [{}])[0] or {}).get("content", "")
+        song_count = len(_SONG_LINE_RE.findall(prompt))
+        if self._inject(self.state.openrouter, "openrouter:chat", self.state.openrouter.per_song_ms * song_count):
+            return
+
+        text = _completion_text(prompt)
+        usage = {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(text) // 4}
+        if not (payload.get("stream") and self.state.stream):
+            self._send(
+                200,
+                {
+                    "id": "mock-completion",
+                    "model": payload.get("model"),
+                    "choices": [{"message": {"role": "assistant", "content": text}}],
+                    "usage": usage,
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for start in range(0, len(text), 64):
+                chunk = {
+                    "id": "mock-completion",
+                    "model": payload.get("model"),
+                    "choices": [{"delta": {"content": text[start : start + 64]}}],
+                }
+                self._chunk(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n")
+            self._chunk(f"data: {json.dumps({'id': 'mock-completion', 'choices': [], 'usage': usage})}\n\n")
+            self._chunk("data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # İstemci tüm etiketleri aldıktan sonra stream'i erken kapatabilir.
+            self.state.count("openrouter:stream_closed_early")
+
+    def _chunk(self, text: str) -> None:
+        data = text.encode("utf-8")
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockServer:
+    def __init__(self, state: MockState, host: str = "127.0.0.1", port: int = 0) -> None:
+        handler = type("MockHandler", (_Handler,), {"state": state})
+        self.state = state
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="bench-mock", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    # Uygulama modülleri import edilmeden önce ortam değişkenlerine yazılacak adresler.
+    def env(self) -> dict[str, str]:
+        return {
+            "SPOTIFY_API_BASE": f"{self.base_url}/v1",
+            "SPOTIFY_ACCOUNTS_BASE": self.base_url,
+            "OPENROUTER_API_BASE": f"{self.base_url}/api/v1",
+        }
+
+    def start(self) -> "MockServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
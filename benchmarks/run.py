@@ -0,0 +1,394 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+
+from benchmarks.mock_servers import FaultConfig, MockServer, MockState, playlist_id
+
+# Kullanım (repo kökünden):
+#   python -m benchmarks.run --output bench.json
+#   python -m benchmarks.run --scenario classify_1000 --scenario save_1000 --baseline old.json
+# Her senaryo ayrı bir süreçte çalışır; modül seviyesindeki limiter/planner durumu ve bellek ölçümü
+# senaryolar arasında taşınmaz.
+
+SCHEMA_VERSION = 1
+EMOTIONS = ["mutlu", "üzgün", "enerjik", "sakin"]
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+JOB_POLL_SEC = 0.05
+
+# Benchmark uygulamanın kendisini ölçer: cache'ler kapalı, limiter mock'u kısmaz. Ortamda verilen
+# değerler ezilmez.
+APP_ENV_DEFAULTS = {
+    "SPOTIFY_CLIENT_ID": "bench",
+    "SPOTIFY_CLIENT_SECRET": "bench",
+    "OPENROUTER_API_KEY": "bench",
+    "OPENROUTER_RATE_PER_SEC": "1000",
+    "OPENROUTER_RATE_BURST": "1000",
+    "CLASSIFY_CACHE_ENABLED": "0",
+    "PLAYLIST_CACHE_ENABLED": "0",
+    "LABEL_INDEX_ENABLED": "0",
+    "ARTIFACTS_ENABLED": "0",
+    "CLASSIFY_FAIL_ON_BATCH_ERROR": "0",
+}
+
+
+@dataclass
+class Scenario:
+    name: str
+    endpoint: str
+    tracks: int
+    clients: int = 1
+    runs: int = 1
+    spotify: dict = field(default_factory=dict)
+    openrouter: dict = field(default_factory=dict)
+
+
+SCENARIOS = [
+    Scenario("classify_100", "classify", 100, runs=5),
+    Scenario("classify_1000", "classify", 1000, runs=3),
+    Scenario("classify_10000", "classify", 10000),
+    Scenario("classify_concurrent_8x1000", "classify", 1000, clients=8),
+    Scenario("classify_1000_openrouter_429", "classify", 1000, openrouter={"rate_limit_rate": 0.1, "retry_after_sec": 0.2}),
+    Scenario("classify_1000_spotify_errors", "classify", 1000, spotify={"rate_limit_rate": 0.05, "retry_after_sec": 0.1}),
+    # /jobs/classify sync (requests + thread pool) yolunu ölçer; etiketlerden biri ASCII dışıdır ("üzgün").
+    Scenario("classify_job_1000", "job", 1000, runs=3),
+    Scenario("save_1000", "save", 1000, runs=3),
+    Scenario("save_concurrent_4x1000", "save", 1000, clients=4),
+]
+
+
+def _percentile(values: list[float], percentile: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, math.ceil(percentile / 100 * len(ordered)) - 1)
+    return round(ordered[rank], 2)
+
+
+def _rss_mb() -> float | None:
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+
+        # Linux'ta KB, macOS'ta byte; /proc yoksa sadece süreç boyu tepe değeri alınabilir.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except Exception:
+        return None
+
+
+# Senaryo süresince RSS'i örnekler; tepe değer raporlanır.
+class _MemorySampler:
+    def __init__(self, interval_sec: float = 0.05) -> None:
+        self.interval_sec = interval_sec
+        self.start_mb = _rss_mb()
+        self.peak_mb = self.start_mb
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="bench-rss", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            self._sample()
+
+    def _sample(self) -> None:
+        current = _rss_mb()
+        if current is not None and (self.peak_mb is None or current > self.peak_mb):
+            self.peak_mb = current
+
+    def __enter__(self) -> "_MemorySampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+
+
+def _grouped_tracks(scenario: Scenario, client: int, run: int) -> dict[str, list[dict]]:
+    grouped: dict[str, list[dict]] = {emotion: [] for emotion in EMOTIONS}
+    source = playlist_id(scenario.tracks, client, run)
+    for position in range(scenario.tracks):
+        track_id = f"{source}t{position:06d}"
+        grouped[EMOTIONS[position % len(EMOTIONS)]].append(
+            {"id": track_id, "name": f"Track {position}", "artist": f"Artist {position % 97}", "url": ""}
+        )
+    return grouped
+
+
+# Job gönderilir, bitene kadar durumu sorulur; sonuç (ya da hata) cevabı döner.
+async def _run_job(http, body: dict):
+    submitted = await http.post("/jobs/classify", json=body)
+    if submitted.status_code != 202:
+        return submitted
+    job_id = submitted.json()["job_id"]
+    while (await http.get(f"/jobs/{job_id}")).json()["status"] not in {"succeeded", "failed", "cancelled"}:
+        await asyncio.sleep(JOB_POLL_SEC)
+    return await http.get(f"/jobs/{job_id}/result")
+
+
+# Başarılı cevapta bile "ok" dışında biten batch'ler (parse edilemeyen etiket, fallback) sayılır.
+def _degraded_batches(response) -> int:
+    if response.status_code != 200:
+        return 0
+    return sum(1 for batch in response.json().get("batch_logs") or [] if batch.get("status") != "ok")
+
+
+async def _client_loop(
+    app, scenario: Scenario, client: int, latencies: list[float], errors: list[str], degraded: list[int]
+) -> None:
+    import httpx
+
+    timeout = httpx.Timeout(None)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=timeout) as http:
+        for run in range(scenario.runs):
+            classify_body = {"playlist_url": playlist_id(scenario.tracks, client, run), "emotions": EMOTIONS}
+            started = time.perf_counter()
+            if scenario.endpoint == "classify":
+                response = await http.post("/classify", json=classify_body)
+            elif scenario.endpoint == "job":
+                response = await _run_job(http, classify_body)
+            else:
+                body = {"access_token": "bench-token", "grouped_tracks": _grouped_tracks(scenario, client, run)}
+                response = await http.post("/save_playlists", json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            if response.status_code != 200:
+                errors.append(f"{response.status_code}: {response.text[:200]}")
+            elif scenario.endpoint != "save":
+                degraded.append(_degraded_batches(response))
+
+
+async def _run_clients(app, scenario: Scenario) -> tuple[list[float], list[str], list[int], float]:
+    latencies: list[float] = []
+    errors: list[str] = []
+    degraded: list[int] = []
+    started = time.perf_counter()
+    await asyncio.gather(
+        *[_client_loop(app, scenario, client, latencies, errors, degraded) for client in range(scenario.clients)]
+    )
+    return latencies, errors, degraded, time.perf_counter() - started
+
+
+def _run_child(scenario: Scenario, args: argparse.Namespace) -> dict:
+    state = MockState(
+        spotify=FaultConfig(latency_ms=args.spotify_latency_ms, jitter_ms=args.jitter_ms, **scenario.spotify),
+        openrouter=FaultConfig(
+            latency_ms=args.openrouter_latency_ms,
+            jitter_ms=args.jitter_ms,
+            per_song_ms=args.openrouter_per_song_ms,
+            **scenario.openrouter,
+        ),
+        stream=not args.no_stream,
+        seed=args.seed,
+    )
+    server = MockServer(state).start()
+    os.environ.update(server.env())
+    for key, value in APP_ENV_DEFAULTS.items():
+        os.environ.setdefault(key, value)
+
+    sys.path.insert(0, ROOT_DIR)
+    import main  # noqa: E402  (ortam değişkenleri ayarlandıktan sonra import edilmeli)
+
+    try:
+        with _MemorySampler() as memory:
+            latencies, errors, degraded, wall_sec = asyncio.run(_run_clients(main.app, scenario))
+    finally:
+        server.stop()
+
+    requests_total = scenario.clients * scenario.runs
+    tracks_total = requests_total * scenario.tracks
+    return {
+        "endpoint": scenario.endpoint,
+        "tracks_per_request": scenario.tracks,
+        "clients": scenario.clients,
+        "requests": requests_total,
+        "errors": len(errors),
+        "error_samples": errors[:3],
+        "degraded_batches": sum(degraded),
+        "wall_sec": round(wall_sec, 3),
+        "throughput_tracks_per_sec": round(tracks_total / wall_sec, 2) if wall_sec else None,
+        "throughput_requests_per_sec": round(requests_total / wall_sec, 3) if wall_sec else None,
+        "latency_ms": {
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+            "max": round(max(latencies), 2) if latencies else None,
+            "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        },
+        "memory_mb": {
+            "rss_start": round(memory.start_mb, 1) if memory.start_mb is not None else None,
+            "rss_peak": round(memory.peak_mb, 1) if memory.peak_mb is not None else None,
+        },
+        "mock_requests": state.snapshot(),
+        "faults": {"spotify": asdict(state.spotify), "openrouter": asdict(state.openrouter)},
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _child_command(name: str, result_path: str, args: argparse.Namespace) -> list[str]:
+    return [
+        sys.executable,
+        "-m",
+        "benchmarks.run",
+        "--child",
+        name,
+        "--result-file",
+        result_path,
+        "--spotify-latency-ms",
+        str(args.spotify_latency_ms),
+        "--openrouter-latency-ms",
+        str(args.openrouter_latency_ms),
+        "--openrouter-per-song-ms",
+        str(args.openrouter_per_song_ms),
+        "--jitter-ms",
+        str(args.jitter_ms),
+        "--seed",
+        str(args.seed),
+        *(["--no-stream"] if args.no_stream else []),
+    ]
+
+
+def _run_scenario(name: str, args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        result_path = os.path.join(tmp_dir, "result.json")
+        env = {**os.environ, "CACHE_DIR": os.path.join(tmp_dir, "cache")}
+        completed = subprocess.run(
+            _child_command(name, result_path, args),
+            cwd=ROOT_DIR,
+            env=env,
+            stdout=None if args.verbose else subprocess.DEVNULL,
+            stderr=None if args.verbose else subprocess.PIPE,
+            text=True,
+        )
+        if completed.returncode != 0 or not os.path.isfile(result_path):
+            return {"failed": True, "returncode": completed.returncode, "stderr": (completed.stderr or "")[-2000:]}
+        with open(result_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+
+def _delta(current, previous) -> str:
+    if not isinstance(current, (int, float)) or not isinstance(previous, (int, float)) or not previous:
+        return "-"
+    return f"{(current - previous) / previous * 100:+.1f}%"
+
+
+# Özet tablo stderr'e yazılır; stdout'a verilen JSON rapor bozulmaz.
+def _print_summary(report: dict, baseline: dict | None) -> None:
+    header = f"{'scenario':36} {'tracks/s':>10} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'rss MB':>8} {'err':>4} {'degr':>5}"
+    print(header, file=sys.stderr)
+    print("-" * len(header), file=sys.stderr)
+    for name, result in report["scenarios"].items():
+        if result.get("failed"):
+            print(f"{name:36} FAILED (returncode={result['returncode']})", file=sys.stderr)
+            continue
+        latency = result["latency_ms"]
+        print(
+            f"{name:36} {result['throughput_tracks_per_sec']:>10} {latency['p50']:>10} {latency['p95']:>10} "
+            f"{latency['p99']:>10} {result['memory_mb']['rss_peak']:>8} {result['errors']:>4} "
+            f"{result.get('degraded_batches', 0):>5}",
+            file=sys.stderr,
+        )
+        previous = (baseline or {}).get("scenarios", {}).get(name)
+        if previous and not previous.get("failed"):
+            print(
+                f"{'  vs baseline':36} {_delta(result['throughput_tracks_per_sec'], previous['throughput_tracks_per_sec']):>10} "
+                f"{_delta(latency['p50'], previous['latency_ms']['p50']):>10} "
+                f"{_delta(latency['p95'], previous['latency_ms']['p95']):>10} "
+                f"{_delta(latency['p99'], previous['latency_ms']['p99']):>10} "
+                f"{_delta(result['memory_mb']['rss_peak'], previous['memory_mb']['rss_peak']):>8}",
+                file=sys.stderr,
+            )
+
+
+def _parse_args(argv: list[str] | None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Spotify Playlist Classifier benchmark (yerel mock sunucularla)")
+    parser.add_argument("--scenario", action="append", choices=[scenario.name for scenario in SCENARIOS])
+    parser.add_argument("--output", help="JSON raporun yazılacağı dosya (varsayılan: stdout)")
+    parser.add_argument("--baseline", help="Karşılaştırılacak önceki JSON rapor")
+    parser.add_argument("--spotify-latency-ms", type=float, default=20.0)
+    parser.add_argument("--openrouter-latency-ms", type=float, default=300.0)
+    parser.add_argument("--openrouter-per-song-ms", type=float, default=5.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--no-stream", action="store_true", help="Mock OpenRouter stream yerine tek parça JSON döner")
+    parser.add_argument("--verbose", action="store_true", help="Uygulama loglarını gösterir")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _parse_args(argv)
+    by_name = {scenario.name: scenario for scenario in SCENARIOS}
+
+    if args.child:
+        result = _run_child(by_name[args.child], args)
+        with open(args.result_file, "w", encoding="utf-8") as f:
+            json.dump(result, f)
+        return 0
+
+    names = args.scenario or list(by_name)
+    report = {
+        "schema": SCHEMA_VERSION,
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "spotify_latency_ms": args.spotify_latency_ms,
+                "openrouter_latency_ms": args.openrouter_latency_ms,
+                "openrouter_per_song_ms": args.openrouter_per_song_ms,
+                "jitter_ms": args.jitter_ms,
+                "seed": args.seed,
+                "stream": not args.no_stream,
+                "app_env": {key: os.environ.get(key, value) for key, value in APP_ENV_DEFAULTS.items()},
+            },
+        },
+        "scenarios": {},
+    }
+
+    for name in names:
+        print(f"[benchmark] {name} çalışıyor...", file=sys.stderr, flush=True)
+        report["scenarios"][name] = {"scenario": asdict(by_name[name]), **_run_scenario(name, args)}
+
+    text = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_summary(report, baseline)
+    return 1 if any(result.get("failed") for result in report["scenarios"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+
+CLASSIFY_CACHE_ENABLED = os.getenv("CLASSIFY_CACHE_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+CLASSIFY_CACHE_PATH = os.getenv("CLASSIFY_CACHE_PATH", os.path.join(CACHE_DIR, "classify_cache.sqlite3"))
+CLASSIFY_CACHE_TTL_SEC = int(os.getenv("CLASSIFY_CACHE_TTL_SEC", str(30 * 24 * 3600)))
+CLASSIFY_CACHE_MAX_ROWS = int(os.getenv("CLASSIFY_CACHE_MAX_ROWS", "200000"))
+
+# SQLite'ın tek sorguda kabul ettiği parametre sayısı sınırlı, lookup'ları bölüyoruz.
+_LOOKUP_CHUNK = 500
+
+_lock = threading.Lock()
+_conn: sqlite3.Connection | None = None
+_stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+
+_log = get_logger("classify_cache.py")
+
+
+def emotion_set_key(emotions: list[str]) -> str:
+    return ",".join(sorted({(emotion or "").strip().lower() for emotion in emotions if (emotion or "").strip()}))
+
+
+def _connection() -> sqlite3.Connection:
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(CLASSIFY_CACHE_PATH) or ".", exist_ok=True)
+        _conn = sqlite3.connect(CLASSIFY_CACHE_PATH, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS labels (
+                track_id TEXT NOT NULL,
+                emotion_key TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                label TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (track_id, emotion_key, model, prompt_version)
+            )
+            """
+        )
+        _conn.execute("CREATE INDEX IF NOT EXISTS labels_last_used ON labels (last_used_at)")
+        _conn.commit()
+        _log(f"Sınıflandırma cache'i açıldı: {CLASSIFY_CACHE_PATH}")
+    return _conn
+
+
+def get_cached_labels(track_ids: list[str | None], emotions: list[str], model: str, prompt_version: str) -> dict[str, str]:
+    ids = sorted({track_id for track_id in track_ids if track_id})
+    if not CLASSIFY_CACHE_ENABLED or not ids:
+        return {}
+
+    emotion_key = emotion_set_key(emotions)
+    now = time.time()
+    min_created = now - CLASSIFY_CACHE_TTL_SEC if CLASSIFY_CACHE_TTL_SEC > 0 else 0
+    found: dict[str, str] = {}
+
+    try:
+        with _lock:
+            conn = _connection()
+            for i in range(0, len(ids), _LOOKUP_CHUNK):
+                chunk = ids[i : i + _LOOKUP_CHUNK]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT track_id, label FROM labels WHERE emotion_key = ? AND model = ? AND prompt_version = ? "
+                    f"AND created_at >= ? AND track_id IN ({placeholders})",
+                    (emotion_key, model, prompt_version, min_created, *chunk),
+                ).fetchall()
+                found.update({track_id: label for track_id, label in rows})
+
+            if found:
+                hit_ids = list(found)
+                for i in range(0, len(hit_ids), _LOOKUP_CHUNK):
+                    chunk = hit_ids[i : i + _LOOKUP_CHUNK]
+                    placeholders = ",".join("?" * len(chunk))
+                    conn.execute(
+                        f"UPDATE labels SET last_used_at = ? WHERE emotion_key = ? AND model = ? AND prompt_version = ? "
+                        f"AND track_id IN ({placeholders})",
+                        (now, emotion_key, model, prompt_version, *chunk),
+                    )
+                conn.commit()
+
+            _stats["hits"] += len(found)
+            _stats["misses"] += len(ids) - len(found)
+    except sqlite3.Error as exc:
+        _log(f"Cache okuma hatası, cache atlanıyor: {exc}", level="warning")
+        return {}
+
+    return found
+
+
+def store_cached_labels(labels: dict[str, str], emotions: list[str], model: str, prompt_version: str) -> None:
+    rows = [(track_id, label) for track_id, label in labels.items() if track_id and label]
+    if not CLASSIFY_CACHE_ENABLED or not rows:
+        return
+
+    emotion_key = emotion_set_key(emotions)
+    now = time.time()
+
+    try:
+        with _lock:
+            conn = _connection()
+            conn.executemany(
+                "INSERT OR REPLACE INTO labels (track_id, emotion_key, model, prompt_version, label, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(track_id, emotion_key, model, prompt_version, label, now, now) for track_id, label in rows],
+            )
+            _stats["writes"] += len(rows)
+            _evict_locked(conn, now)
+            conn.commit()
+    except sqlite3.Error as exc:
+        _log(f"Cache yazma hatası: {exc}", level="warning")
+
+
+def _evict_locked(conn: sqlite3.Connection, now: float) -> None:
+    evicted = 0
+
+    if CLASSIFY_CACHE_TTL_SEC > 0:
+        cursor = conn.execute("DELETE FROM labels WHERE created_at < ?", (now - CLASSIFY_CACHE_TTL_SEC,))
+        evicted += max(cursor.rowcount, 0)
+
+    if CLASSIFY_CACHE_MAX_ROWS > 0:
+        (count,) = conn.execute("SELECT COUNT(*) FROM labels").fetchone()
+        overflow = count - CLASSIFY_CACHE_MAX_ROWS
+        if overflow > 0:
+            cursor = conn.execute(
+                "DELETE FROM labels WHERE rowid IN (SELECT rowid FROM labels ORDER BY last_used_at ASC LIMIT ?)",
+                (overflow,),
+            )
+            evicted += max(cursor.rowcount, 0)
+
+    if evicted:
+        _stats["evictions"] += evicted
+        _log(f"Cache'ten {evicted} kayıt çıkarıldı")
+
+
+def cache_stats() -> dict:
+    with _lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+    stats["enabled"] = CLASSIFY_CACHE_ENABLED
+    return stats
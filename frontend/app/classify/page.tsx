@@ -22,22 +22,37 @@ type ClientEvent = {
   message: string
   batch?: number
   total_batches?: number
+  total_songs?: number
+  merged_count?: number
+  cache_hits?: number
+  audio_hits?: number
   status?: string
   duration_sec?: number
   song_count?: number
   reason?: string
 }
 
+type StreamTrack = TrackItem & { index: number; emotion: string }
+
+type StreamEvent = ClientEvent & {
+  tracks?: StreamTrack[]
+  result?: ClassificationResult
+  status_code?: number
+  detail?: string
+}
+
 type BatchLog = {
   batch: number
   total_batches: number
-  status: "ok" | "fallback"
+  status: "ok" | "partial" | "fallback"
   duration_sec: number
   song_count: number
   provider: string
   mode: string
   attempt: number
   unique_labels: string[]
+  salvaged?: number
+  fallback_count?: number
   reason?: string
 }
 
@@ -120,78 +135,111 @@ export default function ClassifyPage() {
     }
 
     setTotalSongs(storedTotal)
+    setProgress(5)
+    setCurrentStep(steps[0])
 
+    const controller = new AbortController()
     let cancelled = false
-    let stepIndex = 0
-
-    const progressInterval = setInterval(() => {
-      setProgress((prev) => {
-        const next = Math.min(prev + 3, 90)
-        if (storedTotal > 0) {
-          setSongsProcessed(Math.min(storedTotal, Math.round((next / 100) * storedTotal)))
+    let streamTotal = storedTotal
+
+    const handleEvent = (event: StreamEvent) => {
+      if (event.event === "heartbeat") return
+      browserLog("classify:backend", event.message || event.event, event)
+
+      if (event.event === "classification_started") {
+        streamTotal = event.total_songs ?? streamTotal
+        setTotalSongs(streamTotal)
+        setSongsProcessed(event.merged_count ?? 0)
+        setCurrentStep(steps[2])
+        setProgress(streamTotal > 0 ? Math.max(10, Math.round(((event.merged_count ?? 0) / streamTotal) * 95)) : 10)
+      } else if (event.event === "batch_started" && event.batch && event.total_batches) {
+        setCurrentStep(`Batch ${event.batch}/${event.total_batches} AI tarafından analiz ediliyor...`)
+      } else if (event.event === "batch_merged") {
+        const merged = event.merged_count ?? 0
+        setSongsProcessed(merged)
+        if (streamTotal > 0) {
+          setProgress(Math.max(10, Math.min(95, Math.round((merged / streamTotal) * 95))))
         }
-
-        const suggestedStep = Math.min(steps.length - 2, Math.floor((next / 90) * (steps.length - 1)))
-        if (suggestedStep !== stepIndex) {
-          stepIndex = suggestedStep
-          setCurrentStep(steps[stepIndex])
-          browserLog("classify", "UI adımı değişti", { step: stepIndex + 1, label: steps[stepIndex], progress: next })
+        const lastTrack = event.tracks?.[event.tracks.length - 1]
+        if (lastTrack) {
+          setCurrentSong(`${lastTrack.name} - ${lastTrack.artist} → ${lastTrack.emotion}`)
         }
+      } else if (event.event === "label_streamed") {
+        // Model cevabı akarken gelen geçici etiket; kesin sonuç batch_merged ile gelir.
+        setCurrentSong(event.message)
+      } else if (event.event === "batch_done" && event.status !== "ok") {
+        setFailedCount((prev) => prev + 1)
+      } else if (event.event === "classification_completed") {
+        setCurrentStep(steps[3])
+      }
+    }
 
-        if (next === 90 && prev < 90) {
-          setCurrentStep("AI batch sonuçları bekleniyor...")
-          browserLog("classify", "İlerleme %90: backend batch sonuçları bekleniyor")
+    const readStream = async (response: Response): Promise<ClassificationResult> => {
+      if (!response.body) {
+        throw new Error("Sunucu akış desteklemiyor")
+      }
+
+      const reader = response.body.getReader()
+      const decoder = new TextDecoder()
+      let buffer = ""
+
+      while (true) {
+        const { value, done } = await reader.read()
+        buffer += decoder.decode(value || new Uint8Array(), { stream: !done })
+
+        let newlineIndex = buffer.indexOf("\n")
+        while (newlineIndex !== -1) {
+          const line = buffer.slice(0, newlineIndex).trim()
+          buffer = buffer.slice(newlineIndex + 1)
+          newlineIndex = buffer.indexOf("\n")
+          if (!line) continue
+
+          const event: StreamEvent = JSON.parse(line)
+          if (event.event === "error") {
+            throw new Error(event.detail || "Sınıflandırma başarısız")
+          }
+          if (event.event === "result" && event.result) {
+            return event.result
+          }
+          handleEvent(event)
         }
 
-        return next
-      })
-    }, 700)
-
-    let songIndex = 0
-    const songInterval = setInterval(() => {
-      if (exampleBatch.length > 0) {
-        const song = exampleBatch[songIndex % exampleBatch.length]
-        setCurrentSong(song)
-        browserLog("classify", "Örnek şarkı gösteriliyor", { song, index: songIndex })
-        songIndex += 1
+        if (done) break
       }
-    }, 1800)
+
+      throw new Error("Sınıflandırma akışı sonuç gelmeden kapandı")
+    }
 
     const runClassification = async () => {
       const startedAt = performance.now()
 
       try {
-        browserLog("classify", "classify isteği gönderiliyor", {
-          endpoint: `${apiBaseUrl}/classify`,
+        browserLog("classify", "classify stream isteği gönderiliyor", {
+          endpoint: `${apiBaseUrl}/classify/stream`,
           playlist_url: playlistUrl,
           emotions,
         })
 
-        const response = await fetch(`${apiBaseUrl}/classify`, {
+        const response = await fetch(`${apiBaseUrl}/classify/stream`, {
           method: "POST",
           headers: { "Content-Type": "application/json" },
           body: JSON.stringify({ playlist_url: playlistUrl, emotions }),
+          signal: controller.signal,
         })
 
-        const result: ClassificationResult = await response.json()
-        browserLog("classify", "classify cevabı alındı", {
+        if (!response.ok) {
+          const failure = await response.json().catch(() => ({}))
+          throw new Error((failure as { detail?: string }).detail || "Sınıflandırma başarısız")
+        }
+
+        const result = await readStream(response)
+        browserLog("classify", "classify sonucu alındı", {
           status: response.status,
-          ok: response.ok,
           elapsedMs: Math.round(performance.now() - startedAt),
         })
 
-        if (!response.ok) {
-          throw new Error((result as unknown as { detail?: string }).detail || "Sınıflandırma başarısız")
-        }
-
         if (cancelled) return
 
-        if (Array.isArray(result.client_events)) {
-          result.client_events.forEach((event) => {
-            browserLog("classify:backend", event.message || event.event, event)
-          })
-        }
-
         if (Array.isArray(result.batch_logs)) {
           result.batch_logs.forEach((batchLog) => {
             browserLog("classify:batch", `Batch ${batchLog.batch}/${batchLog.total_batches} ${batchLog.status}`, batchLog)
@@ -223,8 +271,6 @@ export default function ClassifyPage() {
         setError(message)
         setCurrentStep("Bir hata oluştu")
         browserError("classify", "Sınıflandırma hatası", { message, error: err })
-      } finally {
-        clearInterval(progressInterval)
       }
     }
 
@@ -233,8 +279,7 @@ export default function ClassifyPage() {
     return () => {
       cancelled = true
       browserLog("classify", "Sınıflandırma ekranı temizleniyor (unmount)")
-      clearInterval(progressInterval)
-      clearInterval(songInterval)
+      controller.abort()
     }
   }, [router, steps])
 
@@ -337,7 +382,7 @@ export default function ClassifyPage() {
                 {failedCount > 0 && (
                   <div className="bg-yellow-500/10 border border-yellow-500/30 text-yellow-300 text-sm rounded-lg p-3">
                     {failedCount} batch yanıtı beklenen formatta gelmediği için güvenli fallback uygulandı. Detaylar backend logunda ve
-                    <span className="font-semibold"> datas/batch_logs.json</span> dosyasında.
+                    <span className="font-semibold"> datas/runs/</span> altındaki çalışma klasöründe.
                   </div>
                 )}
               </CardContent>
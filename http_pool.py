@@ -0,0 +1,170 @@
+import asyncio
+import importlib.util
+import os
+import threading
+from collections import defaultdict
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from structured_log import get_logger
+
+load_dotenv()
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "32"))
+HTTP_KEEPALIVE_EXPIRY_SEC = float(os.getenv("HTTP_KEEPALIVE_EXPIRY_SEC", "60"))
+HTTP_CONNECT_TIMEOUT_SEC = float(os.getenv("HTTP_CONNECT_TIMEOUT_SEC", "10"))
+HTTP_READ_TIMEOUT_SEC = float(os.getenv("HTTP_READ_TIMEOUT_SEC", "30"))
+HTTP_GET_RETRIES = int(os.getenv("HTTP_GET_RETRIES", "3"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "0").strip().lower() in {"1", "true", "yes", "on"}
+
+_lock = threading.Lock()
+_session: requests.Session | None = None
+_async_clients: dict[asyncio.AbstractEventLoop, httpx.AsyncClient] = {}
+_async_stats: dict[str, dict[str, int]] = defaultdict(lambda: {"requests": 0, "connections_opened": 0})
+
+
+_log = get_logger("http_pool.py")
+
+
+def sync_timeout(read_sec: float | None = None) -> tuple[float, float]:
+    return HTTP_CONNECT_TIMEOUT_SEC, read_sec or HTTP_READ_TIMEOUT_SEC
+
+
+def async_timeout(read_sec: float | None = None) -> httpx.Timeout:
+    return httpx.Timeout(read_sec or HTTP_READ_TIMEOUT_SEC, connect=HTTP_CONNECT_TIMEOUT_SEC)
+
+
+def get_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            # spotipy kendi session'ı verildiğinde retry adapter'ını kurmuyor; GET'lerdeki 429/5xx
+            # tekrarını burada sağlıyoruz. POST'lar (OpenRouter) rate limiter üzerinden yönetilir.
+            retry = Retry(
+                total=HTTP_GET_RETRIES,
+                connect=None,
+                read=False,
+                allowed_methods=frozenset(["GET"]),
+                status=HTTP_GET_RETRIES,
+                status_forcelist=(429, 500, 502, 503, 504),
+                backoff_factor=0.3,
+                respect_retry_after_header=True,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+            _log(f"Sync HTTP havuzu oluşturuldu. pool_maxsize={HTTP_POOL_MAXSIZE}")
+        return _session
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        _log("HTTP2_ENABLED=1 fakat 'h2' paketi kurulu değil, HTTP/1.1 kullanılacak", level="warning")
+        return False
+    return True
+
+
+async def _on_request(request: httpx.Request) -> None:
+    host = request.url.host
+    _async_stats[host]["requests"] += 1
+
+    async def trace(event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            _async_stats[host]["connections_opened"] += 1
+
+    request.extensions["trace"] = trace
+
+
+# httpx.AsyncClient bağlı olduğu event loop'a özgüdür; her loop kendi client'ını kullanır, böylece başka
+# bir thread'deki loop'un (sync kayıt sarmalayıcısı vb.) isteği sunucu loop'undaki client'ı değiştirmez.
+# Kapanmış bir loop'un client'ı artık aclose edilemez (bağlantıları o loop'a bağlı); loop'u yöneten taraf
+# kapanıştan önce close_async_client() çağırmalıdır, unutulanlar burada listeden atılıp uyarı yazılır.
+def get_async_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _async_clients.get(loop)
+        if client is not None:
+            return client
+        stale = [old_loop for old_loop in _async_clients if old_loop.is_closed()]
+        for old_loop in stale:
+            _async_clients.pop(old_loop)
+        http2 = _http2_available()
+        client = httpx.AsyncClient(
+            http2=http2,
+            timeout=async_timeout(),
+            limits=httpx.Limits(
+                max_connections=HTTP_POOL_MAXSIZE,
+                max_keepalive_connections=HTTP_POOL_MAXSIZE,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY_SEC,
+            ),
+            event_hooks={"request": [_on_request]},
+        )
+        _async_clients[loop] = client
+    if stale:
+        _log(f"{len(stale)} kapanmış event loop'un async HTTP havuzu kapatılmadan bırakılmış", level="warning")
+    _log(f"Async HTTP havuzu oluşturuldu. max_connections={HTTP_POOL_MAXSIZE}, http2={http2}")
+    return client
+
+
+# Çalışan loop'un client'ını kapatır; loop'u yöneten taraf (FastAPI lifespan vb.) kapanışta çağırır.
+async def close_async_client() -> None:
+    with _lock:
+        client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+        _log("Async HTTP havuzu kapatıldı")
+
+
+def _with_reuse_rate(stats: dict) -> dict:
+    requests_count = stats["requests"]
+    opened = stats["connections_opened"]
+    reuse_rate = 1 - opened / requests_count if requests_count else 0.0
+    return {**stats, "reuse_rate": round(max(reuse_rate, 0.0), 4)}
+
+
+def pool_stats() -> dict:
+    sync_hosts: dict[str, dict] = {}
+    with _lock:
+        session = _session
+    if session is not None:
+        for adapter in {id(a): a for a in session.adapters.values()}.values():
+            pools = adapter.poolmanager.pools
+            for key in list(pools.keys()):
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                sync_hosts[pool.host] = _with_reuse_rate(
+                    {"requests": pool.num_requests, "connections_opened": pool.num_connections}
+                )
+
+    async_hosts = {host: _with_reuse_rate(dict(stats)) for host, stats in list(_async_stats.items())}
+
+    def _total(hosts: dict) -> dict:
+        return _with_reuse_rate(
+            {
+                "requests": sum(item["requests"] for item in hosts.values()),
+                "connections_opened": sum(item["connections_opened"] for item in hosts.values()),
+            }
+        )
+
+    return {
+        "config": {
+            "pool_maxsize": HTTP_POOL_MAXSIZE,
+            "keepalive_expiry_sec": HTTP_KEEPALIVE_EXPIRY_SEC,
+            "connect_timeout_sec": HTTP_CONNECT_TIMEOUT_SEC,
+            "read_timeout_sec": HTTP_READ_TIMEOUT_SEC,
+            "http2": HTTP2_ENABLED,
+        },
+        "sync": {"total": _total(sync_hosts), "hosts": sync_hosts},
+        "async": {"total": _total(async_hosts), "hosts": async_hosts},
+    }
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+from spotify import ClassificationCancelled, process_playlist
+from structured_log import current_request_id, get_logger, request_context
+
+load_dotenv()
+
+CLASSIFY_JOB_WORKERS = max(1, int(os.getenv("CLASSIFY_JOB_WORKERS", "2")))
+CLASSIFY_JOB_RETENTION_SEC = int(os.getenv("CLASSIFY_JOB_RETENTION_SEC", "3600"))
+CLASSIFY_JOB_MAX_STORED = int(os.getenv("CLASSIFY_JOB_MAX_STORED", "200"))
+
+FINISHED_STATUSES = {"succeeded", "failed", "cancelled"}
+
+_lock = threading.Lock()
+_jobs: dict[str, dict] = {}
+_executor = ThreadPoolExecutor(max_workers=CLASSIFY_JOB_WORKERS, thread_name_prefix="classify-job")
+
+
+_log = get_logger("jobs.py")
+
+
+def _evict_locked(now: float) -> None:
+    finished = sorted(
+        (job for job in _jobs.values() if job["status"] in FINISHED_STATUSES),
+        key=lambda job: job["finished_at"] or 0,
+    )
+    for job in finished:
+        if now - (job["finished_at"] or now) > CLASSIFY_JOB_RETENTION_SEC:
+            _jobs.pop(job["id"], None)
+
+    overflow = len(_jobs) - CLASSIFY_JOB_MAX_STORED
+    for job in finished:
+        if overflow <= 0:
+            break
+        if _jobs.pop(job["id"], None) is not None:
+            overflow -= 1
+
+
+def _set_finished(job: dict, status: str, **fields) -> None:
+    with _lock:
+        job.update(status=status, finished_at=time.time(), **fields)
+
+
+def _on_event(job: dict, event: dict) -> None:
+    name = event.get("event")
+    with _lock:
+        progress = job["progress"]
+        if name == "classification_started":
+            progress.update(total_songs=event.get("total_songs", 0), total_batches=event.get("total_batches", 0))
+            progress["merged_count"] = event.get("merged_count", 0)
+        elif name == "batch_done":
+            progress["batches_done"] += 1
+        elif name == "batch_merged":
+            progress["merged_count"] = event.get("merged_count", progress["merged_count"])
+
+        job["last_event"] = {key: value for key, value in event.items() if key != "tracks"}
+
+
+# Job'un logları, onu kuyruğa alan isteğin id'siyle yazılır.
+def _run_job(job: dict) -> None:
+    with request_context(job["request_id"]):
+        _run_job_in_context(job)
+
+
+def _run_job_in_context(job: dict) -> None:
+    with _lock:
+        if job["cancel_event"].is_set():
+            job.update(status="cancelled", finished_at=time.time())
+            return
+        job.update(status="running", started_at=time.time())
+
+    _log(f"Job başladı: {job['id']}")
+    try:
+        result = process_playlist(
+            job["playlist_url"],
+            job["emotions"],
+            event_listener=lambda event: _on_event(job, event),
+            cancel_event=job["cancel_event"],
+        )
+        _set_finished(job, "succeeded", result=result)
+        _log(f"Job tamamlandı: {job['id']}")
+    except ClassificationCancelled:
+        _set_finished(job, "cancelled")
+        _log(f"Job iptal edildi: {job['id']}")
+    except Exception as exc:
+        _set_finished(job, "failed", error=exc)
+        _log(f"Job hata: {job['id']}: {exc}", level="error")
+
+
+def submit_classification_job(playlist_url: str, emotions: list[str]) -> dict:
+    job = {
+        "id": uuid.uuid4().hex,
+        "request_id": current_request_id() or uuid.uuid4().hex[:16],
+        "status": "queued",
+        "playlist_url": playlist_url,
+        "emotions": emotions,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "progress": {"total_songs": 0, "total_batches": 0, "batches_done": 0, "merged_count": 0},
+        "last_event": None,
+        "result": None,
+        "error": None,
+        "cancel_event": threading.Event(),
+    }
+
+    with _lock:
+        _evict_locked(time.time())
+        _jobs[job["id"]] = job
+
+    _executor.submit(_run_job, job)
+    _log(f"Job kuyruğa alındı: {job['id']}")
+    return job_status(job["id"])
+
+
+def get_job(job_id: str) -> dict | None:
+    with _lock:
+        _evict_locked(time.time())
+        return _jobs.get(job_id)
+
+
+def job_status(job_id: str) -> dict | None:
+    job = get_job(job_id)
+    if job is None:
+        return None
+
+    with _lock:
+        return {
+            "job_id": job["id"],
+            "status": job["status"],
+            "playlist_url": job["playlist_url"],
+            "emotions": job["emotions"],
+            "created_at": job["created_at"],
+            "started_at": job["started_at"],
+            "finished_at": job["finished_at"],
+            "progress": dict(job["progress"]),
+            "last_event": job["last_event"],
+            "error": str(job["error"]) if job["error"] else None,
+        }
+
+
+def cancel_job(job_id: str) -> dict | None:
+    job = get_job(job_id)
+    if job is None:
+        return None
+
+    with _lock:
+        if job["status"] not in FINISHED_STATUSES:
+            job["cancel_event"].set()
+            # Kuyrukta bekleyen job hiç başlamadan iptal edilir; çalışan job yeni batch göndermeyi bırakır.
+            if job["status"] == "queued":
+                job.update(status="cancelled", finished_at=time.time())
+    _log(f"Job iptal istendi: {job_id}")
+    return job_status(job_id)
+
+
+def jobs_stats() -> dict:
+    with _lock:
+        counts: dict[str, int] = {}
+        for job in _jobs.values():
+            counts[job["status"]] = counts.get(job["status"], 0) + 1
+    return {"workers": CLASSIFY_JOB_WORKERS, "stored": sum(counts.values()), "by_status": counts}
@@ -0,0 +1,47 @@
+import json
+
+
+# Parça parça gelen metindeki JSON nesnelerini, kapanış parantezi gelir gelmez çıkarır.
+# String içindeki parantezler ve kaçış karakterleri hesaba katılır; metnin geri kalanının
+# (```json çitleri, açıklama satırları) geçerli JSON olması gerekmez.
+class IncrementalObjectParser:
+    def __init__(self, required_key: str) -> None:
+        self.required_key = required_key
+        self._text = ""
+        self._starts: list[int] = []
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk: str) -> list[dict]:
+        found: list[dict] = []
+        offset = len(self._text)
+        self._text += chunk
+
+        for position, ch in enumerate(chunk, offset):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+
+            if ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                self._starts.append(position)
+            elif ch == "}" and self._starts:
+                start = self._starts.pop()
+                try:
+                    value = json.loads(self._text[start : position + 1])
+                except ValueError:
+                    continue
+                if isinstance(value, dict) and self.required_key in value:
+                    found.append(value)
+
+        return found
+
+    @property
+    def text(self) -> str:
+        return self._text
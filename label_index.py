@@ -0,0 +1,229 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+from dotenv import load_dotenv
+from scipy.spatial import cKDTree
+
+from audio_scorer import feature_matrix
+from classify_cache import emotion_set_key
+from structured_log import get_logger
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+
+LABEL_INDEX_ENABLED = os.getenv("LABEL_INDEX_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+LABEL_INDEX_DIR = os.getenv("LABEL_INDEX_DIR", os.path.join(CACHE_DIR, "label_index"))
+LABEL_INDEX_K = max(1, int(os.getenv("LABEL_INDEX_K", "7")))
+LABEL_INDEX_AGREEMENT = float(os.getenv("LABEL_INDEX_AGREEMENT", "0.85"))
+LABEL_INDEX_MAX_DISTANCE = float(os.getenv("LABEL_INDEX_MAX_DISTANCE", "0.01"))
+LABEL_INDEX_MAX_POINTS = int(os.getenv("LABEL_INDEX_MAX_POINTS", "50000"))
+
+_lock = threading.Lock()
+# emotion_set_key -> {"ids": list[str], "labels": list[str], "vectors": np.ndarray, "row_by_id": dict,
+#                     "tree": cKDTree | None}; tree vektörler değişince düşürülür, ilk sorguda yeniden kurulur.
+_partitions: dict[str, dict] = {}
+_stats = {"lookups": 0, "labelled": 0, "added": 0, "updated": 0, "loads": 0, "saves": 0}
+
+
+_log = get_logger("label_index.py")
+
+
+def _partition_path(key: str) -> str:
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(LABEL_INDEX_DIR, f"{digest}.npz")
+
+
+def _empty_partition() -> dict:
+    return {
+        "ids": [],
+        "labels": [],
+        "vectors": np.empty((0, 5), dtype=np.float32),
+        "row_by_id": {},
+        "tree": None,
+    }
+
+
+def _load_partition_locked(key: str) -> dict:
+    partition = _partitions.get(key)
+    if partition is not None:
+        return partition
+
+    partition = _empty_partition()
+    path = _partition_path(key)
+    if os.path.isfile(path):
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                if str(data["key"]) == key:
+                    partition["ids"] = data["ids"].tolist()
+                    partition["labels"] = data["labels"].tolist()
+                    partition["vectors"] = data["vectors"].astype(np.float32)
+                    partition["row_by_id"] = {track_id: row for row, track_id in enumerate(partition["ids"])}
+                    _stats["loads"] += 1
+        except Exception as exc:
+            _log(f"Label index okunamadı ({path}): {exc}", level="warning")
+
+    _partitions[key] = partition
+    return partition
+
+
+def _save_partition_locked(key: str, partition: dict) -> None:
+    try:
+        os.makedirs(LABEL_INDEX_DIR, exist_ok=True)
+        path = _partition_path(key)
+        tmp_path = path + ".tmp.npz"
+        np.savez(
+            tmp_path,
+            key=np.array(key),
+            ids=np.array(partition["ids"], dtype=str),
+            labels=np.array(partition["labels"], dtype=str),
+            vectors=partition["vectors"],
+        )
+        os.replace(tmp_path, path)
+        _stats["saves"] += 1
+    except Exception as exc:
+        _log(f"Label index yazılamadı ({key}): {exc}", level="warning")
+
+
+def _complete_rows(matrix: np.ndarray) -> np.ndarray:
+    return ~np.isnan(matrix).any(axis=1)
+
+
+def _tree_locked(partition: dict) -> cKDTree:
+    if partition["tree"] is None:
+        partition["tree"] = cKDTree(partition["vectors"])
+    return partition["tree"]
+
+
+# Geçmiş LLM etiketlerinden k en yakın komşuya KD-tree ile bakar. Komşuların hepsi LABEL_INDEX_MAX_DISTANCE
+# (boyut başına ortalama kare uzaklık) içinde ve en az LABEL_INDEX_AGREEMENT oranında aynı etiketteyse şarkı
+# index'ten etiketlenir. Dönüş: pozisyon -> (etiket, uyum oranı).
+def lookup_labels(songs: list[dict], emotions: list[str]) -> dict[int, tuple[str, float]]:
+    if not LABEL_INDEX_ENABLED or not songs:
+        return {}
+
+    key = emotion_set_key(emotions)
+    with _lock:
+        partition = _load_partition_locked(key)
+        if len(partition["ids"]) < LABEL_INDEX_K:
+            return {}
+        tree = _tree_locked(partition)
+        labels = np.array(partition["labels"], dtype=str)
+
+    queries = feature_matrix(songs)
+    positions = np.flatnonzero(_complete_rows(queries))
+    allowed = set(emotions)
+    k = LABEL_INDEX_K
+    results: dict[int, tuple[str, float]] = {}
+
+    if len(positions):
+        # Ortalama kare uzaklık eşiği öklid yarıçapına çevrilir; yarıçap dışındaki komşular inf döner.
+        radius = float(np.sqrt(LABEL_INDEX_MAX_DISTANCE * queries.shape[1]))
+        distances, nearest = tree.query(queries[positions], k=k, distance_upper_bound=radius)
+        distances = distances.reshape(len(positions), k)
+        nearest = nearest.reshape(len(positions), k)
+
+        for position, neighbours, neighbour_distances in zip(positions, nearest, distances):
+            if not np.isfinite(neighbour_distances).all():
+                continue
+            values, counts = np.unique(labels[neighbours], return_counts=True)
+            best = counts.argmax()
+            agreement = counts[best] / k
+            label = str(values[best])
+            if agreement >= LABEL_INDEX_AGREEMENT and label in allowed:
+                results[int(position)] = (label, round(float(agreement), 4))
+
+    with _lock:
+        _stats["lookups"] += len(songs)
+        _stats["labelled"] += len(results)
+    return results
+
+
+# Çalışma sonunda sadece modelin verdiği etiketlerle çağrılır; yerel (audio/index) etiketler eklenmez,
+# böylece index kendi tahminleriyle beslenmez. Aynı şarkı tekrar gelirse etiketi güncellenir.
+def add_labels(songs: list[dict], labels: list[str], emotions: list[str]) -> None:
+    if not LABEL_INDEX_ENABLED or not songs:
+        return
+
+    matrix = feature_matrix(songs)
+    complete = _complete_rows(matrix)
+    key = emotion_set_key(emotions)
+
+    with _lock:
+        partition = _load_partition_locked(key)
+        new_ids: list[str] = []
+        new_labels: list[str] = []
+        new_rows: list[np.ndarray] = []
+        updated = 0
+
+        for song, label, row, ok in zip(songs, labels, matrix, complete):
+            track_id = song.get("id")
+            if not ok or not track_id:
+                continue
+            existing = partition["row_by_id"].get(track_id)
+            if existing is not None:
+                if partition["labels"][existing] != label:
+                    partition["labels"][existing] = label
+                    partition["vectors"][existing] = row
+                    updated += 1
+            elif track_id not in new_ids:
+                new_ids.append(track_id)
+                new_labels.append(label)
+                new_rows.append(row)
+
+        if new_rows:
+            partition["ids"].extend(new_ids)
+            partition["labels"].extend(new_labels)
+            partition["vectors"] = np.vstack([partition["vectors"], np.array(new_rows, dtype=np.float32)])
+            _stats["added"] += len(new_rows)
+        _stats["updated"] += updated
+
+        overflow = len(partition["ids"]) - LABEL_INDEX_MAX_POINTS if LABEL_INDEX_MAX_POINTS > 0 else 0
+        if overflow > 0:
+            # En eski noktalar atılır.
+            partition["ids"] = partition["ids"][overflow:]
+            partition["labels"] = partition["labels"][overflow:]
+            partition["vectors"] = partition["vectors"][overflow:]
+
+        if new_rows or overflow > 0:
+            partition["row_by_id"] = {track_id: row for row, track_id in enumerate(partition["ids"])}
+        if new_rows or updated or overflow > 0:
+            partition["tree"] = None
+            _save_partition_locked(key, partition)
+
+
+def load_label_index() -> None:
+    if not LABEL_INDEX_ENABLED or not os.path.isdir(LABEL_INDEX_DIR):
+        return
+
+    loaded = 0
+    for entry in os.scandir(LABEL_INDEX_DIR):
+        if not entry.name.endswith(".npz") or ".tmp" in entry.name:
+            continue
+        try:
+            with np.load(entry.path, allow_pickle=False) as data:
+                key = str(data["key"])
+        except Exception as exc:
+            _log(f"Label index okunamadı ({entry.path}): {exc}", level="warning")
+            continue
+        with _lock:
+            partition = _load_partition_locked(key)
+            if len(partition["ids"]) >= LABEL_INDEX_K:
+                _tree_locked(partition)
+        loaded += 1
+
+    if loaded:
+        _log(f"Label index yüklendi. partitions={loaded}")
+
+
+def label_index_stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "enabled": LABEL_INDEX_ENABLED,
+            "k": LABEL_INDEX_K,
+            "partitions": {key: len(partition["ids"]) for key, partition in _partitions.items()},
+        }
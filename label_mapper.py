@@ -0,0 +1,190 @@
+import json
+import os
+import threading
+import unicodedata
+from collections import Counter
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+LABEL_SYNONYMS_PATH = os.getenv("LABEL_SYNONYMS_PATH", "")
+LABEL_FUZZY_THRESHOLD = float(os.getenv("LABEL_FUZZY_THRESHOLD", "0.5"))
+LABEL_MAPPER_CACHE_SIZE = int(os.getenv("LABEL_MAPPER_CACHE_SIZE", "64"))
+
+# Kaç farklı eşleşmeyen etiketin sayacı tutulur (stats çıktısı için).
+_UNMATCHED_TRACKED = 200
+# Tek bir mapper'ın etiket -> sonuç memo'su; model aynı birkaç etiketi tekrar tekrar döndürür.
+_MEMO_SIZE = 4096
+
+# Normalize (küçük harf, aksansız) eş anlamlı -> normalize duygu adı. LABEL_SYNONYMS_PATH ile genişletilir.
+DEFAULT_SYNONYMS = {
+    "happy": "mutlu",
+    "joyful": "mutlu",
+    "glucklich": "mutlu",
+    "feliz": "mutlu",
+    "heureux": "mutlu",
+    "sad": "uzgun",
+    "upset": "uzgun",
+    "melancholic": "uzgun",
+    "melankolik": "uzgun",
+    "huzunlu": "uzgun",
+    "traurig": "uzgun",
+    "triste": "uzgun",
+    "energetic": "enerjik",
+    "energy": "enerjik",
+    "energisch": "enerjik",
+    "energico": "enerjik",
+    "calm": "sakin",
+    "chill": "sakin",
+    "relaxed": "sakin",
+    "huzurlu": "sakin",
+    "ruhig": "sakin",
+    "tranquilo": "sakin",
+    "calme": "sakin",
+    "romantic": "romantik",
+    "romantisch": "romantik",
+    "romantico": "romantik",
+    "romantique": "romantik",
+    "cheerful": "neseli",
+    "upbeat": "neseli",
+    "frohlich": "neseli",
+    "alegre": "neseli",
+}
+
+_stats_lock = threading.Lock()
+_stats: Counter = Counter()
+_unmatched: Counter = Counter()
+
+
+_log = get_logger("label_mapper.py")
+
+
+@lru_cache(maxsize=8192)
+def normalize_label(value: str) -> str:
+    base = (value or "").strip().lower()
+    normalized = unicodedata.normalize("NFKD", base)
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
+
+
+def _trigrams(value: str) -> frozenset[str]:
+    padded = f"  {value} "
+    return frozenset(padded[i : i + 3] for i in range(len(padded) - 2))
+
+
+def _load_synonyms() -> dict[str, str]:
+    synonyms = dict(DEFAULT_SYNONYMS)
+    if not LABEL_SYNONYMS_PATH:
+        return synonyms
+
+    try:
+        with open(LABEL_SYNONYMS_PATH, "r", encoding="utf-8") as f:
+            extra = json.load(f)
+        synonyms.update({normalize_label(key): normalize_label(value) for key, value in extra.items()})
+    except Exception as exc:
+        _log(f"LABEL_SYNONYMS_PATH okunamadı, varsayılan eş anlamlılar kullanılacak: {exc}", level="warning")
+    return synonyms
+
+
+SYNONYMS = _load_synonyms()
+
+
+# Bir duygu kümesi için bir kez kurulur: normalize tablo, eş anlamlılar ve fuzzy eşleşme için
+# trigram index'i önceden hesaplanır. map() eşleşme bulamazsa None döner; fallback kararı çağırandadır.
+class LabelMapper:
+    def __init__(self, emotions: tuple[str, ...], synonyms: dict[str, str]) -> None:
+        self.emotions = emotions
+        self._exact = {emotion.lower(): emotion.lower() for emotion in emotions}
+        self._normalized = {normalize_label(emotion): emotion.lower() for emotion in emotions}
+        self._synonyms = {
+            synonym: self._normalized[target] for synonym, target in synonyms.items() if target in self._normalized
+        }
+
+        # Fuzzy adaylar: hem duygu adları hem eş anlamlılar, hepsi hedef duyguya bağlı.
+        candidates = {**self._synonyms, **self._normalized}
+        self._substring_candidates = list(self._normalized.items())
+        self._gram_index: dict[str, list[str]] = {}
+        self._grams: dict[str, frozenset[str]] = {}
+        self._targets = candidates
+        for candidate in candidates:
+            grams = _trigrams(candidate)
+            self._grams[candidate] = grams
+            for gram in grams:
+                self._gram_index.setdefault(gram, []).append(candidate)
+
+        self._memo: dict[str, tuple[str | None, str]] = {}
+        self._lock = threading.Lock()
+
+    def _match(self, raw: str) -> tuple[str | None, str]:
+        if raw in self._exact:
+            return self._exact[raw], "exact"
+
+        raw_norm = normalize_label(raw)
+        if raw_norm in self._normalized:
+            return self._normalized[raw_norm], "normalized"
+        if raw_norm in self._synonyms:
+            return self._synonyms[raw_norm], "synonym"
+
+        for allowed_norm, emotion in self._substring_candidates:
+            if allowed_norm in raw_norm or raw_norm in allowed_norm:
+                return emotion, "substring"
+
+        grams = _trigrams(raw_norm)
+        shared: Counter = Counter()
+        for gram in grams:
+            for candidate in self._gram_index.get(gram, ()):
+                shared[candidate] += 1
+
+        best, best_score = None, 0.0
+        for candidate, overlap in shared.items():
+            # Dice katsayısı
+            score = 2 * overlap / (len(grams) + len(self._grams[candidate]))
+            if score > best_score:
+                best, best_score = candidate, score
+        if best is not None and best_score >= LABEL_FUZZY_THRESHOLD:
+            return self._targets[best], "fuzzy"
+
+        return None, "unmatched"
+
+    def map(self, label: str) -> str | None:
+        raw = (label or "").strip().lower()
+        if not raw:
+            return None
+
+        cached = self._memo.get(raw)
+        if cached is None:
+            cached = self._match(raw)
+            with self._lock:
+                if len(self._memo) >= _MEMO_SIZE:
+                    self._memo.clear()
+                self._memo[raw] = cached
+
+        result, kind = cached
+        with _stats_lock:
+            _stats[kind] += 1
+            if result is None and (raw in _unmatched or len(_unmatched) < _UNMATCHED_TRACKED):
+                _unmatched[raw] += 1
+        return result
+
+
+@lru_cache(maxsize=LABEL_MAPPER_CACHE_SIZE)
+def _mapper_for(emotions: tuple[str, ...]) -> LabelMapper:
+    return LabelMapper(emotions, SYNONYMS)
+
+
+def get_label_mapper(emotions: list[str]) -> LabelMapper:
+    return _mapper_for(tuple(sorted({emotion.lower() for emotion in emotions})))
+
+
+def label_mapper_stats() -> dict:
+    cache = _mapper_for.cache_info()
+    with _stats_lock:
+        return {
+            "matches": dict(_stats),
+            "top_unmatched": dict(_unmatched.most_common(20)),
+            "mappers_cached": cache.currsize,
+            "fuzzy_threshold": LABEL_FUZZY_THRESHOLD,
+        }
@@ -1,24 +1,44 @@
+import asyncio
+import json
+import math
 import os
-from datetime import datetime
+import time
+from contextlib import asynccontextmanager
 
-import requests
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 load_dotenv()
 
+from artifacts import artifact_stats, flush_artifacts
+from batch_planner import batch_planner
+from classify_cache import cache_stats
+from http_pool import close_async_client, get_async_client, pool_stats
+from jobs import cancel_job, get_job, job_status, jobs_stats, submit_classification_job
+from label_index import label_index_stats, load_label_index
+from label_mapper import label_mapper_stats
+from metrics import render_prometheus, stage_timer
+from model_router import model_latency
+from playlist_cache import playlist_cache_stats
+from profiling import PROFILING_ENABLED, profiling_requested, profiling_stats, save_profile, start_profile, stop_profile
+from rate_limiter import ProviderBusyError, openrouter_breaker, openrouter_limiter, spotify_save_limiter
+from spotify_client import SPOTIFY_TOKEN_URL, token_stats
 from spotify import (
     extract_playlist_id,
-    fetch_playlist_tracks,
-    process_playlist,
-    save_grouped_tracks_to_spotify,
+    fetch_playlist_tracks_async,
+    process_playlist_async,
+    save_grouped_tracks_to_spotify_async,
 )
+from structured_log import RequestContextMiddleware, current_request_id, get_logger, log_stats, new_request_id
 
 CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET", "")
 REDIRECT_URI = os.getenv("SPOTIFY_REDIRECT_URI", "http://127.0.0.1:3000/callback")
+STREAM_HEARTBEAT_SEC = float(os.getenv("STREAM_HEARTBEAT_SEC", "15"))
+PROFILED_PATHS = {"/classify", "/save_playlists"}
 
 origins_env = os.getenv("CORS_ORIGINS", "http://localhost:3000,http://127.0.0.1:3000")
 ALLOWED_ORIGINS = [origin.strip() for origin in origins_env.split(",") if origin.strip()]
@@ -29,7 +49,18 @@ origin_regex_env = os.getenv(
     r"https?://(localhost|127\.0\.0\.1|0\.0\.0\.0|192\.168\.\d{1,3}\.\d{1,3}|10\.\d{1,3}\.\d{1,3}\.\d{1,3})(:\d+)?$",
 )
 
-app = FastAPI(title="Spotify Playlist Classifier API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Label index diskten açılışta yüklenir; ilk sınıflandırma isteği bunu beklemez.
+    await asyncio.to_thread(load_label_index)
+    yield
+    # Kuyrukta bekleyen artifact'ler yazılmadan süreç kapanmasın; writer daemon thread'dir.
+    await asyncio.to_thread(flush_artifacts)
+    await close_async_client()
+
+
+app = FastAPI(title="Spotify Playlist Classifier API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -41,9 +72,45 @@ app.add_middleware(
 )
 
 
-def _log(message: str) -> None:
-    now = datetime.now().strftime("%H:%M:%S")
-    print(f"[{now}] [main.py] {message}", flush=True)
+_log = get_logger("main.py")
+
+
+# X-Profile: 1 başlığı ya da ?profile=1 ile istenen /classify ve /save_playlists çağrıları cProfile ile
+# izlenir. Profiler event loop thread'ine bağlanır; aynı anda çalışan diğer isteklerin kodu da izde görünür,
+# to_thread ile çalışan işler görünmez.
+async def profile_requests(request: Request, call_next):
+    if request.url.path not in PROFILED_PATHS or not profiling_requested(request.headers, request.query_params):
+        return await call_next(request)
+
+    request_id = current_request_id() or new_request_id()
+    profiler = start_profile()
+    if profiler is None:
+        _log("Profil atlandı, başka bir istek profilleniyor", level="warning")
+        response = await call_next(request)
+        response.headers["X-Profile-Skipped"] = "busy"
+        return response
+
+    started = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+    finally:
+        stop_profile(profiler)
+        trace_name = await asyncio.to_thread(
+            save_profile, profiler, request_id, request.url.path, status_code, time.perf_counter() - started
+        )
+    if trace_name:
+        response.headers["X-Profile-Id"] = trace_name
+    return response
+
+
+# Kapalıyken middleware hiç eklenmez; normal istekler ek katmandan geçmez.
+if PROFILING_ENABLED:
+    app.middleware("http")(profile_requests)
+
+# En dışta çalışır: istek id'si loglara, profile ve X-Request-ID cevap başlığına aynı şekilde yansır.
+app.add_middleware(RequestContextMiddleware)
 
 
 class CodeRequest(BaseModel):
@@ -72,22 +139,52 @@ class SavePlaylistsRequest(BaseModel):
     grouped_tracks: dict[str, list[TrackPayload]]
     playlist_names: dict[str, str] = Field(default_factory=dict)
     public: bool = False
+    # Kaynak playlist verilirse kayıtlar ona işaretlenir; update_existing ile önceki kayıtlar güncellenir.
+    source_playlist_id: str | None = None
+    update_existing: bool = False
 
 @app.get("/")
-def root() -> dict:
+async def root() -> dict:
     return {"ok": True}
 
 @app.get("/health")
-def health() -> dict:
+async def health() -> dict:
     return {"ok": True}
 
 
+@app.get("/stats")
+async def stats() -> dict:
+    return {
+        "http_pool": pool_stats(),
+        "classify_cache": cache_stats(),
+        "playlist_cache": playlist_cache_stats(),
+        "openrouter_limiter": openrouter_limiter.stats(),
+        "openrouter_circuit": openrouter_breaker.stats(),
+        "spotify_save_limiter": spotify_save_limiter.stats(),
+        "batch_planner": batch_planner.stats(),
+        "label_index": label_index_stats(),
+        "label_mapper": label_mapper_stats(),
+        "artifacts": artifact_stats(),
+        "models": model_latency.stats(),
+        "spotify_app_token": token_stats(),
+        "jobs": jobs_stats(),
+        "profiling": profiling_stats(),
+        "logging": log_stats(),
+    }
+
+
+# Prometheus text formatında aşama süreleri, OpenRouter istek/token sayaçları ve batch sonuçları.
+@app.get("/metrics")
+async def metrics() -> PlainTextResponse:
+    return PlainTextResponse(render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/playlist_info")
-def playlist_info(data: PlaylistInfoRequest) -> dict:
+async def playlist_info(data: PlaylistInfoRequest) -> dict:
     _log(f"/playlist_info çağrıldı. url={data.playlist_url}")
     try:
         playlist_id = extract_playlist_id(data.playlist_url)
-        songs = fetch_playlist_tracks(playlist_id)
+        songs = await fetch_playlist_tracks_async(playlist_id)
         _log(f"/playlist_info başarılı. playlist_id={playlist_id}, total_songs={len(songs)}")
         return {
             "playlist_id": playlist_id,
@@ -95,49 +192,159 @@ def playlist_info(data: PlaylistInfoRequest) -> dict:
             "example_batch": songs[:10],
         }
     except ValueError as exc:
-        _log(f"/playlist_info hata (400): {exc}")
+        _log(f"/playlist_info hata (400): {exc}", level="warning")
         raise HTTPException(status_code=400, detail=str(exc))
     except Exception as exc:
-        _log(f"/playlist_info hata (500): {exc}")
+        _log(f"/playlist_info hata (500): {exc}", level="error")
         raise HTTPException(status_code=500, detail=f"Playlist okunamadı: {exc}")
 
 
+def _classify_http_error(endpoint: str, exc: Exception) -> HTTPException:
+    if isinstance(exc, ValueError):
+        _log(f"{endpoint} hata (400): {exc}", level="warning")
+        return HTTPException(status_code=400, detail=str(exc))
+
+    message = str(exc)
+
+    if isinstance(exc, ProviderBusyError):
+        retry_after = max(1, math.ceil(exc.retry_after or 0))
+        _log(f"{endpoint} hata (503-rate-limit, retry_after={retry_after}s): {message}", level="warning")
+        return HTTPException(
+            status_code=503,
+            detail=f"AI servisinde geçici yoğunluk var, lütfen {retry_after} sn sonra tekrar deneyin. Detay: {message}",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    _log(f"{endpoint} hata (500): {message}", level="error")
+    return HTTPException(status_code=500, detail=f"Sınıflandırma başarısız: {message}")
+
+
+def _log_classify_success(endpoint: str, result: dict) -> None:
+    _log(
+        f"{endpoint} başarılı. playlist_id={result.get('playlist_id')}, "
+        f"total_songs={result.get('total_songs')}, total_batches={result.get('total_batches')}, "
+        f"failed_batches={len(result.get('failed_batches', []))}"
+    )
+
+
 @app.post("/classify")
-def classify(data: ClassifyRequest) -> dict:
+async def classify(data: ClassifyRequest) -> dict:
     _log(f"/classify çağrıldı. url={data.playlist_url}, emotions={data.emotions}")
     try:
-        result = process_playlist(data.playlist_url, data.emotions)
-        _log(
-            f"/classify başarılı. playlist_id={result.get('playlist_id')}, "
-            f"total_songs={result.get('total_songs')}, total_batches={result.get('total_batches')}, "
-            f"failed_batches={len(result.get('failed_batches', []))}"
-        )
+        result = await process_playlist_async(data.playlist_url, data.emotions)
+        _log_classify_success("/classify", result)
         return result
-    except ValueError as exc:
-        _log(f"/classify hata (400): {exc}")
-        raise HTTPException(status_code=400, detail=str(exc))
     except Exception as exc:
-        message = str(exc)
-        lowered = message.lower()
+        raise _classify_http_error("/classify", exc)
+
+
+def _encode_stream_event(event: dict, stream_format: str) -> str:
+    payload = json.dumps(event, ensure_ascii=False)
+    if stream_format == "sse":
+        return f"event: {event.get('event', 'message')}\ndata: {payload}\n\n"
+    return payload + "\n"
 
-        if "429" in lowered or "rate-limit" in lowered or "rate limit" in lowered:
-            _log(f"/classify hata (503-rate-limit): {message}")
-            raise HTTPException(status_code=503, detail=f"AI servisinde geçici yoğunluk var, lütfen 20-60 sn sonra tekrar deneyin. Detay: {message}")
 
-        _log(f"/classify hata (500): {message}")
-        raise HTTPException(status_code=500, detail=f"Sınıflandırma başarısız: {message}")
+# Batch olayları oluştukları anda NDJSON (varsayılan) ya da SSE (?format=sse) olarak gönderilir.
+# Son satır "result" ya da "error" olayıdır; istemci koparsa sınıflandırma iptal edilir.
+@app.post("/classify/stream")
+async def classify_stream(data: ClassifyRequest, format: str = "ndjson") -> StreamingResponse:
+    stream_format = "sse" if format.lower() == "sse" else "ndjson"
+    _log(f"/classify/stream çağrıldı. url={data.playlist_url}, emotions={data.emotions}, format={stream_format}")
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    # Olaylar hem event loop'tan hem de to_thread içinden gelebilir.
+    def _listener(event: dict | None) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    async def _run() -> None:
+        try:
+            result = await process_playlist_async(data.playlist_url, data.emotions, event_listener=_listener)
+            _log_classify_success("/classify/stream", result)
+            _listener({"event": "result", "result": result})
+        except asyncio.CancelledError:
+            _log("/classify/stream istemci bağlantısı koptu, sınıflandırma iptal edildi", level="warning")
+            raise
+        except Exception as exc:
+            error = _classify_http_error("/classify/stream", exc)
+            _listener({"event": "error", "status_code": error.status_code, "detail": error.detail})
+        finally:
+            _listener(None)
+
+    task = asyncio.create_task(_run())
+
+    async def _events():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=STREAM_HEARTBEAT_SEC)
+                except asyncio.TimeoutError:
+                    yield _encode_stream_event({"event": "heartbeat"}, stream_format)
+                    continue
+
+                if event is None:
+                    break
+                yield _encode_stream_event(event, stream_format)
+        finally:
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream" if stream_format == "sse" else "application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/jobs/classify", status_code=202)
+async def submit_classify_job(data: ClassifyRequest) -> dict:
+    _log(f"/jobs/classify çağrıldı. url={data.playlist_url}, emotions={data.emotions}")
+    return submit_classification_job(data.playlist_url, data.emotions)
+
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str) -> dict:
+    status = job_status(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job bulunamadı")
+    return status
+
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str) -> dict:
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job bulunamadı")
+
+    if job["status"] == "succeeded":
+        return job["result"]
+    if job["status"] == "failed":
+        raise _classify_http_error(f"/jobs/{job_id}/result", job["error"])
+    if job["status"] == "cancelled":
+        raise HTTPException(status_code=410, detail="Job iptal edildi")
+    raise HTTPException(status_code=409, detail=f"Job henüz tamamlanmadı (status={job['status']})")
+
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_classify_job(job_id: str) -> dict:
+    status = cancel_job(job_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Job bulunamadı")
+    return status
 
 
 @app.post("/spotify/token")
-def get_token(data: CodeRequest) -> dict:
+async def get_token(data: CodeRequest) -> dict:
     redirect_uri = (data.redirect_uri or REDIRECT_URI).strip()
     _log(f"/spotify/token çağrıldı. redirect_uri={redirect_uri}")
 
     if not CLIENT_ID or not CLIENT_SECRET:
         raise HTTPException(status_code=500, detail="SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET .env içinde tanımlı olmalı")
 
-    response = requests.post(
-        "https://accounts.spotify.com/api/token",
+    response = await get_async_client().post(
+        SPOTIFY_TOKEN_URL,
         data={
             "grant_type": "authorization_code",
             "code": data.code,
@@ -146,7 +353,6 @@ def get_token(data: CodeRequest) -> dict:
             "client_secret": CLIENT_SECRET,
         },
         headers={"Content-Type": "application/x-www-form-urlencoded"},
-        timeout=30,
     )
 
     if response.status_code != 200:
@@ -154,7 +360,7 @@ def get_token(data: CodeRequest) -> dict:
             detail = response.json()
         except Exception:
             detail = response.text
-        _log(f"/spotify/token hata: status={response.status_code}, detail={detail}")
+        _log(f"/spotify/token hata: status={response.status_code}, detail={detail}", level="warning")
         raise HTTPException(status_code=response.status_code, detail=detail)
 
     _log("/spotify/token başarılı")
@@ -162,7 +368,7 @@ def get_token(data: CodeRequest) -> dict:
 
 
 @app.post("/save_playlists")
-def save_playlists(data: SavePlaylistsRequest) -> dict:
+async def save_playlists(data: SavePlaylistsRequest) -> dict:
     _log(f"/save_playlists çağrıldı. categories={len(data.grouped_tracks)}")
 
     grouped_tracks = {
@@ -171,25 +377,31 @@ def save_playlists(data: SavePlaylistsRequest) -> dict:
     }
 
     try:
-        result = save_grouped_tracks_to_spotify(
-            access_token=data.access_token,
-            grouped_tracks=grouped_tracks,
-            playlist_names=data.playlist_names,
-            public=data.public,
-        )
+        with stage_timer("spotify_save", sum(len(tracks) for tracks in grouped_tracks.values())):
+            result = await save_grouped_tracks_to_spotify_async(
+                access_token=data.access_token,
+                grouped_tracks=grouped_tracks,
+                playlist_names=data.playlist_names,
+                public=data.public,
+                source_playlist_id=data.source_playlist_id,
+                update_existing=data.update_existing,
+            )
         _log(
             f"/save_playlists başarılı. created={len(result.get('created_playlists', []))}, "
-            f"skipped={len(result.get('skipped', []))}"
+            f"skipped={len(result.get('skipped', []))}, failed={len(result.get('failed', []))}"
         )
         return result
     except RuntimeError as exc:
         message = str(exc)
         if "(401)" in message or "invalid access token" in message.lower() or "token expired" in message.lower():
-            _log(f"/save_playlists hata (401): {message}")
+            _log(f"/save_playlists hata (401): {message}", level="warning")
             raise HTTPException(status_code=401, detail=message)
 
-        _log(f"/save_playlists hata (400): {message}")
+        _log(f"/save_playlists hata (400): {message}", level="warning")
         raise HTTPException(status_code=400, detail=message)
+    except ValueError as exc:
+        _log(f"/save_playlists hata (400): {exc}", level="warning")
+        raise HTTPException(status_code=400, detail=str(exc))
     except Exception as exc:
-        _log(f"/save_playlists hata (500): {exc}")
+        _log(f"/save_playlists hata (500): {exc}", level="error")
         raise HTTPException(status_code=500, detail=f"Playlist kaydetme başarısız: {exc}")
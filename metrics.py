@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+METRICS_PREFIX = "spc"
+
+# Saniye cinsinden; Spotify sayfası (ms'ler) ile 10k şarkılık kaydetme (dakikalar) arasını kapsar.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+SIZE_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+def _label_key(labelnames: tuple[str, ...], labels: dict) -> tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple[str, ...], key: tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: tuple[str, ...] = ()) -> None:
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self._values: dict[tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if not METRICS_ENABLED or amount <= 0:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.help_text = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # label anahtarı -> [bucket sayaçları (kümülatif değil)..., +Inf], toplam, adet
+        self._series: dict[tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = _label_key(self.labelnames, labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list[str]:
+        with self._lock:
+            series = sorted((key, (list(counts), total, count)) for key, (counts, total, count) in self._series.items())
+
+        lines = []
+        for key, (counts, total, count) in series:
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, float("inf")), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {round(total, 6)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+# Pipeline'ın ölçülen aşamaları tek yerde tanımlanır; label değerleri sınırlı tutulur (şarkı/playlist id yok).
+STAGE_SECONDS = Histogram("stage_duration_seconds", "Pipeline aşamalarının süresi", ("stage",))
+STAGE_ERRORS = Counter("stage_errors_total", "Hata ile biten aşamalar", ("stage",))
+STAGE_ITEMS = Histogram("stage_items", "Aşama başına işlenen öğe (şarkı/sayfa) sayısı", ("stage",), SIZE_BUCKETS)
+
+OPENROUTER_REQUESTS = Counter("openrouter_requests_total", "OpenRouter istekleri", ("model", "outcome"))
+OPENROUTER_RETRIES = Counter("openrouter_retries_total", "İlk denemeden sonraki OpenRouter denemeleri", ("model",))
+OPENROUTER_RATE_LIMITED = Counter("openrouter_rate_limited_total", "429 / rate limit cevapları", ("model",))
+OPENROUTER_TOKENS = Counter("openrouter_tokens_total", "OpenRouter usage alanındaki token sayıları", ("model", "kind"))
+OPENROUTER_USAGE_MISSING = Counter(
+    "openrouter_usage_missing_total", "usage alanı gelmeyen cevaplar (erken kapanan stream vb.)", ("model",)
+)
+
+CLASSIFY_BATCHES = Counter("classify_batches_total", "Tamamlanan batch'ler", ("status",))
+CLASSIFY_SONGS = Counter("classify_songs_total", "Etiket kaynağına göre şarkılar", ("source",))
+
+SPOTIFY_SAVE_REQUESTS = Counter("spotify_save_requests_total", "Kaydetme sırasında yapılan Spotify istekleri", ("kind",))
+
+_REGISTRY = [
+    STAGE_SECONDS,
+    STAGE_ERRORS,
+    STAGE_ITEMS,
+    OPENROUTER_REQUESTS,
+    OPENROUTER_RETRIES,
+    OPENROUTER_RATE_LIMITED,
+    OPENROUTER_TOKENS,
+    OPENROUTER_USAGE_MISSING,
+    CLASSIFY_BATCHES,
+    CLASSIFY_SONGS,
+    SPOTIFY_SAVE_REQUESTS,
+]
+
+
+@contextmanager
+def stage_timer(stage: str, items: int | None = None):
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+        if items is not None:
+            STAGE_ITEMS.observe(items, stage=stage)
+
+
+def record_usage(model: str, usage: dict | None) -> None:
+    if not isinstance(usage, dict):
+        OPENROUTER_USAGE_MISSING.inc(model=model)
+        return
+    for kind in ("prompt_tokens", "completion_tokens"):
+        value = usage.get(kind)
+        if isinstance(value, (int, float)):
+            OPENROUTER_TOKENS.inc(value, model=model, kind=kind.removesuffix("_tokens"))
+
+
+# Prometheus text exposition formatı (0.0.4).
+def render_prometheus() -> str:
+    lines: list[str] = []
+    for metric in _REGISTRY:
+        lines.append(f"# HELP {metric.name} {metric.help_text}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
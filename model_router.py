@@ -0,0 +1,84 @@
+import os
+import threading
+from collections import deque
+
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemma-3-27b-it:free")
+# Sıralı model listesi: ilk model birincil, sonrakiler hedge/failover için. Boşsa OPENROUTER_MODEL kullanılır.
+OPENROUTER_MODELS = [
+    model.strip() for model in os.getenv("OPENROUTER_MODELS", "").split(",") if model.strip()
+] or [OPENROUTER_MODEL]
+OPENROUTER_HEDGE_ENABLED = os.getenv("OPENROUTER_HEDGE_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+OPENROUTER_HEDGE_PERCENTILE = float(os.getenv("OPENROUTER_HEDGE_PERCENTILE", "90"))
+OPENROUTER_HEDGE_MIN_SAMPLES = int(os.getenv("OPENROUTER_HEDGE_MIN_SAMPLES", "5"))
+OPENROUTER_HEDGE_DEFAULT_DELAY_SEC = float(os.getenv("OPENROUTER_HEDGE_DEFAULT_DELAY_SEC", "20"))
+OPENROUTER_HEDGE_MIN_DELAY_SEC = float(os.getenv("OPENROUTER_HEDGE_MIN_DELAY_SEC", "2"))
+
+# Cache ve benzeri anahtarlar için model yapılandırmasının kimliği; tek modelde OPENROUTER_MODEL'e eşittir.
+MODEL_SET_KEY = ",".join(OPENROUTER_MODELS)
+
+_WINDOW = 100
+
+
+_log = get_logger("model_router.py")
+
+
+# Model başına son başarılı isteklerin süresi; hedge gecikmesi bu pencerenin yüzdeliğinden hesaplanır.
+class ModelLatencyTracker:
+    def __init__(self, window: int) -> None:
+        self.window = window
+        self._samples: dict[str, deque[float]] = {}
+        self._counts: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def _counts_locked(self, model: str) -> dict[str, int]:
+        return self._counts.setdefault(model, {"served": 0, "errors": 0, "hedged": 0, "hedge_wins": 0})
+
+    def record(self, model: str, latency_sec: float) -> None:
+        with self._lock:
+            self._samples.setdefault(model, deque(maxlen=self.window)).append(latency_sec)
+
+    def count(self, model: str, key: str) -> None:
+        with self._lock:
+            self._counts_locked(model)[key] += 1
+
+    def percentile(self, model: str, percentile: float) -> float | None:
+        with self._lock:
+            samples = sorted(self._samples.get(model, ()))
+        if len(samples) < OPENROUTER_HEDGE_MIN_SAMPLES:
+            return None
+        rank = min(len(samples) - 1, max(0, round(percentile / 100 * (len(samples) - 1))))
+        return samples[rank]
+
+    def hedge_delay(self, model: str) -> float:
+        observed = self.percentile(model, OPENROUTER_HEDGE_PERCENTILE)
+        if observed is None:
+            return OPENROUTER_HEDGE_DEFAULT_DELAY_SEC
+        return max(OPENROUTER_HEDGE_MIN_DELAY_SEC, observed)
+
+    def stats(self) -> dict:
+        models = {}
+        for model in OPENROUTER_MODELS:
+            with self._lock:
+                samples = list(self._samples.get(model, ()))
+                counts = dict(self._counts_locked(model))
+            models[model] = {
+                **counts,
+                "samples": len(samples),
+                "p50_sec": self.percentile(model, 50),
+                f"p{OPENROUTER_HEDGE_PERCENTILE:g}_sec": self.percentile(model, OPENROUTER_HEDGE_PERCENTILE),
+                "hedge_delay_sec": round(self.hedge_delay(model), 2),
+            }
+        return {"hedging": hedging_enabled(), "models": models}
+
+
+def hedging_enabled() -> bool:
+    return OPENROUTER_HEDGE_ENABLED and len(OPENROUTER_MODELS) > 1
+
+
+model_latency = ModelLatencyTracker(_WINDOW)
@@ -0,0 +1,181 @@
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.getenv("CACHE_DIR", os.path.join(BASE_DIR, "cache"))
+
+PLAYLIST_CACHE_ENABLED = os.getenv("PLAYLIST_CACHE_ENABLED", "1").strip().lower() in {"1", "true", "yes", "on"}
+PLAYLIST_CACHE_MAX_TRACKS = int(os.getenv("PLAYLIST_CACHE_MAX_TRACKS", "100000"))
+PLAYLIST_CACHE_DISK = os.getenv("PLAYLIST_CACHE_DISK", "0").strip().lower() in {"1", "true", "yes", "on"}
+PLAYLIST_CACHE_DIR = os.path.join(CACHE_DIR, "playlists")
+PLAYLIST_SAVED_CACHE_MAX_TRACKS = int(os.getenv("PLAYLIST_SAVED_CACHE_MAX_TRACKS", "50000"))
+
+_lock = threading.Lock()
+# playlist_id -> (snapshot_id, tracks); en son kullanılan sonda.
+_entries: "OrderedDict[str, tuple[str, list[dict]]]" = OrderedDict()
+_total_tracks = 0
+_stats = {"hits": 0, "misses": 0, "disk_hits": 0, "evictions": 0}
+
+# Uygulamanın kendi kaydettiği playlist'lerin uri listeleri ayrı tutulur: sınıflandırma için okunan şarkı
+# kayıtlarıyla aynı playlist_id/snapshot_id altında karışmaz, onların bütçesinden yer yemez.
+# playlist_id -> (snapshot_id, uris); en son kullanılan sonda.
+_saved: "OrderedDict[str, tuple[str, tuple[str, ...]]]" = OrderedDict()
+_saved_total = 0
+_saved_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+
+_log = get_logger("playlist_cache.py")
+
+
+def _disk_path(playlist_id: str) -> str:
+    return os.path.join(PLAYLIST_CACHE_DIR, f"{playlist_id}.json.gz")
+
+
+def _copy_tracks(tracks: list[dict]) -> list[dict]:
+    return [dict(track) for track in tracks]
+
+
+def _read_disk(playlist_id: str, snapshot_id: str) -> list[dict] | None:
+    path = _disk_path(playlist_id)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as exc:
+        _log(f"Disk cache okunamadı ({playlist_id}): {exc}", level="warning")
+        return None
+    if data.get("snapshot_id") != snapshot_id:
+        return None
+    return data.get("tracks") or []
+
+
+def _write_disk(playlist_id: str, snapshot_id: str, tracks: list[dict]) -> None:
+    try:
+        os.makedirs(PLAYLIST_CACHE_DIR, exist_ok=True)
+        tmp_path = _disk_path(playlist_id) + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+            json.dump({"snapshot_id": snapshot_id, "tracks": tracks}, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, _disk_path(playlist_id))
+    except Exception as exc:
+        _log(f"Disk cache yazılamadı ({playlist_id}): {exc}", level="warning")
+
+
+def _store_locked(playlist_id: str, snapshot_id: str, tracks: list[dict]) -> None:
+    global _total_tracks
+    previous = _entries.pop(playlist_id, None)
+    if previous is not None:
+        _total_tracks -= len(previous[1])
+
+    if PLAYLIST_CACHE_MAX_TRACKS > 0 and len(tracks) > PLAYLIST_CACHE_MAX_TRACKS:
+        return
+
+    _entries[playlist_id] = (snapshot_id, tracks)
+    _total_tracks += len(tracks)
+
+    while _total_tracks > PLAYLIST_CACHE_MAX_TRACKS > 0 and _entries:
+        evicted_id, (_, evicted_tracks) = _entries.popitem(last=False)
+        _total_tracks -= len(evicted_tracks)
+        _stats["evictions"] += 1
+        _log(f"Playlist cache'ten çıkarıldı: {evicted_id} ({len(evicted_tracks)} şarkı)")
+
+
+def get_cached_playlist(playlist_id: str, snapshot_id: str | None) -> list[dict] | None:
+    if not PLAYLIST_CACHE_ENABLED or not snapshot_id:
+        return None
+
+    with _lock:
+        entry = _entries.get(playlist_id)
+        if entry is not None and entry[0] == snapshot_id:
+            _entries.move_to_end(playlist_id)
+            _stats["hits"] += 1
+            return _copy_tracks(entry[1])
+
+    if PLAYLIST_CACHE_DISK:
+        tracks = _read_disk(playlist_id, snapshot_id)
+        if tracks is not None:
+            with _lock:
+                _store_locked(playlist_id, snapshot_id, tracks)
+                _stats["hits"] += 1
+                _stats["disk_hits"] += 1
+            return _copy_tracks(tracks)
+
+    with _lock:
+        _stats["misses"] += 1
+    return None
+
+
+def store_cached_playlist(playlist_id: str, snapshot_id: str | None, tracks: list[dict]) -> None:
+    if not PLAYLIST_CACHE_ENABLED or not snapshot_id:
+        return
+
+    stored = _copy_tracks(tracks)
+    with _lock:
+        _store_locked(playlist_id, snapshot_id, stored)
+
+    if PLAYLIST_CACHE_DISK:
+        _write_disk(playlist_id, snapshot_id, stored)
+
+
+def get_saved_uris(playlist_id: str, snapshot_id: str | None) -> list[str] | None:
+    if not PLAYLIST_CACHE_ENABLED or not snapshot_id:
+        return None
+
+    with _lock:
+        entry = _saved.get(playlist_id)
+        if entry is not None and entry[0] == snapshot_id:
+            _saved.move_to_end(playlist_id)
+            _saved_stats["hits"] += 1
+            return list(entry[1])
+        _saved_stats["misses"] += 1
+    return None
+
+
+def store_saved_uris(playlist_id: str, snapshot_id: str | None, uris: list[str]) -> None:
+    global _saved_total
+    if not PLAYLIST_CACHE_ENABLED or not snapshot_id:
+        return
+    if not all(isinstance(uri, str) for uri in uris):
+        _log(f"Kaydedilen playlist içeriği geçersiz, cache'e yazılmadı: {playlist_id}", level="warning")
+        return
+
+    with _lock:
+        previous = _saved.pop(playlist_id, None)
+        if previous is not None:
+            _saved_total -= len(previous[1])
+        if PLAYLIST_SAVED_CACHE_MAX_TRACKS > 0 and len(uris) > PLAYLIST_SAVED_CACHE_MAX_TRACKS:
+            return
+
+        _saved[playlist_id] = (snapshot_id, tuple(uris))
+        _saved_total += len(uris)
+        while _saved_total > PLAYLIST_SAVED_CACHE_MAX_TRACKS > 0 and _saved:
+            _, (_, evicted) = _saved.popitem(last=False)
+            _saved_total -= len(evicted)
+            _saved_stats["evictions"] += 1
+
+
+def playlist_cache_stats() -> dict:
+    with _lock:
+        return {
+            **_stats,
+            "entries": len(_entries),
+            "tracks": _total_tracks,
+            "max_tracks": PLAYLIST_CACHE_MAX_TRACKS,
+            "enabled": PLAYLIST_CACHE_ENABLED,
+            "disk": PLAYLIST_CACHE_DISK,
+            "saved": {
+                **_saved_stats,
+                "entries": len(_saved),
+                "tracks": _saved_total,
+                "max_tracks": PLAYLIST_SAVED_CACHE_MAX_TRACKS,
+            },
+        }
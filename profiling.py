@@ -0,0 +1,121 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0").strip().lower() in {"1", "true", "yes", "on"}
+PROFILING_DIR = os.getenv("PROFILING_DIR", os.path.join(BASE_DIR, "datas", "profiles"))
+PROFILING_MAX_FILES = max(1, int(os.getenv("PROFILING_MAX_FILES", "20")))
+PROFILING_TOP_FUNCTIONS = int(os.getenv("PROFILING_TOP_FUNCTIONS", "60"))
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAM = "profile"
+
+# cProfile thread başına tek profiler kabul eder; aynı anda sadece bir istek profillenir.
+_slot = threading.Lock()
+_ring_lock = threading.Lock()
+_stats = {"captured": 0, "skipped_busy": 0, "written": 0, "pruned": 0, "errors": 0}
+
+_log = get_logger("profiling.py")
+
+
+def profiling_requested(headers, query_params) -> bool:
+    if not PROFILING_ENABLED:
+        return False
+    value = headers.get(PROFILE_HEADER) or query_params.get(PROFILE_QUERY_PARAM) or ""
+    return value.strip().lower() in {"1", "true", "yes", "on"}
+
+
+# Profil slotu doluysa None döner; istek profilsiz devam eder.
+def start_profile() -> cProfile.Profile | None:
+    if not _slot.acquire(blocking=False):
+        _stats["skipped_busy"] += 1
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except Exception:
+        _slot.release()
+        raise
+    return profiler
+
+
+def stop_profile(profiler: cProfile.Profile) -> None:
+    try:
+        profiler.disable()
+    finally:
+        _slot.release()
+        _stats["captured"] += 1
+
+
+def _summary_text(profiler: cProfile.Profile, header: dict) -> str:
+    buffer = io.StringIO()
+    for key, value in header.items():
+        buffer.write(f"{key}: {value}\n")
+    buffer.write("\n")
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILING_TOP_FUNCTIONS)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(PROFILING_TOP_FUNCTIONS // 2)
+    return buffer.getvalue()
+
+
+def _prune_ring() -> None:
+    traces = sorted(name for name in os.listdir(PROFILING_DIR) if name.endswith(".prof"))
+    for name in traces[: max(0, len(traces) - PROFILING_MAX_FILES)]:
+        base = os.path.join(PROFILING_DIR, name[: -len(".prof")])
+        for path in (f"{base}.prof", f"{base}.txt"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        _stats["pruned"] += 1
+
+
+# Ham pstats dökümü (.prof, snakeviz/pstats ile açılır) ve okunabilir özet (.txt) yan yana yazılır;
+# klasörde en yeni PROFILING_MAX_FILES iz tutulur.
+def save_profile(profiler: cProfile.Profile, request_id: str, path: str, status_code: int, elapsed_sec: float) -> str:
+    endpoint = path.strip("/").replace("/", "_") or "root"
+    base_name = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{endpoint}_{request_id}"
+    base = os.path.join(PROFILING_DIR, base_name)
+    header = {
+        "request_id": request_id,
+        "path": path,
+        "status_code": status_code,
+        "elapsed_sec": round(elapsed_sec, 3),
+        "captured_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    try:
+        with _ring_lock:
+            os.makedirs(PROFILING_DIR, exist_ok=True)
+            profiler.dump_stats(f"{base}.prof")
+            with open(f"{base}.txt", "w", encoding="utf-8") as f:
+                f.write(_summary_text(profiler, header))
+            _stats["written"] += 1
+            _prune_ring()
+    except Exception as exc:
+        _stats["errors"] += 1
+        _log(f"Profil yazılamadı: {exc}", level="error")
+        return ""
+
+    _log(f"Profil kaydedildi: {base_name} ({header['elapsed_sec']}s)")
+    return base_name
+
+
+def profiling_stats() -> dict:
+    return {
+        **_stats,
+        "enabled": PROFILING_ENABLED,
+        "busy": _slot.locked(),
+        "dir": PROFILING_DIR,
+        "max_files": PROFILING_MAX_FILES,
+    }
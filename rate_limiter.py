@@ -0,0 +1,301 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+from dotenv import load_dotenv
+
+from structured_log import get_logger
+
+load_dotenv()
+
+OPENROUTER_RATE_PER_SEC = float(os.getenv("OPENROUTER_RATE_PER_SEC", "2"))
+OPENROUTER_RATE_BURST = float(os.getenv("OPENROUTER_RATE_BURST", "4"))
+OPENROUTER_RATE_MIN_PER_SEC = float(os.getenv("OPENROUTER_RATE_MIN_PER_SEC", "0.1"))
+OPENROUTER_BACKOFF_SEC = float(os.getenv("OPENROUTER_BACKOFF_SEC", "10"))
+OPENROUTER_RETRY_AFTER_MAX_SEC = float(os.getenv("OPENROUTER_RETRY_AFTER_MAX_SEC", "120"))
+OPENROUTER_CIRCUIT_FAILURES = int(os.getenv("OPENROUTER_CIRCUIT_FAILURES", "5"))
+OPENROUTER_CIRCUIT_OPEN_SEC = float(os.getenv("OPENROUTER_CIRCUIT_OPEN_SEC", "30"))
+SPOTIFY_SAVE_RATE_PER_SEC = float(os.getenv("SPOTIFY_SAVE_RATE_PER_SEC", "50"))
+SPOTIFY_SAVE_RATE_BURST = float(os.getenv("SPOTIFY_SAVE_RATE_BURST", "50"))
+SPOTIFY_SAVE_BACKOFF_SEC = float(os.getenv("SPOTIFY_SAVE_BACKOFF_SEC", "5"))
+
+_PROBE_POLL_SEC = 0.2
+
+
+_log = get_logger("rate_limiter.py")
+
+
+# Sağlayıcının geçici olarak istek kabul etmediği durumlar; retry_after saniye sonra tekrar denenebilir.
+class ProviderBusyError(RuntimeError):
+    def __init__(self, message: str, retry_after: float | None = None) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitedError(ProviderBusyError):
+    pass
+
+
+class CircuitOpenError(ProviderBusyError):
+    pass
+
+
+def _header_float(headers, name: str) -> float | None:
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+# Retry-After (saniye ya da HTTP tarihi) yoksa X-RateLimit-Reset'e bakılır; OpenRouter bunu epoch ms
+# olarak döner, bazı sağlayıcılar epoch saniye ya da kalan saniye döner.
+def retry_after_from_headers(headers) -> float | None:
+    if not headers:
+        return None
+
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        seconds = _header_float(headers, "retry-after")
+        if seconds is None:
+            try:
+                seconds = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+            except (TypeError, ValueError):
+                seconds = None
+        if seconds is not None:
+            return min(max(seconds, 0.0), OPENROUTER_RETRY_AFTER_MAX_SEC)
+
+    reset = _header_float(headers, "x-ratelimit-reset")
+    if reset is None:
+        return None
+    if reset > 1e12:
+        reset = reset / 1000 - time.time()
+    elif reset > 1e9:
+        reset -= time.time()
+    return min(max(reset, 0.0), OPENROUTER_RETRY_AFTER_MAX_SEC)
+
+
+# Uyarlanabilir token bucket: 429 gelince hızı yarıya indirir, başarılı isteklerle kademeli toparlanır.
+class TokenBucket:
+    def __init__(self, rate: float, burst: float, min_rate: float, backoff_sec: float, name: str = "bucket") -> None:
+        self.name = name
+        self.max_rate = max(rate, min_rate)
+        self.min_rate = min_rate
+        self.rate = self.max_rate
+        self.burst = max(burst, 1.0)
+        self.backoff_sec = backoff_sec
+        self.tokens = self.burst
+        self.blocked_until = 0.0
+        self.updated_at = time.monotonic()
+        self.rate_limited_count = 0
+        self.quota_limit: float | None = None
+        self.quota_remaining: float | None = None
+        self._cond = threading.Condition()
+
+    def _refill_locked(self, now: float) -> None:
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def _wait_time_locked(self, now: float) -> float:
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill_locked(now)
+        if self.tokens >= 1.0:
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    # Token alınana kadar bekler, beklenen süreyi döndürür.
+    def acquire(self) -> float:
+        started = time.monotonic()
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                wait_sec = self._wait_time_locked(now)
+                if wait_sec <= 0:
+                    self.tokens -= 1.0
+                    return time.monotonic() - started
+                self._cond.wait(wait_sec)
+
+    # Async sürüm: lock sadece hesap için tutulur, bekleme event loop'u bloklamaz.
+    async def acquire_async(self) -> float:
+        started = time.monotonic()
+        while True:
+            with self._cond:
+                wait_sec = self._wait_time_locked(time.monotonic())
+                if wait_sec <= 0:
+                    self.tokens -= 1.0
+                    return time.monotonic() - started
+            await asyncio.sleep(wait_sec)
+
+    def on_success(self) -> None:
+        with self._cond:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate * 0.1)
+
+    # Başarılı cevaplardaki kota başlıkları: pencere tükendiyse sıfırlanana kadar yeni istek gönderilmez,
+    # böylece 429 beklenmeden tüm eşzamanlı istekler birlikte durur.
+    def observe_headers(self, headers) -> None:
+        remaining = _header_float(headers, "x-ratelimit-remaining")
+        if remaining is None:
+            return
+
+        reset_in = retry_after_from_headers({"x-ratelimit-reset": headers.get("x-ratelimit-reset")})
+        with self._cond:
+            self.quota_limit = _header_float(headers, "x-ratelimit-limit")
+            self.quota_remaining = remaining
+            if remaining <= 0 and reset_in:
+                now = time.monotonic()
+                self.blocked_until = max(self.blocked_until, now + reset_in)
+                self.tokens = 0.0
+                self.updated_at = self.blocked_until
+        if remaining <= 0 and reset_in:
+            _log(f"{self.name}: kota penceresi doldu, {reset_in:.1f}s bekleniyor")
+
+    def blocked_for(self) -> float:
+        with self._cond:
+            return max(0.0, self.blocked_until - time.monotonic())
+
+    def on_rate_limited(self, retry_after: float | None = None) -> None:
+        with self._cond:
+            now = time.monotonic()
+            self.rate_limited_count += 1
+            self.rate = max(self.min_rate, self.rate / 2)
+            pause = retry_after if retry_after is not None else self.backoff_sec
+            self.blocked_until = max(self.blocked_until, now + pause)
+            # Duraklama süresince token birikmesin.
+            self.tokens = 0.0
+            self.updated_at = self.blocked_until
+            self._cond.notify_all()
+        _log(f"{self.name}: 429 alındı, rate={self.rate:.2f}/s, {pause:.1f}s duraklatıldı", level="warning")
+
+    def stats(self) -> dict:
+        with self._cond:
+            now = time.monotonic()
+            self._refill_locked(now)
+            return {
+                "rate_per_sec": round(self.rate, 3),
+                "max_rate_per_sec": self.max_rate,
+                "tokens": round(self.tokens, 3),
+                "blocked_for_sec": round(max(0.0, self.blocked_until - now), 3),
+                "rate_limited_count": self.rate_limited_count,
+                "quota_limit": self.quota_limit,
+                "quota_remaining": self.quota_remaining,
+            }
+
+
+# Art arda OPENROUTER_CIRCUIT_FAILURES hata (429, 5xx, zaman aşımı) devreyi açar: açıkken istekler
+# gönderilmeden CircuitOpenError ile reddedilir. Süre dolunca tek bir deneme isteğine izin verilir
+# (half_open), diğerleri sonucunu bekler; başarılı olursa devre kapanır, olmazsa tekrar açılır.
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, open_sec: float, name: str = "circuit") -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_sec = open_sec
+        self.state = "closed"
+        self.failures = 0
+        self.open_until = 0.0
+        self.probe_in_flight = False
+        self.opened_count = 0
+        self.rejected_count = 0
+        self._lock = threading.Lock()
+
+    # 0 dönerse istek gönderilebilir; pozitif değer, deneme isteği sürerken kaç saniye sonra tekrar
+    # sorulacağıdır.
+    def before_request(self) -> float:
+        if self.failure_threshold <= 0:
+            return 0.0
+
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open":
+                if now < self.open_until:
+                    self.rejected_count += 1
+                    raise CircuitOpenError(
+                        f"{self.name} devre kesici açık, sağlayıcı yoğun ({self.open_until - now:.0f}s sonra denenecek)",
+                        self.open_until - now,
+                    )
+                self.state = "half_open"
+                self.probe_in_flight = False
+            if self.state == "half_open":
+                if self.probe_in_flight:
+                    return _PROBE_POLL_SEC
+                self.probe_in_flight = True
+            return 0.0
+
+    def wait(self) -> None:
+        while (wait_sec := self.before_request()) > 0:
+            time.sleep(wait_sec)
+
+    async def wait_async(self) -> None:
+        while (wait_sec := self.before_request()) > 0:
+            await asyncio.sleep(wait_sec)
+
+    def on_success(self) -> None:
+        with self._lock:
+            if self.state != "closed":
+                _log(f"{self.name}: devre kapandı")
+            self.state = "closed"
+            self.failures = 0
+            self.probe_in_flight = False
+
+    def on_failure(self, retry_after: float | None = None) -> None:
+        if self.failure_threshold <= 0:
+            return
+
+        with self._lock:
+            self.failures += 1
+            self.probe_in_flight = False
+            if self.state != "half_open" and self.failures < self.failure_threshold:
+                return
+            pause = max(self.open_sec, retry_after or 0.0)
+            opened = self.state != "open"
+            self.state = "open"
+            self.open_until = max(self.open_until, time.monotonic() + pause)
+            if opened:
+                self.opened_count += 1
+        if opened:
+            _log(f"{self.name}: {self.failures} art arda hata, devre {pause:.1f}s açıldı", level="warning")
+
+    # Deneme isteği sonuçlanmadan iptal edilirse (hedge kaybı vb.) yeni bir denemeye izin verilir.
+    def on_cancelled(self) -> None:
+        with self._lock:
+            self.probe_in_flight = False
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self.open_until - time.monotonic()) if self.state == "open" else 0.0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "open_for_sec": round(max(0.0, self.open_until - time.monotonic()), 3) if self.state == "open" else 0.0,
+                "opened_count": self.opened_count,
+                "rejected_count": self.rejected_count,
+                "failure_threshold": self.failure_threshold,
+            }
+
+
+openrouter_limiter = TokenBucket(
+    OPENROUTER_RATE_PER_SEC,
+    OPENROUTER_RATE_BURST,
+    OPENROUTER_RATE_MIN_PER_SEC,
+    OPENROUTER_BACKOFF_SEC,
+    name="openrouter",
+)
+
+# Playlist kaydetme istekleri (oluşturma, şarkı ekleme) için; Spotify 429'u tüm eşzamanlı kayıtları durdurur.
+spotify_save_limiter = TokenBucket(
+    SPOTIFY_SAVE_RATE_PER_SEC,
+    SPOTIFY_SAVE_RATE_BURST,
+    0.5,
+    SPOTIFY_SAVE_BACKOFF_SEC,
+    name="spotify_save",
+)
+
+openrouter_breaker = CircuitBreaker(OPENROUTER_CIRCUIT_FAILURES, OPENROUTER_CIRCUIT_OPEN_SEC, name="openrouter")
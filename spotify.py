@@ -1,16 +1,56 @@
+import asyncio
+import contextvars
+import hashlib
 import json
 import os
 import re
 import time
-import unicodedata
-from collections import Counter
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime
 from typing import Callable
 
-import requests
 import spotipy
 from dotenv import load_dotenv
-from spotipy.oauth2 import SpotifyClientCredentials
+
+from artifacts import ARTIFACTS_CAPTURE_RAW, new_run_id, prune_artifacts, run_dir, write_artifact
+from audio_scorer import AUDIO_FAST_PATH_THRESHOLD, score_confident
+from batch_planner import batch_planner, estimate_tokens
+from classify_cache import cache_stats, get_cached_labels, store_cached_labels
+from http_pool import async_timeout, close_async_client, get_async_client, get_session, sync_timeout
+from json_stream import IncrementalObjectParser
+from label_index import add_labels, lookup_labels
+from label_mapper import get_label_mapper, normalize_label
+from metrics import (
+    CLASSIFY_BATCHES,
+    CLASSIFY_SONGS,
+    OPENROUTER_RATE_LIMITED,
+    OPENROUTER_REQUESTS,
+    OPENROUTER_RETRIES,
+    SPOTIFY_SAVE_REQUESTS,
+    STAGE_ITEMS,
+    record_usage,
+    stage_timer,
+)
+from model_router import MODEL_SET_KEY, OPENROUTER_MODELS, hedging_enabled, model_latency
+from playlist_cache import (
+    PLAYLIST_CACHE_ENABLED,
+    get_cached_playlist,
+    get_saved_uris,
+    store_cached_playlist,
+    store_saved_uris,
+)
+from spotify_client import SPOTIFY_API_BASE, get_app_token_async, get_spotify_client
+from rate_limiter import (
+    ProviderBusyError,
+    RateLimitedError,
+    openrouter_breaker,
+    openrouter_limiter,
+    retry_after_from_headers,
+    spotify_save_limiter,
+)
+from structured_log import batch_context, get_logger, sample
 
 load_dotenv()
 
@@ -18,35 +58,39 @@ CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
 CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET", "")
 
 OPENROUTER_API_BASE = os.getenv("OPENROUTER_API_BASE", "https://openrouter.ai/api/v1")
-OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "google/gemma-3-27b-it:free")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
 OPENROUTER_MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "3"))
 OPENROUTER_HTTP_REFERER = os.getenv("OPENROUTER_HTTP_REFERER", "http://127.0.0.1:3000")
 OPENROUTER_APP_TITLE = os.getenv("OPENROUTER_APP_TITLE", "Spotify Playlist Classifier")
+OPENROUTER_TIMEOUT_SEC = float(os.getenv("OPENROUTER_TIMEOUT_SEC", "90"))
+OPENROUTER_STREAM = os.getenv("OPENROUTER_STREAM", "1").strip().lower() in {"1", "true", "yes", "on"}
 
-CLASSIFY_BATCH_SIZE = int(os.getenv("CLASSIFY_BATCH_SIZE", "20"))
-CLASSIFY_DELAY_MS = int(os.getenv("CLASSIFY_DELAY_MS", "250"))
+CLASSIFY_CONCURRENCY = int(os.getenv("CLASSIFY_CONCURRENCY", "4"))
+CLASSIFY_SALVAGE_MAX_DEPTH = int(os.getenv("CLASSIFY_SALVAGE_MAX_DEPTH", "3"))
 CLASSIFY_FAIL_ON_BATCH_ERROR = os.getenv("CLASSIFY_FAIL_ON_BATCH_ERROR", "1").strip().lower() in {"1", "true", "yes", "on"}
+# Her batch önce birincil modele gider; batch boyutu planı ve gözlemleri bu modelin anahtarıyla tutulur.
+PLANNER_MODEL = OPENROUTER_MODELS[0]
+_HEDGE_START_POLL_SEC = 0.1
 
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-DATA_DIR = os.path.join(BASE_DIR, "datas")
-os.makedirs(DATA_DIR, exist_ok=True)
+SPOTIFY_MAX_RETRIES = int(os.getenv("SPOTIFY_MAX_RETRIES", "3"))
+SPOTIFY_FETCH_CONCURRENCY = max(1, int(os.getenv("SPOTIFY_FETCH_CONCURRENCY", "4")))
+SPOTIFY_SAVE_CONCURRENCY = max(1, int(os.getenv("SPOTIFY_SAVE_CONCURRENCY", "4")))
+SPOTIFY_ME_CACHE_TTL_SEC = float(os.getenv("SPOTIFY_ME_CACHE_TTL_SEC", "3000"))
+SPOTIFY_ME_CACHE_MAX = 256
 
 
-def _log(message: str) -> None:
-    now = datetime.now().strftime("%H:%M:%S")
-    print(f"[{now}] [spotify.py] {message}", flush=True)
+_log = get_logger("spotify.py")
 
 
-def clean_data_dir() -> None:
-    _log("Veri klasörü temizleniyor...")
-    for filename in os.listdir(DATA_DIR):
-        file_path = os.path.join(DATA_DIR, filename)
-        if os.path.isfile(file_path):
-            try:
-                os.remove(file_path)
-            except Exception:
-                pass
+class ClassificationCancelled(RuntimeError):
+    pass
+
+
+# OpenRouter'ın 429 dışındaki HTTP hataları; status_code kurtarma ve devre kesici kararlarında kullanılır.
+class OpenRouterAPIError(RuntimeError):
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self.status_code = status_code
 
 
 def extract_playlist_id(playlist_url_or_id: str) -> str:
@@ -87,16 +131,24 @@ def _attach_audio_features(sp: spotipy.Spotify, tracks: list[dict]) -> None:
     if not ids:
         return
 
-    feature_map: dict[str, dict] = {}
-    for chunk in _chunked(ids, 100):
+    def _fetch_chunk(chunk: list[str]) -> list[dict]:
         try:
-            features = sp.audio_features(chunk) or []
+            return sp.audio_features(chunk) or []
+        except Exception:
+            return []
+
+    chunks = _chunked(ids, 100)
+    feature_map: dict[str, dict] = {}
+    with ThreadPoolExecutor(max_workers=min(SPOTIFY_FETCH_CONCURRENCY, len(chunks))) as executor:
+        for features in executor.map(_fetch_chunk, chunks):
             for feature in features:
                 if feature and feature.get("id"):
                     feature_map[feature["id"]] = feature
-        except Exception:
-            continue
 
+    _apply_audio_features(tracks, feature_map)
+
+
+def _apply_audio_features(tracks: list[dict], feature_map: dict[str, dict]) -> None:
     for track in tracks:
         track_id = track.get("id")
         feature = feature_map.get(track_id or "")
@@ -122,57 +174,175 @@ def fetch_playlist_tracks(playlist_url_or_id: str) -> list[dict]:
     playlist_id = extract_playlist_id(playlist_url_or_id)
     _log(f"Playlist şarkıları çekiliyor... playlist_id={playlist_id}")
 
-    auth_manager = SpotifyClientCredentials(client_id=CLIENT_ID, client_secret=CLIENT_SECRET)
-    sp = spotipy.Spotify(auth_manager=auth_manager)
+    sp = get_spotify_client()
 
-    results: list[dict] = []
-    offset = 0
-    limit = 100
+    snapshot_id = None
+    if PLAYLIST_CACHE_ENABLED:
+        snapshot_id = (sp.playlist(playlist_id, fields="snapshot_id") or {}).get("snapshot_id")
+        cached = get_cached_playlist(playlist_id, snapshot_id)
+        if cached is not None:
+            _log(f"Playlist cache'ten alındı (snapshot değişmedi). toplam={len(cached)}")
+            return cached
 
-    while True:
-        response = sp.playlist_tracks(
+    def _fetch_page(offset: int) -> dict:
+        return sp.playlist_tracks(
             playlist_id,
             offset=offset,
-            limit=limit,
-            fields="items(track(id,name,artists(name),external_urls(spotify))),next,total",
+            limit=_PLAYLIST_PAGE_SIZE,
+            fields=_PLAYLIST_TRACK_FIELDS,
+        ) or {}
+
+    with stage_timer("spotify_pagination"):
+        first_page = _fetch_page(0)
+        pages = [first_page.get("items", [])]
+        offsets = _remaining_page_offsets(first_page)
+
+        if offsets is None:
+            while len(pages[-1]) == _PLAYLIST_PAGE_SIZE:
+                pages.append(_fetch_page(len(pages) * _PLAYLIST_PAGE_SIZE).get("items", []))
+        elif offsets:
+            # executor.map sonuçları offset sırasıyla döndürür.
+            with ThreadPoolExecutor(max_workers=min(SPOTIFY_FETCH_CONCURRENCY, len(offsets))) as executor:
+                pages.extend(page.get("items", []) for page in executor.map(_fetch_page, offsets))
+    STAGE_ITEMS.observe(len(pages), stage="spotify_pagination")
+
+    results: list[dict] = []
+    for items in pages:
+        _append_playlist_items(results, items)
+
+    with stage_timer("spotify_audio_features", len(results)):
+        _attach_audio_features(sp, results)
+    store_cached_playlist(playlist_id, snapshot_id, results)
+    _log(f"Playlist şarkıları alındı. toplam={len(results)}")
+    return results
+
+
+def _append_playlist_items(results: list[dict], items: list[dict]) -> None:
+    for item in items:
+        track = item.get("track")
+        if not track:
+            continue
+
+        artists = track.get("artists") or []
+        artist_name = artists[0].get("name", "Bilinmeyen") if artists else "Bilinmeyen"
+
+        results.append(
+            {
+                "name": track.get("name", "Bilinmeyen Şarkı"),
+                "artist": artist_name,
+                "id": track.get("id"),
+                "url": (track.get("external_urls") or {}).get("spotify", ""),
+            }
         )
-        items = response.get("items", [])
-        if not items:
-            break
 
-        for item in items:
-            track = item.get("track")
-            if not track:
-                continue
 
-            artists = track.get("artists") or []
-            artist_name = artists[0].get("name", "Bilinmeyen") if artists else "Bilinmeyen"
+_PLAYLIST_TRACK_FIELDS = "items(track(id,name,artists(name),external_urls(spotify))),next,total"
+_PLAYLIST_PAGE_SIZE = 100
 
-            results.append(
-                {
-                    "name": track.get("name", "Bilinmeyen Şarkı"),
-                    "artist": artist_name,
-                    "id": track.get("id"),
-                    "url": (track.get("external_urls") or {}).get("spotify", ""),
-                }
+
+# İlk sayfadaki total ile kalan offset'ler önceden hesaplanır; sondaki boş sayfa isteği yapılmaz.
+# total gelmezse None döner ve sayfalar kısa sayfaya kadar sırayla çekilir.
+def _remaining_page_offsets(first_page: dict) -> list[int] | None:
+    total = first_page.get("total")
+    if not isinstance(total, int):
+        return None
+    return list(range(_PLAYLIST_PAGE_SIZE, total, _PLAYLIST_PAGE_SIZE))
+
+async def _attach_audio_features_async(token: str, tracks: list[dict]) -> None:
+    ids = [track.get("id") for track in tracks if track.get("id")]
+    if not ids:
+        return
+
+    semaphore = asyncio.Semaphore(SPOTIFY_FETCH_CONCURRENCY)
+
+    async def _fetch_chunk(chunk: list[str]) -> list[dict]:
+        async with semaphore:
+            try:
+                data = await _spotify_request_async(
+                    "GET", f"{SPOTIFY_API_BASE}/audio-features", token, params={"ids": ",".join(chunk)}
+                )
+                return data.get("audio_features") or []
+            except Exception:
+                return []
+
+    feature_map: dict[str, dict] = {}
+    for features in await asyncio.gather(*[_fetch_chunk(chunk) for chunk in _chunked(ids, 100)]):
+        for feature in features:
+            if feature and feature.get("id"):
+                feature_map[feature["id"]] = feature
+
+    _apply_audio_features(tracks, feature_map)
+
+
+async def fetch_playlist_tracks_async(playlist_url_or_id: str) -> list[dict]:
+    if not CLIENT_ID or not CLIENT_SECRET:
+        raise ValueError("SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET .env içinde tanımlı olmalı")
+
+    playlist_id = extract_playlist_id(playlist_url_or_id)
+    _log(f"Playlist şarkıları çekiliyor (async)... playlist_id={playlist_id}")
+
+    token = await get_app_token_async()
+
+    snapshot_id = None
+    if PLAYLIST_CACHE_ENABLED:
+        playlist_meta = await _spotify_request_async(
+            "GET", f"{SPOTIFY_API_BASE}/playlists/{playlist_id}", token, params={"fields": "snapshot_id"}
+        )
+        snapshot_id = playlist_meta.get("snapshot_id")
+        cached = await asyncio.to_thread(get_cached_playlist, playlist_id, snapshot_id)
+        if cached is not None:
+            _log(f"Playlist cache'ten alındı (snapshot değişmedi). toplam={len(cached)}")
+            return cached
+
+    semaphore = asyncio.Semaphore(SPOTIFY_FETCH_CONCURRENCY)
+
+    async def _fetch_page(offset: int) -> dict:
+        async with semaphore:
+            return await _spotify_request_async(
+                "GET",
+                f"{SPOTIFY_API_BASE}/playlists/{playlist_id}/tracks",
+                token,
+                params={"offset": offset, "limit": _PLAYLIST_PAGE_SIZE, "fields": _PLAYLIST_TRACK_FIELDS},
             )
 
-        offset += limit
+    with stage_timer("spotify_pagination"):
+        first_page = await _fetch_page(0)
+        pages = [first_page.get("items", [])]
+        offsets = _remaining_page_offsets(first_page)
+
+        if offsets is None:
+            while len(pages[-1]) == _PLAYLIST_PAGE_SIZE:
+                pages.append((await _fetch_page(len(pages) * _PLAYLIST_PAGE_SIZE)).get("items", []))
+        elif offsets:
+            pages.extend(
+                page.get("items", []) for page in await asyncio.gather(*[_fetch_page(offset) for offset in offsets])
+            )
+    STAGE_ITEMS.observe(len(pages), stage="spotify_pagination")
 
-    _attach_audio_features(sp, results)
+    results: list[dict] = []
+    for items in pages:
+        _append_playlist_items(results, items)
+
+    with stage_timer("spotify_audio_features", len(results)):
+        await _attach_audio_features_async(token, results)
+    await asyncio.to_thread(store_cached_playlist, playlist_id, snapshot_id, results)
     _log(f"Playlist şarkıları alındı. toplam={len(results)}")
     return results
 
 
-def _create_prompt(batch: list[dict], emotions: list[str]) -> str:
-    prompt = [
+# Prompt metni ya da etiket çıkarımı değiştiğinde artırılmalı; cache anahtarının parçası.
+PROMPT_VERSION = "1"
+
+
+def _prompt_header(emotions: list[str], song_count: int) -> list[str]:
+    return [
         "You are an expert music mood classifier.",
         "Classify each song into exactly one allowed mood label.",
         "Accuracy is critical. Keep song order exactly the same.",
         "Never invent labels outside allowed list.",
         "",
         f"Allowed labels: {', '.join(emotions)}",
-        f"You must return exactly {len(batch)} items.",
+        f"You must return exactly {song_count} items.",
         "",
         "Return ONLY JSON in this schema:",
         '{"labels": [{"index": 1, "label": "<allowed_label>", "confidence": 0.00, "reason": "short"}]}',
@@ -181,17 +351,25 @@ def _create_prompt(batch: list[dict], emotions: list[str]) -> str:
         "Songs:",
     ]
 
-    for i, song in enumerate(batch, 1):
-        features = song.get("audio_features") or {}
-        feature_text = (
-            f"valence={features.get('valence')}, energy={features.get('energy')}, danceability={features.get('danceability')}, "
-            f"acousticness={features.get('acousticness')}, instrumentalness={features.get('instrumentalness')}, tempo={features.get('tempo')}"
-            if features
-            else "no-audio-features"
-        )
-        prompt.append(f"{i}. {song['name']} - {song['artist']} | {feature_text}")
 
-    return "\n".join(prompt)
+def _song_prompt_line(position: int, song: dict) -> str:
+    features = song.get("audio_features") or {}
+    feature_text = (
+        f"valence={features.get('valence')}, energy={features.get('energy')}, danceability={features.get('danceability')}, "
+        f"acousticness={features.get('acousticness')}, instrumentalness={features.get('instrumentalness')}, tempo={features.get('tempo')}"
+        if features
+        else "no-audio-features"
+    )
+    return f"{position}. {song['name']} - {song['artist']} | {feature_text}"
+
+
+def _create_prompt(batch: list[dict], emotions: list[str]) -> str:
+    with stage_timer("prompt_build", len(batch)):
+        prompt = _prompt_header(emotions, len(batch))
+        for i, song in enumerate(batch, 1):
+            prompt.append(_song_prompt_line(i, song))
+
+        return "\n".join(prompt)
 
 
 def _safe_extract_json(text: str) -> str:
@@ -210,58 +388,15 @@ def _safe_extract_json(text: str) -> str:
     return text
 
 
-def _normalize_text(value: str) -> str:
-    base = (value or "").strip().lower()
-    normalized = unicodedata.normalize("NFKD", base)
-    return "".join(ch for ch in normalized if not unicodedata.combining(ch))
-
-
-def _map_label_to_allowed(label: str, emotions: list[str], fallback: str) -> str:
-    raw = (label or "").strip().lower()
-    if not raw:
-        return fallback
-
-    allowed_exact = {emotion.lower(): emotion for emotion in emotions}
-    if raw in allowed_exact:
-        return allowed_exact[raw].lower()
-
-    raw_norm = _normalize_text(raw)
-    allowed_norm = {_normalize_text(emotion): emotion.lower() for emotion in emotions}
-
-    if raw_norm in allowed_norm:
-        return allowed_norm[raw_norm]
-
-    synonym_base = {
-        "happy": "mutlu",
-        "joyful": "mutlu",
-        "sad": "üzgün",
-        "upset": "üzgün",
-        "melancholic": "üzgün",
-        "energetic": "enerjik",
-        "energy": "enerjik",
-        "calm": "sakin",
-        "chill": "sakin",
-        "romantic": "romantik",
-        "cheerful": "neşeli",
-        "neseli": "neşeli",
-    }
-
-    syn = synonym_base.get(raw_norm)
-    if syn:
-        syn_norm = _normalize_text(syn)
-        if syn_norm in allowed_norm:
-            return allowed_norm[syn_norm]
-
-    for norm_allowed, emotion in allowed_norm.items():
-        if norm_allowed in raw_norm or raw_norm in norm_allowed:
-            return emotion
-
-    return fallback
+def _item_index(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
 
 
-def _parse_labels(raw_text: str, emotions: list[str], expected_count: int) -> list[str]:
-    fallback = emotions[0]
-    parsed: list[str] = []
+def _extract_raw_labels(raw_text: str) -> list[tuple[int | None, str]]:
+    parsed: list[tuple[int | None, str]] = []
 
     try:
         maybe_json = _safe_extract_json(raw_text)
@@ -282,26 +417,47 @@ def _parse_labels(raw_text: str, emotions: list[str], expected_count: int) -> li
                 if isinstance(item, dict):
                     label = str(item.get("label") or item.get("emotion") or item.get("category") or "").strip().lower()
                     if label:
-                        parsed.append(label)
+                        parsed.append((_item_index(item.get("index")), label))
                 elif isinstance(item, str):
-                    parsed.append(item.strip().lower())
+                    parsed.append((None, item.strip().lower()))
     except Exception:
         pass
 
     if not parsed:
         cleaned = (raw_text or "").replace("\n", ",")
-        parsed = [part.strip().lower() for part in cleaned.split(",") if part.strip()]
+        parsed = [(None, part.strip().lower()) for part in cleaned.split(",") if part.strip()]
 
-    normalized: list[str] = []
-    for label in parsed:
-        normalized.append(_map_label_to_allowed(label, emotions, fallback))
+    return parsed
 
-    if len(normalized) < expected_count:
-        normalized.extend([fallback] * (expected_count - len(normalized)))
-    elif len(normalized) > expected_count:
-        normalized = normalized[:expected_count]
 
-    return normalized
+# Cevaptaki index alanlarını 0 tabanlı pozisyonlara çevirir. Index'ler tekrarsız ve 1..n aralığındaysa
+# olduğu gibi (eksikler sonra tekrar sorulur), 0..n-1 aralığındaysa model 0 tabanlı saymış kabul edilip
+# kaydırılır. Hiç index yoksa ya da index kümesi tutarsızsa (tekrar, aralık dışı, index'siz öğe) kısmi eşleşmeye
+# güvenilmez: tam n etiket geldiyse sıraya göre yerleştirilir, gelmediyse hiçbiri kullanılmaz.
+def _label_positions(items: list[tuple[int | None, str]], expected_count: int) -> list[tuple[int, str]]:
+    indices = [index for index, _ in items]
+    if any(index is not None for index in indices) and None not in indices and len(set(indices)) == len(indices):
+        if 1 <= min(indices) and max(indices) <= expected_count:
+            return [(index - 1, label) for index, label in items]
+        if min(indices) == 0 and max(indices) < expected_count:
+            return list(items)
+    elif all(index is None for index in indices):
+        return [(position, label) for position, (_, label) in enumerate(items[:expected_count])]
+
+    if len(items) == expected_count:
+        return [(position, label) for position, (_, label) in enumerate(items)]
+    return []
+
+
+# Prompt'taki 1 tabanlı index alanıyla eşleştirir; etiketlenmeyen ya da izinli listeye uymayan
+# pozisyonlar None kalır ve sadece onlar tekrar sorulur.
+def _parse_indexed_labels(raw_text: str, emotions: list[str], expected_count: int) -> list[str | None]:
+    labels: list[str | None] = [None] * expected_count
+    mapper = get_label_mapper(emotions)
+    for position, raw_label in _label_positions(_extract_raw_labels(raw_text), expected_count):
+        labels[position] = mapper.map(raw_label)
+
+    return labels
 
 
 def _extract_openrouter_text(data: dict) -> str:
@@ -327,7 +483,7 @@ def _extract_openrouter_text(data: dict) -> str:
     return ""
 
 
-def _openrouter_request(prompt: str) -> tuple[str, dict, str]:
+def _openrouter_call_args(prompt: str, model: str) -> tuple[str, dict, dict]:
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY eksik")
 
@@ -343,17 +499,21 @@ def _openrouter_request(prompt: str) -> tuple[str, dict, str]:
         headers["X-Title"] = OPENROUTER_APP_TITLE
 
     payload = {
-        "model": OPENROUTER_MODEL,
+        "model": model,
         "temperature": 0.0,
         "messages": [{"role": "user", "content": prompt}],
     }
+    return url, headers, payload
 
-    response = requests.post(url, headers=headers, json=payload, timeout=90)
-    if response.status_code >= 400:
-        raise RuntimeError(f"OpenRouter API error {response.status_code}: {response.text}")
 
-    raw_http_text = response.text
-    data = response.json()
+def _openrouter_response(status_code: int, raw_http_text: str, headers) -> tuple[str, dict, str]:
+    openrouter_limiter.observe_headers(headers)
+    if status_code == 429:
+        raise RateLimitedError(f"OpenRouter API error 429: {raw_http_text}", retry_after_from_headers(headers))
+    if status_code >= 400:
+        raise OpenRouterAPIError(f"OpenRouter API error {status_code}: {raw_http_text}", status_code)
+
+    data = json.loads(raw_http_text)
     text = _extract_openrouter_text(data)
     if not text:
         raise RuntimeError(f"OpenRouter boş içerik döndü: {data}")
@@ -361,34 +521,633 @@ def _openrouter_request(prompt: str) -> tuple[str, dict, str]:
     return text, data, raw_http_text
 
 
-def _openrouter_generate_json(prompt: str) -> tuple[str, dict, str, int, str]:
-    last_error = ""
+# SSE satırlarını toplar, içerik parçalarını artımlı parser'a verir. 1..expected_count aralığındaki
+# her index gelince done=True olur ve istek erkenden kapatılır.
+class _CompletionStream:
+    def __init__(self, on_item: Callable[[dict], None] | None, expected_count: int) -> None:
+        self.on_item = on_item
+        self.expected_count = expected_count
+        self.parser = IncrementalObjectParser("label")
+        self.items: list[dict] = []
+        self.seen_indices: set[int] = set()
+        self.raw_lines: list[str] = []
+        self.meta: dict = {}
+        self.usage: dict | None = None
+        self.done = False
+        self.cut_short = False
+
+    def feed_line(self, line: str) -> bool:
+        if not line:
+            return self.done
+        self.raw_lines.append(line)
+        if not line.startswith("data:"):
+            return self.done
+
+        data = line[5:].strip()
+        if data == "[DONE]":
+            self.done = True
+            return True
+
+        chunk = json.loads(data)
+        if chunk.get("error"):
+            error = chunk["error"]
+            status = (_item_index(error.get("code")) if isinstance(error, dict) else None) or 500
+            if status == 429:
+                raise RateLimitedError(f"OpenRouter API error 429: {data}")
+            raise OpenRouterAPIError(f"OpenRouter API error {status}: {data}", status)
+        self.meta = {key: chunk[key] for key in ("id", "model", "created") if key in chunk} or self.meta
+        if isinstance(chunk.get("usage"), dict):
+            self.usage = chunk["usage"]
+
+        delta = ((chunk.get("choices") or [{}])[0] or {}).get("delta") or {}
+        content = delta.get("content")
+        if isinstance(content, str) and content:
+            for item in self.parser.feed(content):
+                self.items.append(item)
+                # Sadece aralıktaki index'ler sayılır; aralık dışı ya da tekrar eden index'ler erken kapatmaz.
+                index = _item_index(item.get("index"))
+                if index is not None and 1 <= index <= self.expected_count:
+                    self.seen_indices.add(index)
+                if self.on_item:
+                    self.on_item(item)
+
+        if self.expected_count and len(self.seen_indices) >= self.expected_count:
+            self.done = True
+            self.cut_short = True
+        return self.done
+
+    def result(self) -> tuple[str, dict, str]:
+        # Erken kesilen cevabın kapanış parantezleri gelmemiştir; toplanan nesnelerden geçerli JSON kurulur.
+        text = json.dumps({"labels": self.items}, ensure_ascii=False) if self.cut_short else self.parser.text.strip()
+        if not text:
+            raise RuntimeError(f"OpenRouter boş içerik döndü (stream): {self.meta}")
+
+        data = {
+            **self.meta,
+            "streamed": True,
+            "cut_short": self.cut_short,
+            **({"usage": self.usage} if self.usage else {}),
+            "choices": [{"message": {"role": "assistant", "content": text}}],
+        }
+        return text, data, "\n".join(self.raw_lines)
+
+
+def _is_event_stream(headers) -> bool:
+    return "text/event-stream" in (headers.get("content-type") or "")
+
+
+# Hedge'i kaybeden isteğin kapatılması için; stream okunurken kontrol edilir.
+class _HedgeCancelled(RuntimeError):
+    pass
+
+
+def _openrouter_request(
+    prompt: str,
+    model: str,
+    on_item: Callable[[dict], None] | None = None,
+    expected_count: int = 0,
+    cancel_event: threading.Event | None = None,
+) -> tuple[str, dict, str]:
+    url, headers, payload = _openrouter_call_args(prompt, model)
+    if not OPENROUTER_STREAM:
+        response = get_session().post(url, headers=headers, json=payload, timeout=sync_timeout(OPENROUTER_TIMEOUT_SEC))
+        return _openrouter_response(response.status_code, response.text, response.headers)
+
+    payload["stream"] = True
+    with get_session().post(
+        url, headers=headers, json=payload, timeout=sync_timeout(OPENROUTER_TIMEOUT_SEC), stream=True
+    ) as response:
+        # Hata cevapları ve stream'i desteklemeyen sağlayıcılar tek parça JSON döner.
+        if response.status_code >= 400 or not _is_event_stream(response.headers):
+            return _openrouter_response(response.status_code, response.text, response.headers)
+
+        openrouter_limiter.observe_headers(response.headers)
+        # SSE her zaman UTF-8'dir; charset'siz text/event-stream'i requests ISO-8859-1 sayar ve "üzgün"
+        # gibi etiketler bozulur.
+        response.encoding = "utf-8"
+        stream = _CompletionStream(on_item, expected_count)
+        for line in response.iter_lines(decode_unicode=True):
+            if cancel_event is not None and cancel_event.is_set():
+                raise _HedgeCancelled(f"{model} isteği iptal edildi")
+            if stream.feed_line(line):
+                break
+        return stream.result()
+
+
+async def _openrouter_request_async(
+    prompt: str, model: str, on_item: Callable[[dict], None] | None = None, expected_count: int = 0
+) -> tuple[str, dict, str]:
+    url, headers, payload = _openrouter_call_args(prompt, model)
+    client = get_async_client()
+    if not OPENROUTER_STREAM:
+        response = await client.post(url, headers=headers, json=payload, timeout=async_timeout(OPENROUTER_TIMEOUT_SEC))
+        return _openrouter_response(response.status_code, response.text, response.headers)
+
+    payload["stream"] = True
+    async with client.stream(
+        "POST", url, headers=headers, json=payload, timeout=async_timeout(OPENROUTER_TIMEOUT_SEC)
+    ) as response:
+        if response.status_code >= 400 or not _is_event_stream(response.headers):
+            await response.aread()
+            return _openrouter_response(response.status_code, response.text, response.headers)
+
+        openrouter_limiter.observe_headers(response.headers)
+        stream = _CompletionStream(on_item, expected_count)
+        async for line in response.aiter_lines():
+            if stream.feed_line(line):
+                break
+        return stream.result()
+
+
+def _on_openrouter_success(model: str, request_sec: float, raw_data: dict) -> None:
+    openrouter_limiter.on_success()
+    openrouter_breaker.on_success()
+    model_latency.record(model, request_sec)
+    OPENROUTER_REQUESTS.inc(model=model, outcome="ok")
+    record_usage(model, raw_data.get("usage"))
+
+
+# Hatayı paylaşılan limiter ve devre kesiciye bildirir; rate limit ise True döner (bekleme limiter'dadır).
+def _on_openrouter_error(exc: Exception, model: str) -> bool:
+    model_latency.count(model, "errors")
+    if isinstance(exc, RateLimitedError):
+        OPENROUTER_REQUESTS.inc(model=model, outcome="rate_limited")
+        OPENROUTER_RATE_LIMITED.inc(model=model)
+        openrouter_limiter.on_rate_limited(exc.retry_after)
+        openrouter_breaker.on_failure(exc.retry_after)
+        return True
+    OPENROUTER_REQUESTS.inc(model=model, outcome="error")
+    # İstemci hataları (kimlik, kota, geçersiz istek) sağlayıcı yoğunluğu sayılmaz; ama half-open deneme
+    # isteğiyse slot bırakılmalı, yoksa sonraki istekler devrenin önünde sonsuza dek bekler.
+    if isinstance(exc, OpenRouterAPIError) and 400 <= exc.status_code < 500:
+        openrouter_breaker.on_cancelled()
+    else:
+        openrouter_breaker.on_failure()
+    return False
+
+
+def _openrouter_generate_json(
+    prompt: str,
+    model: str,
+    on_item: Callable[[dict], None] | None = None,
+    expected_count: int = 0,
+    cancel_event: threading.Event | None = None,
+    on_start: Callable[[], None] | None = None,
+) -> tuple[str, dict, str, int, str, float]:
+    last_error: Exception | None = None
 
     for attempt in range(1, OPENROUTER_MAX_RETRIES + 1):
+        if cancel_event is not None and cancel_event.is_set():
+            raise _HedgeCancelled(f"{model} isteği iptal edildi")
+        # Devre açıksa istek gönderilmeden hata döner; batch doğrudan fallback'e düşer.
+        openrouter_breaker.wait()
+
         try:
-            _log(f"OpenRouter isteği gönderiliyor attempt={attempt} model={OPENROUTER_MODEL}")
-            text, raw_data, raw_http_text = _openrouter_request(prompt)
-            return text, raw_data, "openrouter", attempt, raw_http_text
+            waited = openrouter_limiter.acquire()
+            if waited >= 1:
+                _log(f"Rate limiter {waited:.1f}s bekletti")
+            _log(f"OpenRouter isteği gönderiliyor attempt={attempt} model={model}")
+            if attempt > 1:
+                OPENROUTER_RETRIES.inc(model=model)
+            if on_start is not None:
+                on_start()
+            request_started = time.monotonic()
+            with stage_timer("openrouter_request"):
+                text, raw_data, raw_http_text = _openrouter_request(
+                    prompt, model, on_item, expected_count, cancel_event
+                )
+            request_sec = round(time.monotonic() - request_started, 2)
+            _on_openrouter_success(model, request_sec, raw_data)
+            return text, raw_data, "openrouter", attempt, raw_http_text, request_sec
+        except _HedgeCancelled:
+            openrouter_breaker.on_cancelled()
+            OPENROUTER_REQUESTS.inc(model=model, outcome="cancelled")
+            raise
         except Exception as exc:
-            last_error = str(exc)
-            _log(f"OpenRouter hata attempt={attempt}: {last_error}")
+            last_error = exc
+            _log(f"OpenRouter hata attempt={attempt} model={model}: {exc}", level="warning")
+            if _on_openrouter_error(exc, model):
+                # Bekleme limiter üzerinden tüm eşzamanlı batch'lere yayılır.
+                continue
             if attempt < OPENROUTER_MAX_RETRIES:
-                lowered = last_error.lower()
-                if "429" in lowered or "rate-limit" in lowered or "rate limit" in lowered:
-                    wait_sec = min(10 * attempt, 30)
-                    _log(f"Rate limit algılandı, tekrar denenmeden önce {wait_sec}s bekleniyor")
-                    time.sleep(wait_sec)
-                else:
-                    time.sleep(min(2**attempt, 8))
+                time.sleep(min(2**attempt, 8))
+
+    raise last_error or RuntimeError("OpenRouter isteği başarısız")
+
+
+async def _openrouter_generate_json_async(
+    prompt: str,
+    model: str,
+    on_item: Callable[[dict], None] | None = None,
+    expected_count: int = 0,
+    on_start: Callable[[], None] | None = None,
+) -> tuple[str, dict, str, int, str, float]:
+    last_error: Exception | None = None
+
+    for attempt in range(1, OPENROUTER_MAX_RETRIES + 1):
+        await openrouter_breaker.wait_async()
+
+        try:
+            waited = await openrouter_limiter.acquire_async()
+            if waited >= 1:
+                _log(f"Rate limiter {waited:.1f}s bekletti")
+            _log(f"OpenRouter isteği gönderiliyor attempt={attempt} model={model}")
+            if attempt > 1:
+                OPENROUTER_RETRIES.inc(model=model)
+            if on_start is not None:
+                on_start()
+            request_started = time.monotonic()
+            with stage_timer("openrouter_request"):
+                text, raw_data, raw_http_text = await _openrouter_request_async(prompt, model, on_item, expected_count)
+            request_sec = round(time.monotonic() - request_started, 2)
+            _on_openrouter_success(model, request_sec, raw_data)
+            return text, raw_data, "openrouter", attempt, raw_http_text, request_sec
+        except asyncio.CancelledError:
+            openrouter_breaker.on_cancelled()
+            OPENROUTER_REQUESTS.inc(model=model, outcome="cancelled")
+            raise
+        except Exception as exc:
+            last_error = exc if str(exc) else RuntimeError(exc.__class__.__name__)
+            _log(f"OpenRouter hata attempt={attempt} model={model}: {last_error}", level="warning")
+            if _on_openrouter_error(exc, model):
+                continue
+            if attempt < OPENROUTER_MAX_RETRIES:
+                await asyncio.sleep(min(2**attempt, 8))
+
+    raise last_error or RuntimeError("OpenRouter isteği başarısız")
+
+
+def _call_result(
+    prompt: str,
+    labels: list[str | None],
+    raw_content: str,
+    raw_api_response: dict,
+    mode: str,
+    attempt: int,
+    raw_http_text: str,
+    request_sec: float,
+    model: str,
+) -> dict:
+    return {
+        "labels": labels,
+        "raw_content": raw_content,
+        "prompt": prompt,
+        "raw_api_response": raw_api_response,
+        "mode": mode,
+        "attempt": attempt,
+        "raw_http_text": raw_http_text,
+        "provider": "openrouter",
+        "model": model,
+        "hedged": False,
+        "request_sec": request_sec,
+    }
+
+
+# Stream'den gelen her {"index", "label"} nesnesini batch içi pozisyon ve izinli etikete çevirir.
+def _item_handler(
+    batch_size: int, emotions: list[str], on_label: Callable[[int, str], None] | None
+) -> Callable[[dict], None] | None:
+    if on_label is None:
+        return None
+    mapper = get_label_mapper(emotions)
+
+    def _on_item(item: dict) -> None:
+        index = _item_index(item.get("index"))
+        label = mapper.map(str(item.get("label") or ""))
+        if index is not None and 1 <= index <= batch_size and label:
+            on_label(index - 1, label)
+
+    return _on_item
 
-    raise RuntimeError(last_error or "OpenRouter isteği başarısız")
 
+# Hedge'li istekte iki model aynı anda stream edebilir; ara etiketler sadece ilk parça gönderen modelden iletilir.
+class _StreamClaim:
+    def __init__(self, on_item: Callable[[dict], None] | None) -> None:
+        self.on_item = on_item
+        self.model: str | None = None
+        self._lock = threading.Lock()
 
-def _classify_batch(batch: list[dict], emotions: list[str]) -> tuple[list[str], str, str, dict, str, int, str, str]:
+    def handler(self, model: str) -> Callable[[dict], None] | None:
+        if self.on_item is None:
+            return None
+
+        def _on_item(item: dict) -> None:
+            with self._lock:
+                if self.model is None:
+                    self.model = model
+            if self.model == model:
+                self.on_item(item)
+
+        return _on_item
+
+
+def _classify_with_model(
+    prompt: str,
+    batch: list[dict],
+    emotions: list[str],
+    model: str,
+    on_item: Callable[[dict], None] | None = None,
+    cancel_event: threading.Event | None = None,
+    on_start: Callable[[], None] | None = None,
+) -> dict:
+    raw_content, raw_api_response, mode, attempt, raw_http_text, request_sec = _openrouter_generate_json(
+        prompt, model, on_item, len(batch), cancel_event, on_start
+    )
+    with stage_timer("parse_labels", len(batch)):
+        labels = _parse_indexed_labels(raw_content, emotions, len(batch))
+    return _call_result(prompt, labels, raw_content, raw_api_response, mode, attempt, raw_http_text, request_sec, model)
+
+
+async def _classify_with_model_async(
+    prompt: str,
+    batch: list[dict],
+    emotions: list[str],
+    model: str,
+    on_item: Callable[[dict], None] | None = None,
+    on_start: Callable[[], None] | None = None,
+) -> dict:
+    raw_content, raw_api_response, mode, attempt, raw_http_text, request_sec = await _openrouter_generate_json_async(
+        prompt, model, on_item, len(batch), on_start
+    )
+    with stage_timer("parse_labels", len(batch)):
+        labels = _parse_indexed_labels(raw_content, emotions, len(batch))
+    return _call_result(prompt, labels, raw_content, raw_api_response, mode, attempt, raw_http_text, request_sec, model)
+
+
+def _served(call: dict, launched: list[str]) -> dict:
+    call["hedged"] = len(launched) > 1
+    model_latency.count(call["model"], "served")
+    if call["model"] != launched[0]:
+        model_latency.count(call["model"], "hedge_wins")
+        _log(f"Batch cevabı yedek modelden geldi model={call['model']} (birincil={launched[0]})")
+    return call
+
+
+def _hedge_failed(errors: list[tuple[str, Exception]], fallback: dict | None, launched: list[str]) -> dict:
+    # Hiçbir model etiket döndürmediyse ilk gelen (boş) cevap kurtarma adımına bırakılır.
+    if fallback is not None:
+        return _served(fallback, launched)
+    message = " | ".join(f"{model}: {exc}" for model, exc in errors) or "OpenRouter isteği başarısız"
+    if errors and all(isinstance(exc, ProviderBusyError) for _, exc in errors):
+        raise ProviderBusyError(message, max(exc.retry_after or 0.0 for _, exc in errors))
+    # Hiçbir model kurtarılabilir hata vermediyse bu bilgi birleşik hataya taşınır.
+    fatal = next((exc for _, exc in errors if isinstance(exc, OpenRouterAPIError) and not _salvageable_error(exc)), None)
+    if fatal is not None and not any(_salvageable_error(exc) for _, exc in errors):
+        raise OpenRouterAPIError(message, fatal.status_code)
+    raise RuntimeError(message)
+
+
+# Hedge gecikmesi son gönderilen modelin isteği gerçekten gönderildiği andan (limiter/devre beklemesi ve
+# executor kuyruğu sonrası) sayılır; gecikme yüzdeliği de aynı süreden ölçülür. İstek henüz başlamadıysa
+# en geç bir gecikme sonra tekrar bakılır. 0: hedge zamanı geldi, None: sırada model yok.
+def _hedge_timeout(remaining: deque, launched: list[str], started: dict[str, float]) -> float | None:
+    if not remaining:
+        return None
+    model = launched[-1]
+    delay = model_latency.hedge_delay(model)
+    started_at = started.get(model)
+    if started_at is None:
+        return max(delay, _HEDGE_START_POLL_SEC)
+    return max(0.0, started_at + delay - time.monotonic())
+
+
+# Tekrar denemelerde ilk gönderim zamanı korunur.
+def _start_marker(started: dict[str, float], model: str) -> Callable[[], None]:
+    return lambda: started.setdefault(model, time.monotonic())
+
+
+# OPENROUTER_MODELS sırasıyla denenir: istek, çalışan modelin gözlenen gecikme yüzdeliğini aşarsa
+# sıradaki modele aynı istek (hedge) gönderilir; hata veren model de hemen sıradakine devreder.
+# Etiket içeren ilk cevap kazanır, diğer istekler iptal edilir. Sync tarafta stream'siz bir istek
+# yarıda kesilemez; sonucu yok sayılır. İstekler çalışmanın kendi executor'ında koşar (bkz. dispatch).
+def _classify_hedged(
+    prompt: str,
+    batch: list[dict],
+    emotions: list[str],
+    on_item: Callable[[dict], None] | None,
+    executor: ThreadPoolExecutor,
+) -> dict:
+    remaining = deque(OPENROUTER_MODELS)
+    claim = _StreamClaim(on_item)
+    cancel_event = threading.Event()
+    pending: dict = {}
+    launched: list[str] = []
+    started: dict[str, float] = {}
+    errors: list[tuple[str, Exception]] = []
+    fallback: dict | None = None
+
+    def _launch() -> None:
+        model = remaining.popleft()
+        if launched:
+            model_latency.count(model, "hedged")
+            _log(f"Hedge isteği gönderiliyor model={model} (bekleyen={', '.join(pending.values())})")
+        launched.append(model)
+        future = executor.submit(
+            contextvars.copy_context().run,
+            _classify_with_model,
+            prompt,
+            batch,
+            emotions,
+            model,
+            claim.handler(model),
+            cancel_event,
+            _start_marker(started, model),
+        )
+        pending[future] = model
+
+    _launch()
+    try:
+        while pending:
+            done, _ = wait(pending, timeout=_hedge_timeout(remaining, launched, started), return_when=FIRST_COMPLETED)
+            if not done:
+                if _hedge_timeout(remaining, launched, started) == 0.0:
+                    _launch()
+                continue
+
+            for future in done:
+                model = pending.pop(future)
+                try:
+                    call = future.result()
+                except Exception as exc:
+                    errors.append((model, exc))
+                    if remaining:
+                        _launch()
+                    continue
+                if any(call["labels"]):
+                    return _served(call, launched)
+                fallback = fallback or call
+                if remaining:
+                    _launch()
+    finally:
+        cancel_event.set()
+
+    return _hedge_failed(errors, fallback, launched)
+
+
+async def _classify_hedged_async(
+    prompt: str, batch: list[dict], emotions: list[str], on_item: Callable[[dict], None] | None
+) -> dict:
+    remaining = deque(OPENROUTER_MODELS)
+    claim = _StreamClaim(on_item)
+    pending: dict[asyncio.Task, str] = {}
+    launched: list[str] = []
+    started: dict[str, float] = {}
+    errors: list[tuple[str, Exception]] = []
+    fallback: dict | None = None
+
+    def _launch() -> None:
+        model = remaining.popleft()
+        if launched:
+            model_latency.count(model, "hedged")
+            _log(f"Hedge isteği gönderiliyor model={model} (bekleyen={', '.join(pending.values())})")
+        launched.append(model)
+        task = asyncio.create_task(
+            _classify_with_model_async(prompt, batch, emotions, model, claim.handler(model), _start_marker(started, model))
+        )
+        pending[task] = model
+
+    _launch()
+    try:
+        while pending:
+            timeout = _hedge_timeout(remaining, launched, started)
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                if _hedge_timeout(remaining, launched, started) == 0.0:
+                    _launch()
+                continue
+
+            for task in done:
+                model = pending.pop(task)
+                try:
+                    call = task.result()
+                except Exception as exc:
+                    errors.append((model, exc))
+                    if remaining:
+                        _launch()
+                    continue
+                if any(call["labels"]):
+                    return _served(call, launched)
+                fallback = fallback or call
+                if remaining:
+                    _launch()
+    finally:
+        for task in pending:
+            task.cancel()
+
+    return _hedge_failed(errors, fallback, launched)
+
+
+def _classify_batch(
+    batch: list[dict],
+    emotions: list[str],
+    executor: ThreadPoolExecutor,
+    on_label: Callable[[int, str], None] | None = None,
+) -> dict:
     prompt = _create_prompt(batch, emotions)
-    raw_content, raw_api_response, mode, attempt, raw_http_text = _openrouter_generate_json(prompt)
-    labels = _parse_labels(raw_content, emotions, len(batch))
-    return labels, raw_content, prompt, raw_api_response, mode, attempt, raw_http_text, "openrouter"
+    on_item = _item_handler(len(batch), emotions, on_label)
+    if hedging_enabled():
+        return _classify_hedged(prompt, batch, emotions, on_item, executor)
+    return _served(_classify_with_model(prompt, batch, emotions, OPENROUTER_MODELS[0], on_item), OPENROUTER_MODELS[:1])
+
+
+async def _classify_batch_async(
+    batch: list[dict], emotions: list[str], on_label: Callable[[int, str], None] | None = None
+) -> dict:
+    prompt = _create_prompt(batch, emotions)
+    on_item = _item_handler(len(batch), emotions, on_label)
+    if hedging_enabled():
+        return await _classify_hedged_async(prompt, batch, emotions, on_item)
+    call = await _classify_with_model_async(prompt, batch, emotions, OPENROUTER_MODELS[0], on_item)
+    return _served(call, OPENROUTER_MODELS[:1])
+
+
+# Kimlik/kota hataları, tükenmiş 429'lar ve açık devre küçük parçalarla tekrar denense de düzelmez.
+def _salvageable_error(exc: Exception) -> bool:
+    if isinstance(exc, ProviderBusyError):
+        return False
+    return not (isinstance(exc, OpenRouterAPIError) and exc.status_code in (401, 402, 403, 404))
+
+
+def _salvage_groups(positions: list[int], split: bool) -> list[list[int]]:
+    if split and len(positions) > 1:
+        middle = len(positions) // 2
+        return [positions[:middle], positions[middle:]]
+    return [positions]
+
+
+def _apply_salvage_call(
+    labels: list[str | None],
+    group: list[int],
+    depth: int,
+    call: dict | None,
+    error: Exception | None,
+    calls: list[dict],
+) -> list[int]:
+    entry = {"depth": depth, "size": len(group), "labelled": 0}
+    if call is not None:
+        for position, label in zip(group, call["labels"]):
+            if label is not None and labels[position] is None:
+                labels[position] = label
+                entry["labelled"] += 1
+        entry["model"] = call["model"]
+        entry["request_sec"] = call["request_sec"]
+        if ARTIFACTS_CAPTURE_RAW:
+            entry["raw"] = call
+    else:
+        entry["error"] = str(error)
+
+    calls.append(entry)
+    return [position for position in group if labels[position] is None]
+
+
+# Eksik pozisyonlar önce tek bir küçük batch olarak tekrar sorulur; yine eksik kalırsa
+# (ya da istek hata verirse) grup ikiye bölünerek CLASSIFY_SALVAGE_MAX_DEPTH'e kadar devam edilir.
+def _salvage_labels(
+    batch: list[dict],
+    labels: list[str | None],
+    emotions: list[str],
+    positions: list[int],
+    split: bool,
+    depth: int,
+    calls: list[dict],
+    executor: ThreadPoolExecutor,
+) -> None:
+    if not positions or depth > CLASSIFY_SALVAGE_MAX_DEPTH:
+        return
+
+    for group in _salvage_groups(positions, split):
+        try:
+            call, error = _classify_batch([batch[position] for position in group], emotions, executor), None
+        except Exception as exc:
+            call, error = None, exc
+        missing = _apply_salvage_call(labels, group, depth, call, error, calls)
+        # Sağlayıcı yoğunken bölüp tekrar sormak sadece yükü artırır.
+        if isinstance(error, ProviderBusyError):
+            return
+        _salvage_labels(batch, labels, emotions, missing, True, depth + 1, calls, executor)
+
+
+async def _salvage_labels_async(
+    batch: list[dict],
+    labels: list[str | None],
+    emotions: list[str],
+    positions: list[int],
+    split: bool,
+    depth: int,
+    calls: list[dict],
+) -> None:
+    if not positions or depth > CLASSIFY_SALVAGE_MAX_DEPTH:
+        return
+
+    for group in _salvage_groups(positions, split):
+        try:
+            call, error = await _classify_batch_async([batch[position] for position in group], emotions), None
+        except Exception as exc:
+            call, error = None, exc
+        missing = _apply_salvage_call(labels, group, depth, call, error, calls)
+        if isinstance(error, ProviderBusyError):
+            return
+        await _salvage_labels_async(batch, labels, emotions, missing, True, depth + 1, calls)
 
 
 def _fallback_label_from_audio(song: dict, emotions: list[str], default_label: str) -> str:
@@ -451,399 +1210,1252 @@ def _adjust_label_with_audio_hint(song: dict, label: str, emotions: list[str]) -
     return label
 
 
-def process_playlist(
-    playlist_url: str,
-    emotions: list[str],
-    progress_callback: Callable[[int, int, list[dict]], None] | None = None,
-) -> dict:
-    clean_data_dir()
-
-    normalized_emotions = _normalize_emotions(emotions)
-    if not normalized_emotions:
-        raise ValueError("En az bir duygu seçmelisiniz")
+# Sadece aynı kaydın farklı yayınlarını ayıran etiketler atılır; "(Acoustic)", "(Part 2)", " - Live",
+# " - IV. Allegro" gibi farklı kayıtları ayıran ekler anahtarda kalır.
+_RELEASE_TAG = (
+    r"(?:\d{4}\s+)?(?:digitally\s+)?remaster(?:ed)?(?:\s+\d{4})?(?:\s+version)?"
+    r"|deluxe(?:\s+(?:edition|version))?"
+    r"|(?:mono|stereo)(?:\s+(?:version|mix))?"
+    r"|(?:single|album)\s+version"
+    r"|(?:feat\.?|ft\.?|featuring)\s+[^\)\]]+"
+)
+_RELEASE_SUFFIX_RE = re.compile(
+    rf"\s*\((?:{_RELEASE_TAG})\)|\s*\[(?:{_RELEASE_TAG})\]|\s+-\s+(?:{_RELEASE_TAG})\s*$"
+    r"|\s+(?:feat\.|ft\.|featuring)\s+.*$",
+    re.IGNORECASE,
+)
+
+
+# "Song (Remastered 2011)", "Song - 2011 Remaster", "Şarkı [feat. X]" aynı anahtara düşer.
+def _dedupe_key(song: dict) -> str:
+    name = _RELEASE_SUFFIX_RE.sub("", song.get("name") or "")
+    name = re.sub(r"[\W_]+", " ", normalize_label(name)).strip()
+    artist = re.sub(r"[\W_]+", " ", normalize_label(song.get("artist") or "")).strip()
+    if not name or not artist:
+        return ""
+    return f"{name}\t{artist}"
+
+
+# temsilci index -> tekrar eden index'ler (ilk görülen şarkı temsilcidir, sıra korunur).
+def _group_duplicates(songs: list[dict]) -> dict[int, list[int]]:
+    representative_by_key: dict[tuple[str, str], int] = {}
+    duplicates: dict[int, list[int]] = {}
+
+    for index, song in enumerate(songs):
+        keys = []
+        if song.get("id"):
+            keys.append(("id", song["id"]))
+        name_key = _dedupe_key(song)
+        if name_key:
+            keys.append(("name", name_key))
+
+        representative = next((representative_by_key[key] for key in keys if key in representative_by_key), index)
+        for key in keys:
+            representative_by_key.setdefault(key, representative)
+        if representative != index:
+            duplicates.setdefault(representative, []).append(index)
+
+    return duplicates
+
+
+def _merge_song(song: dict, label: str, emotions: list[str]) -> dict:
+    adjusted_label = _adjust_label_with_audio_hint(song, label, emotions)
+    # Şarkı başına mesaj: binlerce şarkıda log kuyruğunu doldurmaması için örneklenir.
+    if adjusted_label != label and (occurrence := sample("label_adjusted")):
+        _log(
+            f"Etiket düzeltildi: {song.get('name')} - {song.get('artist')} | {label} -> {adjusted_label} (audio hint)",
+            occurrence=occurrence,
+        )
 
-    if not OPENROUTER_API_KEY:
-        raise ValueError("OPENROUTER_API_KEY bulunamadı. .env dosyasına ekleyin.")
+    return {
+        "id": song.get("id"),
+        "name": song.get("name", ""),
+        "artist": song.get("artist", ""),
+        "url": song.get("url", ""),
+        "emotion": adjusted_label,
+    }
 
-    playlist_id = extract_playlist_id(playlist_url)
-    _log(f"Sınıflandırma başlatıldı. provider=openrouter, playlist_id={playlist_id}, emotions={normalized_emotions}")
 
-    songs = fetch_playlist_tracks(playlist_id)
+# Tek bir sınıflandırma çalışmasının durumu. Sync ve async yollar aynı kayıt mantığını paylaşır;
+# sadece AI çağrısı ve batch dağıtımı farklıdır.
+class _ClassificationRun:
+    def __init__(
+        self,
+        playlist_id: str,
+        songs: list[dict],
+        emotions: list[str],
+        progress_callback: Callable[[int, int, list[dict]], None] | None = None,
+        event_listener: Callable[[dict], None] | None = None,
+        cancel_event: threading.Event | None = None,
+    ) -> None:
+        self.playlist_id = playlist_id
+        self.songs = songs
+        self.emotions = emotions
+        self.progress_callback = progress_callback
+        self.event_listener = event_listener
+        self.cancel_event = cancel_event
+
+        self.failed_batches: list[dict] = []
+        self.batch_logs: list[dict] = []
+        self.batch_summaries: list[dict] = []
+        self.ai_raw_logs: list[dict] = []
+        self.client_events: list[dict] = []
+        self.stop_dispatch = False
+        self._events_lock = threading.Lock()
+        self._progress_lock = threading.Lock()
+
+        # Her çalışmanın artifact'ları kendi klasörüne yazılır; eşzamanlı çalışmalar birbirini silmez.
+        self.run_id = new_run_id(playlist_id)
+        write_artifact(self.run_id, f"playlist_{playlist_id}", songs)
+
+        # Aynı id ya da aynı (şarkı, sanatçı) anahtarı tek sefer sınıflandırılır, etiket tüm tekrarlara yayılır.
+        self.duplicates = _group_duplicates(songs)
+        duplicate_indices = {index for indices in self.duplicates.values() for index in indices}
+        unique_indices = [index for index in range(len(songs)) if index not in duplicate_indices]
+        self.unique_songs = len(unique_indices)
+
+        cached_labels = get_cached_labels(
+            [songs[index].get("id") for index in unique_indices], emotions, MODEL_SET_KEY, PROMPT_VERSION
+        )
+        self.merged_by_index: dict[int, dict] = {}
+        self.pending_indices: list[int] = []
+        for index in unique_indices:
+            cached_label = cached_labels.get(songs[index].get("id") or "")
+            if cached_label in emotions:
+                self._merge_index(index, cached_label)
+            else:
+                self.pending_indices.append(index)
+        self.cache_hits = self.unique_songs - len(self.pending_indices)
+
+        # Geçmiş LLM etiketlerinin komşuluğundan ya da ses özelliklerinden net çıkan şarkılar
+        # LLM'e gönderilmeden yerelde etiketlenir.
+        self.index_hits = self._label_locally(lookup_labels)
+        self.audio_hits = self._label_locally(score_confident)
+        self.model_labelled: list[tuple[dict, str]] = []
+        CLASSIFY_SONGS.inc(len(songs) - self.unique_songs, source="duplicate")
+        CLASSIFY_SONGS.inc(self.cache_hits, source="cache")
+        CLASSIFY_SONGS.inc(self.index_hits, source="label_index")
+        CLASSIFY_SONGS.inc(self.audio_hits, source="audio")
+
+        # Şarkı satırlarının token tahmini bir kez hesaplanır; yeniden planlamada tekrar kullanılır.
+        self._header_tokens = estimate_tokens("\n".join(_prompt_header(emotions, 0)))
+        self._song_tokens = {
+            index: estimate_tokens(_song_prompt_line(index + 1, songs[index])) + 1 for index in self.pending_indices
+        }
+        self.batch_size = batch_planner.target_size(PLANNER_MODEL)
+        self.queued_batches: deque[list[int]] = deque(self._plan(self.pending_indices))
+        self.dispatched_batches = 0
+        self.total_batches = len(self.queued_batches)
+        self.concurrency = max(1, min(CLASSIFY_CONCURRENCY, self.total_batches or 1))
+
+        _log(
+            f"Batch planı hazırlandı. batch_size={self.batch_size}, total_batches={self.total_batches}, "
+            f"unique_songs={self.unique_songs}, cache_hits={self.cache_hits}, index_hits={self.index_hits}, "
+            f"audio_hits={self.audio_hits}, llm_songs={len(self.pending_indices)}"
+        )
 
-    json_path = os.path.join(DATA_DIR, f"playlist_{playlist_id}.json")
-    with open(json_path, "w", encoding="utf-8") as f:
-        json.dump(songs, f, ensure_ascii=False, indent=2)
+        self.push_client_event(
+            "classification_started",
+            "Sınıflandırma başlatıldı",
+            stream_extra={"tracks": self._tracks_payload(sorted(self.merged_by_index))},
+            playlist_id=playlist_id,
+            total_songs=len(songs),
+            unique_songs=self.unique_songs,
+            total_batches=self.total_batches,
+            emotions=emotions,
+            cache_hits=self.cache_hits,
+            index_hits=self.index_hits,
+            audio_hits=self.audio_hits,
+            merged_count=len(self.merged_by_index),
+        )
 
-    batch_size = max(1, CLASSIFY_BATCH_SIZE)
-    batches = [songs[i : i + batch_size] for i in range(0, len(songs), batch_size)]
-    total_batches = len(batches)
+    def _merge_index(self, index: int, label: str) -> None:
+        merged = _merge_song(self.songs[index], label, self.emotions)
+        self.merged_by_index[index] = merged
+        for duplicate in self.duplicates.get(index, ()):
+            song = self.songs[duplicate]
+            self.merged_by_index[duplicate] = {
+                "id": song.get("id"),
+                "name": song.get("name", ""),
+                "artist": song.get("artist", ""),
+                "url": song.get("url", ""),
+                "emotion": merged["emotion"],
+            }
 
-    _log(f"Batch planı hazırlandı. batch_size={batch_size}, total_batches={total_batches}")
+    def _with_duplicates(self, indices: list[int]) -> list[int]:
+        expanded = list(indices)
+        for index in indices:
+            expanded.extend(self.duplicates.get(index, ()))
+        return sorted(expanded)
+
+    def _label_locally(self, labeller: Callable[[list[dict], list[str]], dict[int, tuple[str, float]]]) -> int:
+        found = labeller([self.songs[index] for index in self.pending_indices], self.emotions)
+        for position, (label, _) in found.items():
+            self._merge_index(self.pending_indices[position], label)
+        if found:
+            self.pending_indices = [index for index in self.pending_indices if index not in self.merged_by_index]
+        return len(found)
+
+    def _plan(self, indices: list[int]) -> list[list[int]]:
+        return batch_planner.plan(PLANNER_MODEL, indices, self._header_tokens, self._song_tokens)
+
+    def _next_batch(self) -> tuple[int, list[int]] | None:
+        if not self.queued_batches:
+            return None
+        self.dispatched_batches += 1
+        return self.dispatched_batches, self.queued_batches.popleft()
+
+    # Hedef boyut değiştiyse henüz gönderilmemiş şarkılar yeni boyutla yeniden bölünür.
+    def _replan_queued(self) -> None:
+        target_size = batch_planner.target_size(PLANNER_MODEL)
+        if target_size == self.batch_size:
+            return
+
+        self.batch_size = target_size
+        if not self.queued_batches:
+            return
+
+        remaining = [index for batch in self.queued_batches for index in batch]
+        self.queued_batches = deque(self._plan(remaining))
+        self.total_batches = self.dispatched_batches + len(self.queued_batches)
+        _log(
+            f"Kalan batch'ler yeniden planlandı. batch_size={target_size}, "
+            f"remaining_batches={len(self.queued_batches)}, total_batches={self.total_batches}"
+        )
 
-    merged: list[dict] = []
-    failed_batches: list[dict] = []
-    batch_logs: list[dict] = []
-    batch_summaries: list[dict] = []
-    ai_raw_logs: list[dict] = []
-    client_events: list[dict] = []
+    # stream_extra sadece event_listener'a gider; client_events içinde saklanmaz.
+    def push_client_event(self, event: str, message: str, stream_extra: dict | None = None, **kwargs) -> None:
+        entry = {
+            "ts": datetime.now().isoformat(timespec="seconds"),
+            "event": event,
+            "message": message,
+            **kwargs,
+        }
+        with self._events_lock:
+            self.client_events.append(entry)
 
-    def _push_client_event(event: str, message: str, **kwargs) -> None:
-        client_events.append(
-            {
-                "ts": datetime.now().isoformat(timespec="seconds"),
-                "event": event,
-                "message": message,
-                **kwargs,
-            }
-        )
+        if self.event_listener:
+            try:
+                self.event_listener({**entry, **(stream_extra or {})})
+            except Exception:
+                pass
 
-    _push_client_event(
-        "classification_started",
-        "Sınıflandırma başlatıldı",
-        playlist_id=playlist_id,
-        total_songs=len(songs),
-        total_batches=total_batches,
-        emotions=normalized_emotions,
-    )
+    def _tracks_payload(self, indices: list[int]) -> list[dict]:
+        if not self.event_listener:
+            return []
+        return [{"index": index, **self.merged_by_index[index]} for index in indices]
 
-    for i, batch in enumerate(batches):
-        batch_no = i + 1
-        _log(f"Batch {batch_no}/{total_batches} hazırlanıyor... song_count={len(batch)}")
-        _push_client_event(
+    def _start_batch(self, batch_no: int, batch_indices: list[int]) -> list[dict]:
+        batch = [self.songs[index] for index in batch_indices]
+        _log(f"Batch {batch_no}/{self.total_batches} hazırlanıyor... song_count={len(batch)}")
+        self.push_client_event(
             "batch_started",
-            f"Batch {batch_no}/{total_batches} başladı",
+            f"Batch {batch_no}/{self.total_batches} başladı",
             batch=batch_no,
-            total_batches=total_batches,
+            total_batches=self.total_batches,
             song_count=len(batch),
         )
 
-        if progress_callback:
+        if self.progress_callback:
+            with self._progress_lock:
+                try:
+                    self.progress_callback(batch_no, self.total_batches, batch)
+                except Exception:
+                    pass
+
+        _log(f"Batch {batch_no}/{self.total_batches} AI servisine gönderildi (provider=openrouter)")
+        return batch
+
+    def _salvage_start(
+        self, batch: list[dict], call: dict | None, error: Exception | None
+    ) -> tuple[list[str | None], list[int], bool]:
+        labels = list(call["labels"]) if call is not None else [None] * len(batch)
+        missing = [position for position, label in enumerate(labels) if label is None]
+        if self.cancel_event and self.cancel_event.is_set():
+            return labels, [], False
+        if error is not None and not _salvageable_error(error):
+            return labels, [], False
+        # İlk istek tamamen başarısız olduysa aynı batch'i tekrar göndermek yerine doğrudan ikiye bölünür.
+        return labels, missing, call is None
+
+    def _batch_result(
+        self,
+        batch_no: int,
+        batch_indices: list[int],
+        batch: list[dict],
+        started: float,
+        call_sec: float,
+        call: dict | None,
+        error: Exception | None,
+        labels: list[str | None],
+        salvage_calls: list[dict],
+    ) -> dict:
+        missing_count = sum(1 for label in labels if label is None)
+        if missing_count == 0:
+            status = "ok"
+        elif missing_count < len(batch):
+            status = "partial"
+        else:
+            status = "fallback"
+
+        return {
+            "batch_no": batch_no,
+            "batch_indices": batch_indices,
+            "batch": batch,
+            "status": status,
+            "labels": labels,
+            "call": call,
+            "error": str(error) if error is not None else "",
+            "provider_busy": isinstance(error, ProviderBusyError),
+            "salvage_calls": salvage_calls,
+            "call_sec": call_sec,
+            "elapsed": round(time.time() - started, 2),
+        }
+
+    # Stream sırasında gelen etiketler sadece dinleyiciye geçici olarak iletilir (client_events'e yazılmaz);
+    # kesin birleştirme batch bittiğinde dağıtıcıda yapılır.
+    def _partial_label_handler(self, batch_no: int, batch_indices: list[int]) -> Callable[[int, str], None] | None:
+        if not self.event_listener:
+            return None
+
+        def _on_label(position: int, label: str) -> None:
+            index = batch_indices[position]
+            song = self.songs[index]
+            tracks = [
+                {"index": duplicate, "name": self.songs[duplicate].get("name", ""), "emotion": label}
+                for duplicate in self._with_duplicates([index])
+            ]
             try:
-                progress_callback(batch_no, total_batches, batch)
+                self.event_listener(
+                    {
+                        "ts": datetime.now().isoformat(timespec="seconds"),
+                        "event": "label_streamed",
+                        "message": f"{song.get('name')} - {song.get('artist')} → {label}",
+                        "batch": batch_no,
+                        "tracks": tracks,
+                    }
+                )
             except Exception:
                 pass
 
-        started = time.time()
-        try:
-            _log(f"Batch {batch_no}/{total_batches} AI servisine gönderildi (provider=openrouter)")
-            (
-                labels,
-                raw_content,
-                prompt_used,
-                raw_api_response,
-                used_mode,
-                used_attempt,
-                raw_http_text,
-                used_provider,
-            ) = _classify_batch(batch, normalized_emotions)
-
-            elapsed = round(time.time() - started, 2)
-            _log(
-                f"Batch {batch_no}/{total_batches} cevabı geldi ({elapsed}s) provider={used_provider} mode={used_mode}"
-            )
+        return _on_label
 
-            unique_labels = sorted(set(labels))
-            if len(unique_labels) == 1:
-                _log(f"UYARI: Batch {batch_no} tek etiket döndürdü -> {unique_labels[0]}")
+    # Worker thread'lerinde çalışır: sadece AI çağrısını yapar, sonuç kaydı dağıtıcıda yapılır.
+    def run_batch(self, batch_no: int, batch_indices: list[int], hedge_executor: ThreadPoolExecutor) -> dict:
+        with batch_context(batch_no):
+            batch = self._start_batch(batch_no, batch_indices)
+            started = time.time()
+            on_label = self._partial_label_handler(batch_no, batch_indices)
+            try:
+                call, error = _classify_batch(batch, self.emotions, hedge_executor, on_label), None
+            except Exception as exc:
+                call, error = None, exc
+            call_sec = round(time.time() - started, 2)
+
+            labels, positions, split = self._salvage_start(batch, call, error)
+            salvage_calls: list[dict] = []
+            _salvage_labels(batch, labels, self.emotions, positions, split, 1, salvage_calls, hedge_executor)
+        return self._batch_result(batch_no, batch_indices, batch, started, call_sec, call, error, labels, salvage_calls)
+
+    async def run_batch_async(self, batch_no: int, batch_indices: list[int]) -> dict:
+        with batch_context(batch_no):
+            batch = self._start_batch(batch_no, batch_indices)
+            started = time.time()
+            on_label = self._partial_label_handler(batch_no, batch_indices)
+            try:
+                call, error = await _classify_batch_async(batch, self.emotions, on_label), None
+            except Exception as exc:
+                call, error = None, exc
+            call_sec = round(time.time() - started, 2)
+
+            labels, positions, split = self._salvage_start(batch, call, error)
+            salvage_calls: list[dict] = []
+            await _salvage_labels_async(batch, labels, self.emotions, positions, split, 1, salvage_calls)
+        return self._batch_result(batch_no, batch_indices, batch, started, call_sec, call, error, labels, salvage_calls)
+
+    def _raw_log(
+        self, batch_no: int, call: dict | None, duration_sec: float, reason: str, batch: list[dict], **extra
+    ) -> dict:
+        if call is None:
+            return {
+                "batch": batch_no,
+                "provider": "openrouter",
+                "status": "fallback",
+                "duration_sec": duration_sec,
+                "reason": reason,
+                "prompt": _create_prompt(batch, self.emotions),
+                "model_response_text": "",
+                "model_response_json": None,
+                "raw_http_response": "",
+                **extra,
+            }
+        return {
+            "batch": batch_no,
+            "provider": call["provider"],
+            "model": call["model"],
+            "mode": call["mode"],
+            "attempt": call["attempt"],
+            "duration_sec": duration_sec,
+            "prompt": call["prompt"],
+            "model_response_text": call["raw_content"],
+            "model_response_json": call["raw_api_response"],
+            "raw_http_response": call["raw_http_text"],
+            **extra,
+        }
 
-            batch_logs.append(
-                {
-                    "batch": batch_no,
-                    "status": "ok",
-                    "duration_sec": elapsed,
-                    "provider": used_provider,
-                    "mode": used_mode,
-                    "attempt": used_attempt,
-                    "songs": [f"{song['name']} - {song['artist']}" for song in batch],
-                    "labels": labels,
-                    "unique_labels": unique_labels,
-                    "raw_response_text": raw_content,
-                }
+    # Modelin verdiği etiketleri döner; cache'e yazmak çağıranın işidir (async yolda event loop dışında yazılır).
+    def record_batch(self, result: dict) -> dict[str, str]:
+        with batch_context(result["batch_no"]):
+            return self._record_batch(result)
+
+    # Sadece modelin gerçekten verdiği etiketler cache'e yazılır; fallback etiketleri yazılmaz.
+    def store_labels(self, labels: dict[str, str]) -> None:
+        store_cached_labels(labels, self.emotions, MODEL_SET_KEY, PROMPT_VERSION)
+
+    def _record_batch(self, result: dict) -> dict[str, str]:
+        batch_no = result["batch_no"]
+        batch = result["batch"]
+        elapsed = result["elapsed"]
+        status = result["status"]
+        call = result["call"]
+        salvage_calls = result["salvage_calls"]
+        total_batches = self.total_batches
+
+        model_labels = result["labels"]
+        missing_count = sum(1 for label in model_labels if label is None)
+        labels = [
+            label or _fallback_label_from_audio(song, self.emotions, self.emotions[0])
+            for song, label in zip(batch, model_labels)
+        ]
+        unique_labels = sorted(set(labels))
+        salvaged = sum(entry["labelled"] for entry in salvage_calls)
+        used_mode = call["mode"] if call is not None else ("salvage" if salvaged else "fallback")
+        used_attempt = call["attempt"] if call is not None else 0
+        used_model = call["model"] if call is not None else ""
+        hedged = call["hedged"] if call is not None else False
+
+        reason = ""
+        if status != "ok":
+            reason = result["error"] or f"Model {missing_count} şarkı için geçerli etiket döndürmedi"
+
+        if call is not None:
+            _log(
+                f"Batch {batch_no}/{total_batches} cevabı geldi ({elapsed}s) provider=openrouter "
+                f"model={used_model} mode={used_mode}"
             )
-
-            batch_summaries.append(
-                {
-                    "batch": batch_no,
-                    "total_batches": total_batches,
-                    "status": "ok",
-                    "duration_sec": elapsed,
-                    "song_count": len(batch),
-                    "provider": used_provider,
-                    "mode": used_mode,
-                    "attempt": used_attempt,
-                    "unique_labels": unique_labels,
-                }
+        else:
+            _log(f"Batch {batch_no}/{total_batches} HATA ({elapsed}s): {result['error']}", level="error")
+        if salvage_calls:
+            _log(
+                f"Batch {batch_no}: {len(salvage_calls)} ek istekle {salvaged} eksik etiket kurtarıldı, "
+                f"{missing_count} şarkı kaldı"
             )
-            _push_client_event(
-                "batch_done",
-                f"Batch {batch_no}/{total_batches} tamamlandı",
-                batch=batch_no,
-                total_batches=total_batches,
-                status="ok",
-                duration_sec=elapsed,
-                song_count=len(batch),
-                unique_labels=unique_labels,
+        if missing_count:
+            _log(
+                f"Batch {batch_no} için {missing_count} şarkıda audio-feature fallback etiketleri kullanıldı",
+                level="warning",
             )
+        if status == "ok" and len(unique_labels) == 1:
+            _log(f"UYARI: Batch {batch_no} tek etiket döndürdü -> {unique_labels[0]}", level="warning")
+
+        CLASSIFY_BATCHES.inc(status=status)
+        CLASSIFY_SONGS.inc(len(batch) - missing_count, source="model")
+        CLASSIFY_SONGS.inc(missing_count, source="fallback")
+
+        salvage_summary = [{key: value for key, value in entry.items() if key != "raw"} for entry in salvage_calls]
+        batch_log = {
+            "batch": batch_no,
+            "status": status,
+            "duration_sec": elapsed,
+            "provider": "openrouter",
+            "model": used_model,
+            "hedged": hedged,
+            "mode": used_mode,
+            "attempt": used_attempt,
+            "songs": [f"{song['name']} - {song['artist']}" for song in batch],
+            "labels": labels,
+            "unique_labels": unique_labels,
+            "raw_response_text": call["raw_content"] if call is not None else "",
+            "salvaged": salvaged,
+            "fallback_count": missing_count,
+            "salvage_calls": salvage_summary,
+        }
+        summary = {
+            "batch": batch_no,
+            "total_batches": total_batches,
+            "status": status,
+            "duration_sec": elapsed,
+            "song_count": len(batch),
+            "provider": "openrouter",
+            "model": used_model,
+            "hedged": hedged,
+            "mode": used_mode,
+            "attempt": used_attempt,
+            "unique_labels": unique_labels,
+            "salvaged": salvaged,
+            "fallback_count": missing_count,
+        }
+        if reason:
+            batch_log["reason"] = reason
+            summary["reason"] = reason
+        self.batch_logs.append(batch_log)
+        self.batch_summaries.append(summary)
+
+        done_message = {
+            "ok": f"Batch {batch_no}/{total_batches} tamamlandı",
+            "partial": f"Batch {batch_no}/{total_batches} kısmi fallback ile tamamlandı",
+            "fallback": f"Batch {batch_no}/{total_batches} fallback ile tamamlandı",
+        }[status]
+        self.push_client_event(
+            "batch_done",
+            done_message,
+            batch=batch_no,
+            total_batches=total_batches,
+            status=status,
+            duration_sec=elapsed,
+            song_count=len(batch),
+            unique_labels=unique_labels,
+            salvaged=salvaged,
+            fallback_count=missing_count,
+            **({"reason": reason} if reason else {}),
+        )
 
-            ai_raw_logs.append(
-                {
-                    "batch": batch_no,
-                    "provider": used_provider,
-                    "mode": used_mode,
-                    "attempt": used_attempt,
-                    "duration_sec": elapsed,
-                    "prompt": prompt_used,
-                    "model_response_text": raw_content,
-                    "model_response_json": raw_api_response,
-                    "raw_http_response": raw_http_text,
-                }
-            )
+        if ARTIFACTS_CAPTURE_RAW:
+            self.ai_raw_logs.append(self._raw_log(batch_no, call, elapsed, result["error"], batch))
+            for entry in salvage_calls:
+                self.ai_raw_logs.append(
+                    self._raw_log(
+                        batch_no,
+                        entry.get("raw"),
+                        entry.get("request_sec", 0),
+                        entry.get("error", ""),
+                        batch,
+                        salvage_depth=entry["depth"],
+                    )
+                )
 
-        except Exception as exc:
-            reason = str(exc)
-            failed_batches.append({"batch": batch_no, "reason": reason})
-            labels = [_fallback_label_from_audio(song, normalized_emotions, normalized_emotions[0]) for song in batch]
-            elapsed = round(time.time() - started, 2)
-            _log(f"Batch {batch_no}/{total_batches} HATA ({elapsed}s): {reason}")
-            _log(f"Batch {batch_no} için audio-feature fallback etiketleri kullanıldı")
-
-            batch_logs.append(
-                {
-                    "batch": batch_no,
-                    "provider": "openrouter",
-                    "status": "fallback",
-                    "duration_sec": elapsed,
-                    "reason": reason,
-                    "songs": [f"{song['name']} - {song['artist']}" for song in batch],
-                    "labels": labels,
-                }
-            )
+        self.model_labelled.extend((song, label) for song, label in zip(batch, model_labels) if label)
 
-            batch_summaries.append(
-                {
-                    "batch": batch_no,
-                    "total_batches": total_batches,
-                    "status": "fallback",
-                    "duration_sec": elapsed,
-                    "song_count": len(batch),
-                    "provider": "openrouter",
-                    "mode": "fallback",
-                    "attempt": 0,
-                    "unique_labels": sorted(set(labels)),
-                    "reason": reason,
-                }
-            )
-            _push_client_event(
-                "batch_done",
-                f"Batch {batch_no}/{total_batches} fallback ile tamamlandı",
-                batch=batch_no,
-                total_batches=total_batches,
-                status="fallback",
-                duration_sec=elapsed,
-                song_count=len(batch),
-                reason=reason,
+        # Yedek model cevap verdiyse birincil hedge eşiğini aşmıştır; batch'in o boyuttaki gerçek maliyeti
+        # hedge beklemesi dahil çağrı süresidir.
+        if call is not None:
+            batch_planner.observe(
+                PLANNER_MODEL,
+                len(batch),
+                call["request_sec"] if call["model"] == PLANNER_MODEL else result["call_sec"],
+                any(label is None for label in call["labels"]),
             )
+        # Rate limit batch boyutundan bağımsızdır; zaman aşımı ve API hataları küçültme sinyalidir.
+        elif not result["provider_busy"]:
+            batch_planner.observe(PLANNER_MODEL, len(batch), result["call_sec"], True)
 
-            ai_raw_logs.append(
-                {
-                    "batch": batch_no,
-                    "provider": "openrouter",
-                    "status": "fallback",
-                    "duration_sec": elapsed,
-                    "reason": reason,
-                    "prompt": _create_prompt(batch, normalized_emotions),
-                    "model_response_text": "",
-                    "model_response_json": None,
-                    "raw_http_response": "",
-                }
-            )
+        if status != "ok":
+            self.failed_batches.append({"batch": batch_no, "reason": reason, "provider_busy": result["provider_busy"]})
+            if CLASSIFY_FAIL_ON_BATCH_ERROR and not self.stop_dispatch:
+                self.stop_dispatch = True
+                _log("Batch hatası nedeniyle yeni batch gönderimi durduruldu", level="warning")
 
-        for song, label in zip(batch, labels):
-            adjusted_label = _adjust_label_with_audio_hint(song, label, normalized_emotions)
-            if adjusted_label != label:
-                _log(
-                    f"Etiket düzeltildi: {song.get('name')} - {song.get('artist')} | {label} -> {adjusted_label} (audio hint)"
-                )
+        with stage_timer("merge", len(batch)):
+            for index, label in zip(result["batch_indices"], labels):
+                self._merge_index(index, label)
 
-            merged.append(
-                {
-                    "id": song.get("id"),
-                    "name": song.get("name", ""),
-                    "artist": song.get("artist", ""),
-                    "url": song.get("url", ""),
-                    "emotion": adjusted_label,
-                }
-            )
+        self._replan_queued()
 
-        _log(f"Batch {batch_no}/{total_batches} işlendi. merged_count={len(merged)}")
-        _push_client_event(
+        _log(f"Batch {batch_no}/{total_batches} işlendi. merged_count={len(self.merged_by_index)}")
+        self.push_client_event(
             "batch_merged",
             f"Batch {batch_no}/{total_batches} etiketleri birleştirildi",
+            stream_extra={"tracks": self._tracks_payload(self._with_duplicates(result["batch_indices"]))},
             batch=batch_no,
             total_batches=total_batches,
-            merged_count=len(merged),
+            merged_count=len(self.merged_by_index),
         )
+        return {song.get("id"): label for song, label in zip(batch, model_labels) if label and song.get("id")}
 
-        if CLASSIFY_DELAY_MS > 0 and i < total_batches - 1:
-            time.sleep(CLASSIFY_DELAY_MS / 1000)
+    # Hedge istekleri her çalışmanın kendi havuzunda koşar: eşzamanlı job'lar birbirinin hedge'ini sıraya
+    # sokmaz. Havuz, uçuştaki her batch'in tüm modelleri aynı anda çalıştırabileceği büyüklüktedir.
+    def dispatch(self) -> None:
+        hedge_executor = ThreadPoolExecutor(
+            max_workers=self.concurrency * len(OPENROUTER_MODELS), thread_name_prefix="openrouter-hedge"
+        )
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="classify") as executor:
+                in_flight: dict = {}
+
+                def _fill() -> None:
+                    while self._can_dispatch() and len(in_flight) < self.concurrency:
+                        item = self._next_batch()
+                        if item is None:
+                            return
+                        batch_no, batch_indices = item
+                        # İstek id'si worker thread'lerindeki loglara da taşınır.
+                        future = executor.submit(
+                            contextvars.copy_context().run, self.run_batch, batch_no, batch_indices, hedge_executor
+                        )
+                        in_flight[future] = batch_no
+
+                _fill()
+                while in_flight:
+                    done, _ = wait(list(in_flight), return_when=FIRST_COMPLETED)
+                    for future in sorted(done, key=lambda f: in_flight[f]):
+                        in_flight.pop(future)
+                        self.store_labels(self.record_batch(future.result()))
+                    _fill()
+        finally:
+            # Kaybeden stream'siz hedge istekleri yarıda kesilemez; beklenmez, bitince thread'leri kapanır.
+            hedge_executor.shutdown(wait=False, cancel_futures=True)
+
+        self._log_skipped()
+
+    async def dispatch_async(self) -> None:
+        in_flight: dict = {}
+
+        def _fill() -> None:
+            while self._can_dispatch() and len(in_flight) < self.concurrency:
+                item = self._next_batch()
+                if item is None:
+                    return
+                batch_no, batch_indices = item
+                in_flight[asyncio.ensure_future(self.run_batch_async(batch_no, batch_indices))] = batch_no
 
-    merged_path = os.path.join(DATA_DIR, "merged.json")
-    with open(merged_path, "w", encoding="utf-8") as f:
-        json.dump(merged, f, ensure_ascii=False, indent=2)
+        try:
+            _fill()
+            while in_flight:
+                done, _ = await asyncio.wait(list(in_flight), return_when=asyncio.FIRST_COMPLETED)
+                labels: dict[str, str] = {}
+                for task in sorted(done, key=lambda t: in_flight[t]):
+                    in_flight.pop(task)
+                    labels.update(self.record_batch(task.result()))
+                _fill()
+                # SQLite yazımı (commit + eviction) event loop'u bloklamasın; sonraki batch'ler bu sırada uçuşta.
+                await asyncio.to_thread(self.store_labels, labels)
+        finally:
+            # Çağıran iptal edilirse (ör. stream istemcisi koptu) uçuştaki batch'ler de iptal edilir.
+            for task in in_flight:
+                task.cancel()
+
+        self._log_skipped()
+
+    def _can_dispatch(self) -> bool:
+        return not self.stop_dispatch and not (self.cancel_event and self.cancel_event.is_set())
+
+    def _log_skipped(self) -> None:
+        skipped_batches = len(self.queued_batches)
+        if skipped_batches:
+            _log(f"{skipped_batches} batch gönderilmeden atlandı")
+
+        if self.cancel_event and self.cancel_event.is_set():
+            self.push_client_event(
+                "classification_cancelled",
+                "Sınıflandırma iptal edildi",
+                playlist_id=self.playlist_id,
+                skipped_batches=skipped_batches,
+            )
+            raise ClassificationCancelled(f"Sınıflandırma iptal edildi. playlist_id={self.playlist_id}")
 
-    batch_log_path = os.path.join(DATA_DIR, "batch_logs.json")
-    with open(batch_log_path, "w", encoding="utf-8") as f:
-        json.dump(batch_logs, f, ensure_ascii=False, indent=2)
+    def finish(self) -> dict:
+        for items in (self.failed_batches, self.batch_logs, self.batch_summaries, self.ai_raw_logs):
+            items.sort(key=lambda item: item["batch"])
 
-    raw_ai_log_path = os.path.join(DATA_DIR, "ai_raw_responses.json")
-    with open(raw_ai_log_path, "w", encoding="utf-8") as f:
-        json.dump(ai_raw_logs, f, ensure_ascii=False, indent=2)
+        songs = self.songs
+        merged = [self.merged_by_index[index] for index in range(len(songs)) if index in self.merged_by_index]
 
-    if failed_batches and CLASSIFY_FAIL_ON_BATCH_ERROR:
-        reasons = "; ".join([f"batch {item['batch']}: {item['reason']}" for item in failed_batches])
-        raise RuntimeError(
-            "Bazı batch'ler AI servisinde başarısız oldu. Sonuçlar güvenilir değil, lütfen tekrar deneyin. "
-            f"Detay: {reasons}"
-        )
+        write_artifact(self.run_id, "merged", merged)
+        write_artifact(self.run_id, "batch_logs", self.batch_logs)
+        if ARTIFACTS_CAPTURE_RAW:
+            write_artifact(self.run_id, "ai_raw_responses", self.ai_raw_logs)
+        prune_artifacts()
 
-    grouped_tracks: dict[str, list[dict]] = {emotion: [] for emotion in normalized_emotions}
-    for song in merged:
-        emotion = song["emotion"]
-        grouped_tracks.setdefault(emotion, []).append(
-            {
-                "id": song.get("id"),
-                "name": song.get("name"),
-                "artist": song.get("artist"),
-                "url": song.get("url"),
+        if self.model_labelled:
+            add_labels(
+                [song for song, _ in self.model_labelled], [label for _, label in self.model_labelled], self.emotions
+            )
+
+        if self.failed_batches and CLASSIFY_FAIL_ON_BATCH_ERROR:
+            reasons = "; ".join([f"batch {item['batch']}: {item['reason']}" for item in self.failed_batches])
+            message = (
+                "Bazı batch'ler AI servisinde başarısız oldu. Sonuçlar güvenilir değil, lütfen tekrar deneyin. "
+                f"Detay: {reasons}"
+            )
+            if any(item["provider_busy"] for item in self.failed_batches):
+                raise ProviderBusyError(
+                    message, max(openrouter_breaker.retry_after(), openrouter_limiter.blocked_for())
+                )
+            raise RuntimeError(message)
+
+        grouped_tracks: dict[str, list[dict]] = {emotion: [] for emotion in self.emotions}
+        for song in merged:
+            emotion = song["emotion"]
+            grouped_tracks.setdefault(emotion, []).append(
+                {
+                    "id": song.get("id"),
+                    "name": song.get("name"),
+                    "artist": song.get("artist"),
+                    "url": song.get("url"),
+                }
+            )
+
+        emotion_counts = Counter(song["emotion"] for song in merged)
+        total = len(merged)
+        emotion_stats = {
+            emotion: {
+                "count": emotion_counts.get(emotion, 0),
+                "percentage": round((emotion_counts.get(emotion, 0) / total) * 100, 2) if total else 0,
             }
+            for emotion in grouped_tracks.keys()
+        }
+
+        _log(
+            f"Sınıflandırma tamamlandı. playlist_id={self.playlist_id}, total_songs={len(songs)}, "
+            f"failed_batches={len(self.failed_batches)}"
+        )
+        _log(f"Çalışma artifact'ları yazılıyor: {run_dir(self.run_id)}")
+        self.push_client_event(
+            "classification_completed",
+            "Sınıflandırma tamamlandı",
+            playlist_id=self.playlist_id,
+            total_songs=len(songs),
+            total_batches=self.total_batches,
+            failed_batches=len(self.failed_batches),
         )
 
-    emotion_counts = Counter(song["emotion"] for song in merged)
-    total = len(merged)
-    emotion_stats = {
-        emotion: {
-            "count": emotion_counts.get(emotion, 0),
-            "percentage": round((emotion_counts.get(emotion, 0) / total) * 100, 2) if total else 0,
+        return {
+            "playlist_id": self.playlist_id,
+            "run_id": self.run_id,
+            "total_songs": len(songs),
+            "unique_songs": self.unique_songs,
+            "total_batches": self.total_batches,
+            "emotion_stats": emotion_stats,
+            "grouped_tracks": grouped_tracks,
+            "failed_batches": self.failed_batches,
+            "batch_logs": self.batch_summaries,
+            "client_events": self.client_events,
+            "cache": {
+                "hits": self.cache_hits,
+                "misses": self.unique_songs - self.cache_hits,
+                "totals": cache_stats(),
+            },
+            "audio_fast_path": {"labelled": self.audio_hits, "threshold": AUDIO_FAST_PATH_THRESHOLD},
+            "label_index": {"labelled": self.index_hits},
         }
-        for emotion in grouped_tracks.keys()
-    }
 
-    _log(
-        f"Sınıflandırma tamamlandı. playlist_id={playlist_id}, total_songs={len(songs)}, failed_batches={len(failed_batches)}"
-    )
-    _log("AI ham cevapları kaydedildi: datas/ai_raw_responses.json")
-    _push_client_event(
-        "classification_completed",
-        "Sınıflandırma tamamlandı",
-        playlist_id=playlist_id,
-        total_songs=len(songs),
-        total_batches=total_batches,
-        failed_batches=len(failed_batches),
-    )
 
-    return {
-        "playlist_id": playlist_id,
-        "total_songs": len(songs),
-        "total_batches": total_batches,
-        "emotion_stats": emotion_stats,
-        "grouped_tracks": grouped_tracks,
-        "failed_batches": failed_batches,
-        "batch_logs": batch_summaries,
-        "client_events": client_events,
-    }
+def _prepare_classification(playlist_url: str, emotions: list[str]) -> tuple[str, list[str]]:
+    normalized_emotions = _normalize_emotions(emotions)
+    if not normalized_emotions:
+        raise ValueError("En az bir duygu seçmelisiniz")
+
+    if not OPENROUTER_API_KEY:
+        raise ValueError("OPENROUTER_API_KEY bulunamadı. .env dosyasına ekleyin.")
 
+    playlist_id = extract_playlist_id(playlist_url)
+    _log(f"Sınıflandırma başlatıldı. provider=openrouter, playlist_id={playlist_id}, emotions={normalized_emotions}")
+    return playlist_id, normalized_emotions
 
-def _spotify_request(method: str, url: str, token: str, **kwargs) -> dict:
-    headers = kwargs.pop("headers", {})
-    headers["Authorization"] = f"Bearer {token}"
-    if "json" in kwargs:
-        headers.setdefault("Content-Type", "application/json")
 
-    response = requests.request(method, url, headers=headers, timeout=30, **kwargs)
-    if response.status_code >= 400:
+def process_playlist(
+    playlist_url: str,
+    emotions: list[str],
+    progress_callback: Callable[[int, int, list[dict]], None] | None = None,
+    event_listener: Callable[[dict], None] | None = None,
+    cancel_event: threading.Event | None = None,
+) -> dict:
+    playlist_id, normalized_emotions = _prepare_classification(playlist_url, emotions)
+    songs = fetch_playlist_tracks(playlist_id)
+
+    run = _ClassificationRun(playlist_id, songs, normalized_emotions, progress_callback, event_listener, cancel_event)
+    run.dispatch()
+    return run.finish()
+
+
+async def process_playlist_async(
+    playlist_url: str,
+    emotions: list[str],
+    progress_callback: Callable[[int, int, list[dict]], None] | None = None,
+    event_listener: Callable[[dict], None] | None = None,
+) -> dict:
+    playlist_id, normalized_emotions = await asyncio.to_thread(_prepare_classification, playlist_url, emotions)
+    songs = await fetch_playlist_tracks_async(playlist_id)
+
+    # Cache sorgusu ve dosya yazımları event loop'u bloklamasın.
+    run = await asyncio.to_thread(
+        _ClassificationRun, playlist_id, songs, normalized_emotions, progress_callback, event_listener
+    )
+    await run.dispatch_async()
+    return await asyncio.to_thread(run.finish)
+
+
+def _spotify_response_data(status_code: int, text: str) -> dict:
+    if status_code >= 400:
         try:
-            detail = response.json()
+            detail = json.loads(text)
         except Exception:
-            detail = response.text
-        raise RuntimeError(f"Spotify API hatası ({response.status_code}): {detail}")
+            detail = text
+        raise RuntimeError(f"Spotify API hatası ({status_code}): {detail}")
 
-    if not response.text:
+    if not text:
         return {}
 
     try:
-        return response.json()
+        return json.loads(text)
     except Exception:
         return {}
 
 
-def save_grouped_tracks_to_spotify(
-    access_token: str,
-    grouped_tracks: dict[str, list[dict]],
-    playlist_names: dict[str, str] | None = None,
-    public: bool = False,
-) -> dict:
-    playlist_names = playlist_names or {}
-    _log("Spotify'a playlist kaydetme süreci başladı")
+async def _spotify_request_async(method: str, url: str, token: str, **kwargs) -> dict:
+    headers = kwargs.pop("headers", {})
+    headers["Authorization"] = f"Bearer {token}"
+    if "json" in kwargs:
+        headers.setdefault("Content-Type", "application/json")
+
+    # spotipy'nin sync yolda yaptığı 429 tekrarını burada kendimiz yapıyoruz.
+    for attempt in range(1, SPOTIFY_MAX_RETRIES + 1):
+        response = await get_async_client().request(method, url, headers=headers, **kwargs)
+        if response.status_code != 429 or attempt == SPOTIFY_MAX_RETRIES:
+            break
+        try:
+            wait_sec = float(response.headers.get("Retry-After", "1"))
+        except ValueError:
+            wait_sec = 1.0
+        _log(f"Spotify 429 döndü, {wait_sec}s sonra tekrar denenecek", level="warning")
+        await asyncio.sleep(wait_sec)
+
+    return _spotify_response_data(response.status_code, response.text)
+
+
+def _playlist_name(emotion: str, playlist_names: dict[str, str]) -> str:
+    playlist_name = (playlist_names.get(emotion) or f"{emotion.capitalize()} Şarkılar").strip()
+    return playlist_name or f"{emotion.capitalize()} Şarkılar"
+
+
+def _playlist_create_payload(emotion: str, playlist_name: str, public: bool, tag: str = "") -> dict:
+    description = f"Playlist Classifier tarafından '{emotion}' kategorisinde oluşturuldu."
+    return {
+        "name": playlist_name,
+        "description": f"{description} {tag}" if tag else description,
+        "public": public,
+    }
+
+
+# Kaynak playlist ve kategori açıklamaya işaretlenir; tekrar kaydetmede aynı playlist bu işaretle bulunur.
+# Kategori adı, Spotify'ın açıklamadaki özel karakterleri kaçışlamasından etkilenmemesi için özetlenir.
+def _playlist_tag(source_playlist_id: str, emotion: str) -> str:
+    return f"[spc:{source_playlist_id}:{hashlib.sha1(emotion.encode('utf-8')).hexdigest()[:8]}]"
+
+
+def _match_tagged(page: dict, user_id: str, tags: dict[str, str], found: dict[str, dict]) -> None:
+    for item in page.get("items") or []:
+        if not item or (item.get("owner") or {}).get("id") != user_id:
+            continue
+        description = item.get("description") or ""
+        for emotion, tag in tags.items():
+            if emotion not in found and tag in description:
+                found[emotion] = item
 
-    me = _spotify_request("GET", "https://api.spotify.com/v1/me", access_token)
+
+def _track_uris(page: dict) -> list[str]:
+    return [
+        item["track"]["uri"]
+        for item in page.get("items") or []
+        if item and item.get("track") and item["track"].get("uri")
+    ]
+
+
+# Mevcut sıra korunur: istenmeyenler çıkarılır, eksikler sona eklenir.
+def _playlist_diff(current: list[str], desired: list[str]) -> tuple[list[str], list[str]]:
+    current_set = set(current)
+    desired_set = set(desired)
+    to_add = [uri for uri in dict.fromkeys(desired) if uri not in current_set]
+    to_remove = [uri for uri in dict.fromkeys(current) if uri not in desired_set]
+    return to_add, to_remove
+
+
+def _details_update(existing: dict, playlist_name: str, public: bool) -> dict:
+    changes: dict = {}
+    if existing.get("name") != playlist_name:
+        changes["name"] = playlist_name
+    if existing.get("public") is not None and existing.get("public") != public:
+        changes["public"] = public
+    return changes
+
+
+# /me cevabı token başına saklanır; aynı kullanıcının art arda kaydetmeleri tekrar sormaz.
+# Token'ın kendisi değil özeti anahtar olarak tutulur.
+_me_cache: "OrderedDict[str, tuple[str, float]]" = OrderedDict()
+_me_lock = threading.Lock()
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _cached_user_id(token: str) -> str | None:
+    key = _token_key(token)
+    with _me_lock:
+        entry = _me_cache.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.monotonic():
+            _me_cache.pop(key, None)
+            return None
+        _me_cache.move_to_end(key)
+        return entry[0]
+
+
+def _store_user_id(token: str, user_id: str) -> None:
+    with _me_lock:
+        _me_cache[_token_key(token)] = (user_id, time.monotonic() + SPOTIFY_ME_CACHE_TTL_SEC)
+        _me_cache.move_to_end(_token_key(token))
+        while len(_me_cache) > SPOTIFY_ME_CACHE_MAX:
+            _me_cache.popitem(last=False)
+
+
+def _user_id_from_me(token: str, me: dict) -> str:
     user_id = me.get("id")
     if not user_id:
         raise RuntimeError("Spotify kullanıcı bilgisi alınamadı")
+    _store_user_id(token, user_id)
+    return user_id
 
-    created_playlists: list[dict] = []
-    skipped: list[dict] = []
 
-    for emotion, tracks in grouped_tracks.items():
-        valid_tracks = [track for track in tracks if track.get("id")]
-        _log(f"Kategori işleniyor: {emotion}, track_count={len(valid_tracks)}")
+def _save_headers(token: str, kwargs: dict) -> dict:
+    headers = {"Authorization": f"Bearer {token}"}
+    if "json" in kwargs:
+        headers["Content-Type"] = "application/json"
+    return headers
+
+
+# 429 gelirse paylaşılan limiter Retry-After kadar durdurulur: eşzamanlı tüm kaydetme istekleri birlikte
+# bekler, bu istek tekrar denenir. True dönerse tekrar denenmelidir.
+def _save_rate_limited(status_code: int, headers, attempt: int) -> bool:
+    if status_code != 429:
+        # 5xx limiter'ın geri çekilmesini sıfırlamaz; sadece başarılı cevaplar hızı geri artırır.
+        if 200 <= status_code < 300:
+            spotify_save_limiter.on_success()
+        return False
+    if attempt >= SPOTIFY_MAX_RETRIES:
+        return False
+    spotify_save_limiter.on_rate_limited(retry_after_from_headers(headers))
+    return True
+
+
+async def _spotify_save_request_async(
+    kind: str, method: str, url: str, token: str, semaphore: asyncio.Semaphore, **kwargs
+) -> dict:
+    headers = _save_headers(token, kwargs)
+    for attempt in range(1, SPOTIFY_MAX_RETRIES + 1):
+        await spotify_save_limiter.acquire_async()
+        SPOTIFY_SAVE_REQUESTS.inc(kind=kind)
+        async with semaphore:
+            response = await get_async_client().request(method, url, headers=headers, **kwargs)
+        if not _save_rate_limited(response.status_code, response.headers, attempt):
+            break
+    return _spotify_response_data(response.status_code, response.text)
 
-        if not valid_tracks:
-            skipped.append({"emotion": emotion, "reason": "Bu kategori için şarkı bulunamadı"})
-            continue
 
-        playlist_name = (playlist_names.get(emotion) or f"{emotion.capitalize()} Şarkılar").strip()
-        if not playlist_name:
-            playlist_name = f"{emotion.capitalize()} Şarkılar"
-
-        created = _spotify_request(
-            "POST",
-            f"https://api.spotify.com/v1/users/{user_id}/playlists",
-            access_token,
-            json={
-                "name": playlist_name,
-                "description": f"Playlist Classifier tarafından '{emotion}' kategorisinde oluşturuldu.",
-                "public": public,
-            },
+def _playlist_save_result(emotion: str, playlist_name: str, uris: list[str]) -> dict:
+    return {
+        "emotion": emotion,
+        "playlist_id": None,
+        "playlist_name": playlist_name,
+        "playlist_url": "",
+        "action": "created",
+        "added_tracks": 0,
+        "removed_tracks": 0,
+        "failed_tracks": len(uris),
+        "error": "",
+    }
+
+
+def _apply_created(result: dict, created: dict) -> bool:
+    result["playlist_id"] = created.get("id")
+    result["playlist_url"] = (created.get("external_urls") or {}).get("spotify", "")
+    if not result["playlist_id"]:
+        result["error"] = "Playlist oluşturulamadı"
+    return bool(result["playlist_id"])
+
+
+def _apply_existing(result: dict, existing: dict) -> None:
+    result["playlist_id"] = existing.get("id")
+    result["playlist_url"] = (existing.get("external_urls") or {}).get("spotify", "")
+    result["action"] = "unchanged"
+
+
+def _log_playlist_result(result: dict, change_count: int) -> None:
+    applied = result["added_tracks"] + result["removed_tracks"]
+    if result["error"]:
+        _log(
+            f"Playlist kaydı eksik kaldı: {result['playlist_name']} "
+            f"({applied}/{change_count} değişiklik): {result['error']}",
+            level="warning",
+        )
+    elif result["action"] == "created":
+        _log(f"Playlist oluşturuldu: {result['playlist_name']} ({result['added_tracks']} şarkı)")
+    else:
+        _log(
+            f"Playlist güncellendi: {result['playlist_name']} action={result['action']}, "
+            f"added={result['added_tracks']}, removed={result['removed_tracks']}"
         )
 
-        playlist_id = created.get("id")
-        playlist_url = (created.get("external_urls") or {}).get("spotify", "")
-        if not playlist_id:
-            skipped.append({"emotion": emotion, "reason": "Playlist oluşturulamadı"})
-            continue
 
-        uris = [f"spotify:track:{track['id']}" for track in valid_tracks if track.get("id")]
+async def _find_tagged_playlists_async(
+    token: str, user_id: str, tags: dict[str, str], semaphore: asyncio.Semaphore
+) -> dict[str, dict]:
+    found: dict[str, dict] = {}
+    url = f"{SPOTIFY_API_BASE}/me/playlists?limit=50"
+    while url and len(found) < len(tags):
+        page = await _spotify_save_request_async("list_playlists", "GET", url, token, semaphore)
+        _match_tagged(page, user_id, tags, found)
+        url = page.get("next")
+    return found
+
+
+# İlk sayfadan toplam öğrenilir, kalan sayfalar eşzamanlı çekilir (sıra offset'e göre korunur).
+async def _playlist_track_uris_async(token: str, playlist_id: str, semaphore: asyncio.Semaphore) -> list[str]:
+    base_url = f"{SPOTIFY_API_BASE}/playlists/{playlist_id}/tracks?fields=items(track(uri)),total&limit=100"
+    first = await _spotify_save_request_async("read_tracks", "GET", f"{base_url}&offset=0", token, semaphore)
+    pages = await asyncio.gather(
+        *[
+            _spotify_save_request_async("read_tracks", "GET", f"{base_url}&offset={offset}", token, semaphore)
+            for offset in range(100, int(first.get("total") or 0), 100)
+        ]
+    )
+    return [uri for page in (first, *pages) for uri in _track_uris(page)]
+
+
+# Mevcut içerik (current) ile istenen şarkılardan güncelleme planı: eklenecek/çıkarılacak uri'ler, ad/görünürlük
+# değişikliği ve işlemler bittiğinde playlist'in beklenen içeriği.
+def _update_plan(existing: dict, current: list[str], uris: list[str], playlist_name: str, public: bool) -> dict:
+    to_add, to_remove = _playlist_diff(current, uris)
+    removed = set(to_remove)
+    return {
+        "to_add": to_add,
+        "to_remove": to_remove,
+        "details": _details_update(existing, playlist_name, public),
+        "final_uris": [uri for uri in current if uri not in removed] + to_add,
+    }
+
+
+# Kaydedilen playlist'in içeriği son yazımın snapshot_id'si ile saklanır; tekrar kaydetmede snapshot
+# değişmemişse (playlist'e dışarıdan dokunulmamışsa) içerik Spotify'dan okunmaz.
+def _remember_uris(result: dict, snapshot_id: str | None, uris: list[str]) -> None:
+    if result["playlist_id"] and not result["error"]:
+        store_saved_uris(result["playlist_id"], snapshot_id, uris)
+
+
+# Bir kategori: playlist oluşturulur, şarkılar 100'lük parçalar halinde sırayla eklenir. Spotify parçaları
+# geliş sırasına göre sona eklediğinden aynı playlist'e eşzamanlı ekleme sırayı bozar; paralellik
+# kategoriler arasındadır. Hata kategoriyi durdurur ama diğerlerini etkilemez.
+# existing verilirse (önceki kayıt) playlist yeniden oluşturulmaz: sadece ekleme/çıkarma farkı uygulanır.
+# Ad/görünürlük güncellemesi snapshot'ı değiştirdiği için şarkı işlemlerinden önce yapılır.
+async def _save_emotion_playlist_async(
+    access_token: str,
+    user_id: str,
+    emotion: str,
+    tracks: list[dict],
+    playlist_name: str,
+    public: bool,
+    semaphore: asyncio.Semaphore,
+    tag: str = "",
+    existing: dict | None = None,
+) -> dict:
+    uris = [f"spotify:track:{track['id']}" for track in tracks]
+    result = _playlist_save_result(emotion, playlist_name, uris)
+    change_count = len(uris)
+    final_uris = uris
+    snapshot_id = None
+    try:
+        if existing is None:
+            created = await _spotify_save_request_async(
+                "create_playlist",
+                "POST",
+                f"{SPOTIFY_API_BASE}/users/{user_id}/playlists",
+                access_token,
+                semaphore,
+                json=_playlist_create_payload(emotion, playlist_name, public, tag),
+            )
+            if not _apply_created(result, created):
+                uris = []
+        else:
+            _apply_existing(result, existing)
+            playlist_url = f"{SPOTIFY_API_BASE}/playlists/{result['playlist_id']}"
+            current = get_saved_uris(result["playlist_id"], existing.get("snapshot_id"))
+            if current is None:
+                current = await _playlist_track_uris_async(access_token, result["playlist_id"], semaphore)
+            plan = _update_plan(existing, current, uris, playlist_name, public)
+            uris = plan["to_add"]
+            change_count = len(plan["to_add"]) + len(plan["to_remove"])
+            final_uris = plan["final_uris"]
+            snapshot_id = existing.get("snapshot_id")
+
+            if plan["details"]:
+                await _spotify_save_request_async(
+                    "update_details", "PUT", playlist_url, access_token, semaphore, json=plan["details"]
+                )
+                result["action"] = "updated"
+                snapshot_id = None
+            for chunk in _chunked(plan["to_remove"], 100):
+                removed = await _spotify_save_request_async(
+                    "remove_tracks",
+                    "DELETE",
+                    f"{playlist_url}/tracks",
+                    access_token,
+                    semaphore,
+                    json={"tracks": [{"uri": uri} for uri in chunk]},
+                )
+                snapshot_id = removed.get("snapshot_id")
+                result["removed_tracks"] += len(chunk)
+                result["action"] = "updated"
+
         for chunk in _chunked(uris, 100):
-            _spotify_request(
+            added = await _spotify_save_request_async(
+                "add_tracks",
                 "POST",
-                f"https://api.spotify.com/v1/playlists/{playlist_id}/tracks",
+                f"{SPOTIFY_API_BASE}/playlists/{result['playlist_id']}/tracks",
                 access_token,
+                semaphore,
                 json={"uris": chunk},
             )
+            snapshot_id = added.get("snapshot_id")
+            result["added_tracks"] += len(chunk)
+            if existing is not None:
+                result["action"] = "updated"
+    except Exception as exc:
+        result["error"] = str(exc) or exc.__class__.__name__
+    result["failed_tracks"] = max(0, change_count - result["added_tracks"] - result["removed_tracks"])
+    _remember_uris(result, snapshot_id, final_uris)
+    _log_playlist_result(result, change_count)
+    return result
+
+
+def _save_plan(
+    grouped_tracks: dict[str, list[dict]], playlist_names: dict[str, str]
+) -> tuple[list[tuple[str, list[dict], str]], list[dict]]:
+    planned: list[tuple[str, list[dict], str]] = []
+    skipped: list[dict] = []
+    for emotion, tracks in grouped_tracks.items():
+        valid_tracks = [track for track in tracks if track.get("id")]
+        _log(f"Kategori işleniyor: {emotion}, track_count={len(valid_tracks)}")
+        if not valid_tracks:
+            skipped.append({"emotion": emotion, "reason": "Bu kategori için şarkı bulunamadı"})
+            continue
+        planned.append((emotion, valid_tracks, _playlist_name(emotion, playlist_names)))
+    return planned, skipped
 
-        created_playlists.append(
-            {
-                "emotion": emotion,
-                "playlist_id": playlist_id,
-                "playlist_name": playlist_name,
-                "playlist_url": playlist_url,
-                "added_tracks": len(uris),
-            }
-        )
-        _log(f"Playlist oluşturuldu: {playlist_name} ({len(uris)} şarkı)")
 
-    _log(f"Spotify kayıt süreci bitti. created={len(created_playlists)}, skipped={len(skipped)}")
+def _save_tags(
+    planned: list[tuple[str, list[dict], str]], source_playlist_id: str | None, update_existing: bool
+) -> tuple[str, dict[str, str]]:
+    if not source_playlist_id:
+        if update_existing:
+            raise RuntimeError("Mevcut playlist'leri güncellemek için source_playlist_id gerekli")
+        return "", {}
+    source_id = extract_playlist_id(source_playlist_id)
+    return source_id, {emotion: _playlist_tag(source_id, emotion) for emotion, _, _ in planned}
+
+
+# Oluşturulan ya da güncellenen her playlist created_playlists'te yer alır; oluşturulamayan ya da
+# değişiklikleri yarım kalanlar failed'da nedeniyle raporlanır. Hiçbiri oluşturulamadıysa ilk hata
+# fırlatılır (örn. 401 token hatası).
+def _save_summary(results: list[dict], skipped: list[dict]) -> dict:
+    created_playlists: list[dict] = []
+    failed: list[dict] = []
+    for result in results:
+        if result["playlist_id"]:
+            entry = {key: value for key, value in result.items() if key not in {"failed_tracks", "error"}}
+            if result["error"]:
+                entry.update(failed_tracks=result["failed_tracks"], error=result["error"])
+            created_playlists.append(entry)
+        if result["error"]:
+            failed.append(
+                {
+                    "emotion": result["emotion"],
+                    "playlist_id": result["playlist_id"],
+                    "added_tracks": result["added_tracks"],
+                    "removed_tracks": result["removed_tracks"],
+                    "failed_tracks": result["failed_tracks"],
+                    "reason": result["error"],
+                }
+            )
+
+    if failed and not created_playlists:
+        raise RuntimeError(failed[0]["reason"])
+
+    _log(
+        f"Spotify kayıt süreci bitti. created={len(created_playlists)}, skipped={len(skipped)}, failed={len(failed)}"
+    )
     return {
         "created_playlists": created_playlists,
         "skipped": skipped,
+        "failed": failed,
     }
+
+
+# Sync çağıranlar (script, job thread'i) için: async kayıt kendi event loop'unda çalıştırılır, böylece tüm
+# istekler aynı limiter/429 yolundan geçer. Loop'a ait HTTP client'ı loop kapanmadan kapatılır.
+# Çalışan bir event loop içinden çağrılamaz; orada save_grouped_tracks_to_spotify_async kullanılmalıdır.
+def save_grouped_tracks_to_spotify(
+    access_token: str,
+    grouped_tracks: dict[str, list[dict]],
+    playlist_names: dict[str, str] | None = None,
+    public: bool = False,
+    source_playlist_id: str | None = None,
+    update_existing: bool = False,
+) -> dict:
+    async def _save() -> dict:
+        try:
+            return await save_grouped_tracks_to_spotify_async(
+                access_token, grouped_tracks, playlist_names, public, source_playlist_id, update_existing
+            )
+        finally:
+            await close_async_client()
+
+    return asyncio.run(_save())
+
+
+# source_playlist_id verilirse playlist'ler bu kaynağa işaretlenir. update_existing ile aynı kaynak ve
+# kategori için daha önce oluşturulmuş playlist'ler bulunur ve sadece ekleme/çıkarma farkı uygulanır;
+# bulunamayan kategoriler için yeni playlist oluşturulur.
+async def save_grouped_tracks_to_spotify_async(
+    access_token: str,
+    grouped_tracks: dict[str, list[dict]],
+    playlist_names: dict[str, str] | None = None,
+    public: bool = False,
+    source_playlist_id: str | None = None,
+    update_existing: bool = False,
+) -> dict:
+    playlist_names = playlist_names or {}
+    _log("Spotify'a playlist kaydetme süreci başladı (async)")
+
+    planned, skipped = _save_plan(grouped_tracks, playlist_names)
+    source_id, tags = _save_tags(planned, source_playlist_id, update_existing)
+    # Aynı anda en fazla SPOTIFY_SAVE_CONCURRENCY istek uçuşta olur; kategoriler istek aralarında sıra bekler.
+    semaphore = asyncio.Semaphore(SPOTIFY_SAVE_CONCURRENCY)
+    user_id = _cached_user_id(access_token) or _user_id_from_me(
+        access_token,
+        await _spotify_save_request_async("me", "GET", f"{SPOTIFY_API_BASE}/me", access_token, semaphore),
+    )
+    if not planned:
+        return _save_summary([], skipped)
+
+    existing = await _find_tagged_playlists_async(access_token, user_id, tags, semaphore) if update_existing else {}
+    if update_existing:
+        _log(f"Önceki kayıtlar arandı. source={source_id}, found={len(existing)}/{len(tags)}")
+
+    results = await asyncio.gather(
+        *[
+            _save_emotion_playlist_async(
+                access_token,
+                user_id,
+                emotion,
+                tracks,
+                playlist_name,
+                public,
+                semaphore,
+                tags.get(emotion, ""),
+                existing.get(emotion),
+            )
+            for emotion, tracks, playlist_name in planned
+        ]
+    )
+    return _save_summary(list(results), skipped)
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import threading
+import time
+
+import spotipy
+from dotenv import load_dotenv
+
+from http_pool import get_session, sync_timeout
+from structured_log import get_logger
+
+load_dotenv()
+
+CLIENT_ID = os.getenv("SPOTIFY_CLIENT_ID", "")
+CLIENT_SECRET = os.getenv("SPOTIFY_CLIENT_SECRET", "")
+# Benchmark/mock sunucuları için ezilebilir.
+SPOTIFY_API_BASE = os.getenv("SPOTIFY_API_BASE", "https://api.spotify.com/v1").rstrip("/")
+SPOTIFY_ACCOUNTS_BASE = os.getenv("SPOTIFY_ACCOUNTS_BASE", "https://accounts.spotify.com").rstrip("/")
+SPOTIFY_TOKEN_URL = f"{SPOTIFY_ACCOUNTS_BASE}/api/token"
+SPOTIFY_TOKEN_REFRESH_MARGIN_SEC = int(os.getenv("SPOTIFY_TOKEN_REFRESH_MARGIN_SEC", "300"))
+
+_lock = threading.Lock()
+_token = {"access_token": "", "expires_at": 0.0}
+_stats = {"refreshes": 0, "refresh_errors": 0, "background_refreshes": 0}
+_refresher: threading.Thread | None = None
+_client: spotipy.Spotify | None = None
+
+
+_log = get_logger("spotify_client.py")
+
+
+def _token_is_fresh(now: float) -> bool:
+    return bool(_token["access_token"]) and _token["expires_at"] - now > SPOTIFY_TOKEN_REFRESH_MARGIN_SEC
+
+
+def _refresh_token_locked() -> None:
+    try:
+        response = get_session().post(
+            SPOTIFY_TOKEN_URL,
+            data={"grant_type": "client_credentials"},
+            auth=(CLIENT_ID, CLIENT_SECRET),
+            timeout=sync_timeout(),
+        )
+    except Exception:
+        _stats["refresh_errors"] += 1
+        raise
+
+    if response.status_code != 200:
+        _stats["refresh_errors"] += 1
+        raise RuntimeError(f"Spotify token alınamadı ({response.status_code}): {response.text}")
+
+    data = response.json()
+    _token["access_token"] = data.get("access_token", "")
+    _token["expires_at"] = time.time() + int(data.get("expires_in", 3600))
+    _stats["refreshes"] += 1
+    _log(f"Spotify uygulama token'ı yenilendi. expires_in={data.get('expires_in')}")
+
+
+def get_app_token(force_refresh: bool = False) -> str:
+    if not force_refresh and _token_is_fresh(time.time()):
+        return _token["access_token"]
+
+    with _lock:
+        # Lock beklerken başka bir thread yenilemiş olabilir.
+        if force_refresh or not _token_is_fresh(time.time()):
+            _refresh_token_locked()
+        _ensure_refresher_locked()
+        return _token["access_token"]
+
+
+async def get_app_token_async(force_refresh: bool = False) -> str:
+    if not force_refresh and _token_is_fresh(time.time()):
+        return _token["access_token"]
+    return await asyncio.to_thread(get_app_token, force_refresh)
+
+
+def _refresh_loop() -> None:
+    while True:
+        wait_sec = _token["expires_at"] - SPOTIFY_TOKEN_REFRESH_MARGIN_SEC - time.time()
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+            continue
+
+        try:
+            with _lock:
+                if not _token_is_fresh(time.time()):
+                    _refresh_token_locked()
+                    _stats["background_refreshes"] += 1
+        except Exception as exc:
+            _log(f"Arka plan token yenileme hatası, 30s sonra tekrar denenecek: {exc}", level="warning")
+            time.sleep(30)
+
+
+def _ensure_refresher_locked() -> None:
+    global _refresher
+    if _refresher is None or not _refresher.is_alive():
+        _refresher = threading.Thread(target=_refresh_loop, name="spotify-token-refresher", daemon=True)
+        _refresher.start()
+
+
+# spotipy'nin auth_manager arayüzü: token dosyaya (.cache) yazılmaz, süreç içi token paylaşılır.
+class _SharedAppToken:
+    def get_access_token(self, as_dict: bool = False) -> str:
+        return get_app_token()
+
+
+def get_spotify_client() -> spotipy.Spotify:
+    global _client
+    if not CLIENT_ID or not CLIENT_SECRET:
+        raise ValueError("SPOTIFY_CLIENT_ID / SPOTIFY_CLIENT_SECRET .env içinde tanımlı olmalı")
+
+    with _lock:
+        if _client is None:
+            _client = spotipy.Spotify(
+                auth_manager=_SharedAppToken(),
+                requests_session=get_session(),
+                requests_timeout=sync_timeout(),
+            )
+            _client.prefix = f"{SPOTIFY_API_BASE}/"
+        return _client
+
+
+def token_stats() -> dict:
+    return {
+        **_stats,
+        "expires_in_sec": max(0, int(_token["expires_at"] - time.time())) if _token["access_token"] else 0,
+        "background_refresher": _refresher is not None and _refresher.is_alive(),
+    }
@@ -0,0 +1,176 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").strip().upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").strip().lower()
+LOG_QUEUE_MAX = int(os.getenv("LOG_QUEUE_MAX", "10000"))
+# Şarkı başına üretilen mesajlar (ör. "Etiket düzeltildi") istek başına ilk N kez, sonra her M'de bir yazılır.
+LOG_SAMPLE_FIRST = int(os.getenv("LOG_SAMPLE_FIRST", "5"))
+LOG_SAMPLE_EVERY = int(os.getenv("LOG_SAMPLE_EVERY", "100"))
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+_LEVELS = {"debug": logging.DEBUG, "info": logging.INFO, "warning": logging.WARNING, "error": logging.ERROR}
+_REQUEST_ID_RE = re.compile(r"[^A-Za-z0-9_-]+")
+
+_request_id: contextvars.ContextVar[str | None] = contextvars.ContextVar("request_id", default=None)
+_batch: contextvars.ContextVar[int | None] = contextvars.ContextVar("batch", default=None)
+_sample_counts: contextvars.ContextVar[dict | None] = contextvars.ContextVar("sample_counts", default=None)
+
+_global_sample_counts: dict[str, int] = {}
+_sample_lock = threading.Lock()
+_stats = {"dropped": 0, "sampled_out": 0}
+
+
+class _JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname.lower(),
+            "source": getattr(record, "source", record.name),
+            "msg": record.getMessage(),
+            **getattr(record, "context", {}),
+        }
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+# Eski print formatı; LOG_FORMAT=text ile lokal geliştirmede okunabilir çıktı için.
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        now = datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
+        level = "" if record.levelno == logging.INFO else f"{record.levelname} "
+        context = " ".join(f"{key}={value}" for key, value in getattr(record, "context", {}).items())
+        line = f"[{now}] [{getattr(record, 'source', record.name)}] {level}{record.getMessage()}"
+        return f"{line} | {context}" if context else line
+
+
+# Kuyruk doluysa kayıt düşürülür; istek thread'i log yazımını hiç beklemez.
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=max(0, LOG_QUEUE_MAX))
+_root = logging.getLogger("spc")
+_root.setLevel(_LEVELS.get(LOG_LEVEL.lower(), logging.INFO))
+_root.propagate = False
+_root.addHandler(_DroppingQueueHandler(_queue))
+
+_output = logging.StreamHandler(sys.stdout)
+_output.setFormatter(_TextFormatter() if LOG_FORMAT == "text" else _JsonFormatter())
+_listener = logging.handlers.QueueListener(_queue, _output)
+_listener.start()
+atexit.register(_listener.stop)
+
+
+def _context(fields: dict) -> dict:
+    context = {"request_id": _request_id.get(), "batch": _batch.get()}
+    context.update(fields)
+    return {key: value for key, value in context.items() if value is not None}
+
+
+# Her modül kendi _log fonksiyonunu buradan alır: _log("mesaj", level="warning", batch=3, model=...).
+def get_logger(source: str) -> Callable[..., None]:
+    logger = _root.getChild(source.removesuffix(".py"))
+
+    def _log(message: str, level: str = "info", **fields) -> None:
+        levelno = _LEVELS.get(level, logging.INFO)
+        if logger.isEnabledFor(levelno):
+            logger.log(levelno, message, extra={"source": source, "context": _context(fields)})
+
+    return _log
+
+
+# Yüksek hacimli mesajlar için: yazılacaksa kaçıncı tekrar olduğunu, atlanacaksa 0 döner.
+def sample(key: str) -> int:
+    counts = _sample_counts.get()
+    with _sample_lock:
+        counts = _global_sample_counts if counts is None else counts
+        count = counts[key] = counts.get(key, 0) + 1
+    if count <= LOG_SAMPLE_FIRST or (LOG_SAMPLE_EVERY > 0 and count % LOG_SAMPLE_EVERY == 0):
+        return count
+    _stats["sampled_out"] += 1
+    return 0
+
+
+def new_request_id(incoming: str | None = None) -> str:
+    return _REQUEST_ID_RE.sub("", incoming or "")[:64] or uuid.uuid4().hex[:16]
+
+
+def current_request_id() -> str | None:
+    return _request_id.get()
+
+
+@contextmanager
+def request_context(request_id: str):
+    tokens = (_request_id.set(request_id), _sample_counts.set({}))
+    try:
+        yield request_id
+    finally:
+        _sample_counts.reset(tokens[1])
+        _request_id.reset(tokens[0])
+
+
+@contextmanager
+def batch_context(batch_no: int):
+    token = _batch.set(batch_no)
+    try:
+        yield
+    finally:
+        _batch.reset(token)
+
+
+# Saf ASGI middleware: istek id'sini (X-Request-ID ya da yeni) bağlama koyar ve cevaba ekler.
+# Stream cevaplarını tamponlamaz.
+class RequestContextMiddleware:
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        incoming = dict(scope.get("headers") or ()).get(REQUEST_ID_HEADER.lower().encode("latin-1"))
+        request_id = new_request_id(incoming.decode("latin-1") if incoming else None)
+
+        async def _send(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers") or ())
+                headers.append((REQUEST_ID_HEADER.lower().encode("latin-1"), request_id.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with request_context(request_id):
+            await self.app(scope, receive, _send)
+
+
+def log_stats() -> dict:
+    return {
+        **_stats,
+        "level": logging.getLevelName(_root.level).lower(),
+        "format": "text" if LOG_FORMAT == "text" else "json",
+        "queued": _queue.qsize(),
+    }